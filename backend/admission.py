@@ -0,0 +1,202 @@
+import os
+import math
+import time
+import threading
+from contextlib import contextmanager
+from logger import backend_logger
+from metrics import ADMISSION_QUEUE_WAIT_SECONDS, ADMISSION_REJECTED_TOTAL, ADMISSION_IN_FLIGHT, ADMISSION_QUEUED
+from deadlines import stage_timeout, deadline_exceeded
+
+ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', 'true').lower() == 'true'
+# Concurrent requests per endpoint as endpoint:limit; unlisted endpoints are not limited
+ENDPOINT_CONCURRENCY_LIMITS = os.getenv('ENDPOINT_CONCURRENCY_LIMITS', 'generate:16,generate_stream:16,generate_quant_trade_strategy:4')
+ENDPOINT_QUEUE_SIZE = int(os.getenv('ENDPOINT_QUEUE_SIZE', '32'))
+ENDPOINT_QUEUE_TIMEOUT = float(os.getenv('ENDPOINT_QUEUE_TIMEOUT', '10'))
+# Concurrent upstream GLM calls per model as model:limit, MODEL_CONCURRENCY_DEFAULT for the rest
+MODEL_CONCURRENCY_LIMITS = os.getenv('MODEL_CONCURRENCY_LIMITS', '')
+MODEL_CONCURRENCY_DEFAULT = int(os.getenv('MODEL_CONCURRENCY_DEFAULT', '8'))
+MODEL_QUEUE_SIZE = int(os.getenv('MODEL_QUEUE_SIZE', '32'))
+MODEL_QUEUE_TIMEOUT = float(os.getenv('MODEL_QUEUE_TIMEOUT', '20'))
+
+
+class OverloadedError(Exception):
+    """Raised when a limiter sheds a request
+
+    status_code is 429 when the wait queue is full and 503 when the request
+    waited queue_timeout seconds without getting a slot; retry_after is in
+    seconds.
+    """
+
+    def __init__(self, limiter, reason, retry_after, status_code):
+        super().__init__(f"{limiter} is overloaded ({reason}), retry after {retry_after}s")
+        self.limiter = limiter
+        self.reason = reason
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+
+def parse_limits(value):
+    """Parse name:limit entries, comma separated"""
+    limits = {}
+    for entry in value.split(','):
+        name, _, limit = entry.strip().partition(':')
+        if name and limit:
+            limits[name] = int(limit)
+    return limits
+
+
+class ConcurrencyLimiter:
+    """Caps concurrent holders, with a bounded wait queue
+
+    A request beyond the limit waits up to queue_timeout seconds for a slot.
+    When queue_size requests are already waiting it is rejected at once, so
+    bursts are shed in milliseconds instead of piling up until clients time
+    out. Retry-After is estimated from the average time a slot is held.
+    """
+
+    def __init__(self, name, limit, queue_size, queue_timeout):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self._condition = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+        self.avg_hold_time = 1.0
+        self.stats = {'admitted': 0, 'queued': 0, 'rejected_queue_full': 0, 'rejected_timeout': 0}
+
+    def _retry_after(self):
+        # Caller holds the condition
+        backlog = self.waiting + 1
+        return max(1, min(60, int(math.ceil(self.avg_hold_time * backlog / max(self.limit, 1)))))
+
+    def _reject(self, reason, status_code):
+        self.stats[f"rejected_{reason}"] += 1
+        retry_after = self._retry_after()
+        ADMISSION_REJECTED_TOTAL.inc(limiter=self.name, reason=reason)
+        backend_logger.warning(f"Admission rejected - limiter: {self.name}, reason: {reason}, active: {self.active}, waiting: {self.waiting}, retry_after: {retry_after}s")
+        return OverloadedError(self.name, reason.replace('_', ' '), retry_after, status_code)
+
+    def acquire(self, queue=True):
+        """Take a slot, waiting in the queue if needed; raises OverloadedError when shedding
+
+        With queue=False OverloadedError is raised at once when no slot is
+        free, without counting as a rejection. The wait ends early, with
+        DeadlineExceededError, when the request deadline comes first.
+        """
+        start_time = time.perf_counter()
+        queue_timeout = stage_timeout(self.queue_timeout, f"admission.{self.name}")
+        with self._condition:
+            if self.active >= self.limit:
+                if not queue:
+                    raise OverloadedError(self.name, 'no free slot', self._retry_after(), 429)
+                if self.waiting >= self.queue_size:
+                    raise self._reject('queue_full', 429)
+                self.waiting += 1
+                self.stats['queued'] += 1
+                ADMISSION_QUEUED.set(self.waiting, limiter=self.name)
+                try:
+                    deadline = start_time + queue_timeout
+                    while self.active >= self.limit:
+                        remaining = deadline - time.perf_counter()
+                        if remaining <= 0:
+                            if queue_timeout < self.queue_timeout:
+                                raise deadline_exceeded(f"admission.{self.name}")
+                            raise self._reject('timeout', 503)
+                        self._condition.wait(remaining)
+                finally:
+                    self.waiting -= 1
+                    ADMISSION_QUEUED.set(self.waiting, limiter=self.name)
+            self.active += 1
+            self.stats['admitted'] += 1
+            ADMISSION_IN_FLIGHT.set(self.active, limiter=self.name)
+        ADMISSION_QUEUE_WAIT_SECONDS.observe(time.perf_counter() - start_time, limiter=self.name)
+        return time.perf_counter()
+
+    def release(self, acquired_at):
+        hold_time = time.perf_counter() - acquired_at
+        with self._condition:
+            self.active -= 1
+            self.avg_hold_time += (hold_time - self.avg_hold_time) * 0.1
+            ADMISSION_IN_FLIGHT.set(self.active, limiter=self.name)
+            self._condition.notify()
+
+    @contextmanager
+    def slot(self, queue=True):
+        acquired_at = self.acquire(queue)
+        try:
+            yield
+        finally:
+            self.release(acquired_at)
+
+    def get_stats(self):
+        with self._condition:
+            stats = dict(self.stats)
+            stats.update({
+                'limit': self.limit,
+                'active': self.active,
+                'waiting': self.waiting,
+                'queue_size': self.queue_size,
+                'queue_timeout': self.queue_timeout,
+                'avg_hold_seconds': self.avg_hold_time
+            })
+        return stats
+
+
+class AdmissionController:
+    """Per-endpoint and per-model limiters, created on first use"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoint_limits = parse_limits(ENDPOINT_CONCURRENCY_LIMITS)
+        self._model_limits = parse_limits(MODEL_CONCURRENCY_LIMITS)
+        self._limiters = {}
+        backend_logger.info(f"AdmissionController initialized - enabled: {ADMISSION_ENABLED}, endpoints: {self._endpoint_limits}, models: {self._model_limits or 'default'} (default {MODEL_CONCURRENCY_DEFAULT})")
+
+    def _limiter(self, name, limit, queue_size, queue_timeout):
+        with self._lock:
+            limiter = self._limiters.get(name)
+            if limiter is None:
+                limiter = self._limiters[name] = ConcurrencyLimiter(name, limit, queue_size, queue_timeout)
+            return limiter
+
+    def endpoint_limiter(self, endpoint):
+        """Limiter for an endpoint, or None if the endpoint is not limited"""
+        if not ADMISSION_ENABLED or endpoint not in self._endpoint_limits:
+            return None
+        return self._limiter(f"endpoint:{endpoint}", self._endpoint_limits[endpoint], ENDPOINT_QUEUE_SIZE, ENDPOINT_QUEUE_TIMEOUT)
+
+    def model_limiter(self, model):
+        if not ADMISSION_ENABLED:
+            return None
+        limit = self._model_limits.get(model, MODEL_CONCURRENCY_DEFAULT)
+        return self._limiter(f"model:{model}", limit, MODEL_QUEUE_SIZE, MODEL_QUEUE_TIMEOUT)
+
+    @contextmanager
+    def endpoint(self, endpoint):
+        limiter = self.endpoint_limiter(endpoint)
+        if limiter is None:
+            yield
+            return
+        with limiter.slot():
+            yield
+
+    @contextmanager
+    def model(self, model, queue=True):
+        limiter = self.model_limiter(model)
+        if limiter is None:
+            yield
+            return
+        with limiter.slot(queue):
+            yield
+
+    def get_stats(self):
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {
+            'enabled': ADMISSION_ENABLED,
+            'limiters': {name: limiter.get_stats() for name, limiter in sorted(limiters.items())}
+        }
+
+
+admission = AdmissionController()
@@ -1,6 +1,12 @@
 import os
 import time
-from zai import ZhipuAiClient
+import compression
+from http_transport import get_http_transport, get_llm_client
+from llm_gateway import LLMGateway
+from admission import OverloadedError
+from deadlines import DeadlineExceededError
+from metrics import GENERATION_FORMAT_TOTAL, ERRORS_TOTAL
+from tracing import start_span
 from logger import ai_service_logger
 from html_manager import HTMLManager
 from file_based_markdown_converter import FileBasedMarkdownConverter
@@ -9,6 +15,8 @@ from prompt_service import PromptService
 from model_service import ModelService
 from content_processor import ContentProcessor
 from quant_trade_service import QuantTradeService
+from response_cache import ResponseCache
+from strategy_job_manager import StrategyJobManager
 
 class AIService:
     def __init__(self):
@@ -24,7 +32,9 @@ class AIService:
             ai_service_logger.error("GLM_API_KEY environment variable is required")
             raise ValueError("GLM_API_KEY environment variable is required")
 
-        self.client = ZhipuAiClient(api_key=self.api_key, base_url=self.base_url)
+        self.http_transport = get_http_transport()
+        self.client = get_llm_client(self.api_key, self.base_url)
+        self.llm_gateway = LLMGateway(self.client)
         ai_service_logger.info("ZhipuAiClient initialized successfully")
 
         # Initialize service components
@@ -34,7 +44,9 @@ class AIService:
         self.html_manager = HTMLManager()
         self.markdown_converter = FileBasedMarkdownConverter()
         self.knowledge_base_service = KnowledgeBaseService(self.api_key, self.base_url)
-        self.quant_trade_service = QuantTradeService(self.client, self.knowledge_base_service)
+        self.quant_trade_service = QuantTradeService(self.llm_gateway, self.knowledge_base_service)
+        self.response_cache = ResponseCache()
+        self.strategy_job_manager = StrategyJobManager(self.quant_trade_service)
 
         ai_service_logger.info("All service components initialized successfully")
 
@@ -42,6 +54,10 @@ class AIService:
         """Get list of available prompt types"""
         return self.prompt_service.get_available_prompts()
 
+    def get_prompt_versions(self):
+        """Get version info (etag and modification time) for every prompt"""
+        return self.prompt_service.get_prompt_versions()
+
     def load_test_markdown_file(self):
         """Load test markdown file content"""
         test_file_path = os.path.join(os.path.dirname(__file__), '../test/test_content.md')
@@ -58,23 +74,54 @@ class AIService:
         ai_service_logger.debug(f"User input: {user_input[:100]}...")
 
         try:
-            # Get content from test file or AI generation
+            # Get content from test file
             if use_test_file:
                 content = self._get_test_content()
                 if content is None:
                     return self._create_error_response("抱歉，无法加载测试文件。")
-            else:
-                content = self._generate_ai_content(user_input, prompt_type, model_type)
-
-            # Process content based on format
-            return self._process_generated_content(content, prompt_type, start_time)
-
+                return self._process_generated_content(content, prompt_type, start_time)
+
+            # Resolve prompt and model up front so the response cache can be consulted;
+            # auto routing only runs on a miss, so a cache hit never reserves a probe
+            system_prompt = self._get_system_prompt(prompt_type)
+            selected_model = None
+            if not self.model_service.is_auto(model_type):
+                selected_model = self._select_model(user_input, system_prompt, model_type, prompt_type)
+
+            cache_key = self._get_cache_key(prompt_type, selected_model or 'auto', user_input)
+            if cache_key:
+                with start_span('cache.lookup') as span:
+                    cached_result = self.response_cache.get(cache_key, self._cached_files_exist)
+                    span.set_attribute('hit', cached_result is not None)
+                if cached_result is not None:
+                    processing_time = time.time() - start_time
+                    ai_service_logger.info(f"Response cache hit - prompt_type: {prompt_type}, model: {cached_result.get('model')}, processing_time: {processing_time:.2f}s")
+                    return cached_result
+
+            if selected_model is None:
+                selected_model = self._select_model(user_input, system_prompt, model_type, prompt_type)
+
+            # Generate content and process it based on format
+            content, served_model = self._generate_ai_content(user_input, system_prompt, selected_model, prompt_type)
+            result = self._process_generated_content(content, prompt_type, start_time)
+            self._set_served_model(result, selected_model, served_model)
+
+            # A fallback model's answer is not cached under the requested model
+            if cache_key and served_model == selected_model:
+                self.response_cache.put(cache_key, result)
+            return result
+
+        except (OverloadedError, DeadlineExceededError):
+            # Shed by admission control or out of time; the API layer answers 429/503/504
+            raise
         except Exception as e:
             processing_time = time.time() - start_time
             ai_service_logger.error(f"Error calling GLM API: {e} - processing_time: {processing_time:.2f}s")
+            ERRORS_TOTAL.inc(component='generate')
             return {
                 "format": "text",
-                "content": f"抱歉，生成内容时出现错误：{str(e)}"
+                "content": f"抱歉，生成内容时出现错误：{str(e)}",
+                "error": str(e)
             }
 
     def _get_test_content(self):
@@ -87,41 +134,159 @@ class AIService:
             ai_service_logger.error("Failed to load test markdown file")
             return None
 
-    def _generate_ai_content(self, user_input, prompt_type, model_type='auto'):
-        """Generate content using AI"""
-        # Get the appropriate prompt
-        if prompt_type and prompt_type in self.prompt_service.get_available_prompts():
-            system_prompt = self.prompt_service.get_prompt_content(prompt_type)
-            ai_service_logger.info(f"Using custom prompt: {prompt_type}")
-        else:
-            system_prompt = self.prompt_service.get_default_prompt()
-            ai_service_logger.info("Using default prompt")
+    def generate_content_stream(self, user_input, prompt_type=None, use_test_file=False, model_type='auto'):
+        """Generate content as a stream of events
+
+        Yields (event, data) tuples: 'start' once the model is selected,
+        'delta' for every content fragment received from the LLM, then a single
+        'done' carrying the same result dict generate_content returns, or
+        'error' if generation fails. Format detection, file saving and HTML
+        conversion run once the upstream stream has completed.
+        """
+        start_time = time.time()
+        ai_service_logger.info(f"Starting streaming content generation - prompt_type: {prompt_type}, model_type: {model_type}, input_length: {len(user_input)}")
+
+        cache_key = None
+        try:
+            if use_test_file:
+                content = self._get_test_content()
+                if content is None:
+                    yield 'error', self._create_error_response("抱歉，无法加载测试文件。")
+                    return
+                yield 'start', {'model': None, 'prompt_type': prompt_type}
+                yield 'delta', {'content': content}
+            else:
+                system_prompt = self._get_system_prompt(prompt_type)
+                selected_model = None
+                if not self.model_service.is_auto(model_type):
+                    selected_model = self._select_model(user_input, system_prompt, model_type, prompt_type)
+
+                cache_key = self._get_cache_key(prompt_type, selected_model or 'auto', user_input)
+                if cache_key:
+                    cached_result = self.response_cache.get(cache_key, self._cached_files_exist)
+                    if cached_result is not None:
+                        ai_service_logger.info(f"Response cache hit for streaming request - prompt_type: {prompt_type}, model: {cached_result.get('model')}")
+                        yield 'start', {'model': cached_result.get('model'), 'prompt_type': prompt_type}
+                        yield 'done', cached_result
+                        return
+
+                if selected_model is None:
+                    selected_model = self._select_model(user_input, system_prompt, model_type, prompt_type)
+                yield 'start', {'model': selected_model, 'prompt_type': prompt_type}
+
+                ai_service_logger.debug("Sending streaming request to GLM API")
+                parts = []
+                served = {'model': selected_model}
+                for delta in self.llm_gateway.chat_stream(
+                    selected_model,
+                    self._build_messages(system_prompt, user_input),
+                    prompt_type=prompt_type,
+                    on_model=lambda model: served.update(model=model),
+                    on_truncated=lambda: served.update(truncated=True),
+                    temperature=0.7,
+                    max_tokens=8192
+                ):
+                    parts.append(delta)
+                    yield 'delta', {'content': delta}
+
+                content = ''.join(parts)
+                ai_service_logger.info(f"Received streamed response from LLM - length: {len(content)}")
+
+            result = self._process_generated_content(content, prompt_type, start_time)
+            if not use_test_file:
+                self._set_served_model(result, selected_model, served['model'])
+            # A stream cut off by the learned output budget is not cached, the next request may get all of it
+            if cache_key and result.get('model') == selected_model and not served.get('truncated'):
+                self.response_cache.put(cache_key, result)
+            yield 'done', result
+
+        except OverloadedError as e:
+            ai_service_logger.warning(f"Streaming generation shed by admission control: {e}")
+            error_response = self._create_error_response(f"抱歉，服务繁忙，请在{e.retry_after}秒后重试。")
+            error_response['retry_after'] = e.retry_after
+            yield 'error', error_response
+        except DeadlineExceededError as e:
+            ai_service_logger.warning(f"Streaming generation abandoned: {e}")
+            error_response = self._create_error_response("抱歉，请求已超时，请稍后重试。")
+            error_response['stage'] = e.stage
+            yield 'error', error_response
+        except Exception as e:
+            processing_time = time.time() - start_time
+            ai_service_logger.error(f"Error streaming from GLM API: {e} - processing_time: {processing_time:.2f}s")
+            ERRORS_TOTAL.inc(component='generate_stream')
+            yield 'error', self._create_error_response(f"抱歉，生成内容时出现错误：{str(e)}")
 
-        # Select model based on input and specified model type
-        selected_model = self.model_service.select_model(user_input, system_prompt, model_type)
-        ai_service_logger.info(f"Selected model: {selected_model} based on input analysis and model_type: {model_type}")
+    def _get_system_prompt(self, prompt_type):
+        """Get the system prompt for a prompt type, falling back to the default"""
+        with start_span('prompt.load', prompt_type=prompt_type or 'default'):
+            if prompt_type and prompt_type in self.prompt_service.get_available_prompts():
+                ai_service_logger.info(f"Using custom prompt: {prompt_type}")
+                return self.prompt_service.get_prompt_content(prompt_type)
 
-        # Generate content
-        messages = [
+            ai_service_logger.info("Using default prompt")
+            return self.prompt_service.get_default_prompt()
+
+    def _select_model(self, user_input, system_prompt, model_type, prompt_type=None):
+        """Select the model for a request"""
+        with start_span('model.select', model_type=model_type) as span:
+            decision = self.model_service.explain_selection(user_input, system_prompt, model_type, prompt_type, reserve_probe=True)
+            span.set_attribute('model', decision['model'])
+        ai_service_logger.info(f"Selected model: {decision['model']} for model_type: {model_type} - {decision['reason']}")
+        return decision['model']
+
+    def _get_cache_key(self, prompt_type, selected_model, user_input):
+        """Get the response cache key, or None if the prompt type opts out of caching"""
+        if not self.response_cache.is_cacheable(prompt_type):
+            return None
+        prompt_version = self.prompt_service.get_prompt_version(prompt_type) if prompt_type else None
+        return self.response_cache.make_key(prompt_type, selected_model, user_input, prompt_version)
+
+    def _cached_files_exist(self, result):
+        """A cached result is stale once the HTML file it points at was deleted"""
+        html_file_info = result.get('html_file_info')
+        if not html_file_info:
+            return True
+        if html_file_info.get('file_id'):
+            return self.html_manager.html_file_exists(html_file_info['file_id'])
+        return compression.stored_file_exists(html_file_info['filepath'])
+
+    def _build_messages(self, system_prompt, user_input):
+        """Build the chat messages sent to the LLM"""
+        return [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_input}
         ]
+
+    def _generate_ai_content(self, user_input, system_prompt, selected_model, prompt_type=None):
+        """Generate content using AI, returning the content and the model that served it"""
         ai_service_logger.debug("Sending request to GLM API")
-        response = self.client.chat.completions.create(
-            model=selected_model,
-            messages=messages,
+        served = {'model': selected_model}
+        response = self.llm_gateway.chat(
+            selected_model,
+            self._build_messages(system_prompt, user_input),
+            prompt_type=prompt_type,
+            on_model=lambda model: served.update(model=model),
             temperature=0.7,
-            max_tokens=8192,
-            stream=False
+            max_tokens=8192
         )
         content = response.choices[0].message.content
-        ai_service_logger.info(f"Received response content from LLM: {content}")
-        return content
+        ai_service_logger.info(f"Received response content from LLM - length: {len(content or '')}")
+        ai_service_logger.debug("LLM response content: %s", content)
+        return content, served['model']
+
+    def _set_served_model(self, result, selected_model, served_model):
+        """Record which model served a result, and the requested one if a fallback did"""
+        result['model'] = served_model
+        if served_model != selected_model:
+            ai_service_logger.warning(f"Response served by fallback model {served_model} instead of {selected_model}")
+            result['requested_model'] = selected_model
 
     def _process_generated_content(self, content, prompt_type, start_time):
         """Process and format the generated content"""
         # Detect format
-        original_format_type = self.content_processor.detect_format(content)
+        with start_span('content.detect_format') as span:
+            original_format_type = self.content_processor.detect_format(content)
+            span.set_attribute('format', original_format_type)
 
         # Handle file operations and format conversion
         if original_format_type == "markdown":
@@ -131,6 +296,8 @@ class AIService:
         else:
             result = self._create_text_response(content, original_format_type)
 
+        GENERATION_FORMAT_TOTAL.inc(original_format=original_format_type, display_format=result['format'])
+
         # Log processing time
         processing_time = time.time() - start_time
         ai_service_logger.info(f"Content generation completed successfully - original_format: {original_format_type}, display_format: {result['format']}, processing_time: {processing_time:.2f}s")
@@ -142,10 +309,11 @@ class AIService:
         html_file_info = None
         display_format = "markdown"
         markdown_file_info = None
+        saved_content = None
 
         # Save markdown file
         try:
-            markdown_file_info = self.markdown_converter.save_markdown_file(
+            markdown_file_info, saved_content = self.markdown_converter.save_markdown(
                 content, prompt_type, "", True
             )
             if markdown_file_info:
@@ -161,10 +329,14 @@ class AIService:
                 title = f"结果页面展示 - {prompt_type or 'Default'}"
                 html_file_info, html_content = self.markdown_converter.convert_markdown_to_html(
                     markdown_file_info,
-                    title
+                    title,
+                    saved_content
                 )
-                content = html_content
-                display_format = "html"
+                if html_content:
+                    content = html_content
+                    display_format = "html"
+            except DeadlineExceededError:
+                raise
             except Exception as conversion_error:
                 ai_service_logger.error(f"Error in markdown to HTML conversion: {conversion_error}")
 
@@ -216,14 +388,34 @@ class AIService:
         """Get HTML file content and metadata"""
         return self.html_manager.get_html_file(file_id)
 
+    def get_html_file_for_serving(self, file_id):
+        """Get HTML file metadata for streaming it to the client"""
+        return self.html_manager.get_html_file_for_serving(file_id)
+
     def get_all_html_files(self):
         """Get list of all HTML files"""
         return self.html_manager.get_all_html_files()
 
+    def list_html_files(self, **query):
+        """Get one page of HTML files, see HTMLManager.list_html_files"""
+        return self.html_manager.list_html_files(**query)
+
     def delete_html_file(self, file_id):
         """Delete HTML file"""
         return self.html_manager.delete_html_file(file_id)
 
+    def get_cache_stats(self):
+        """Get response cache hit/miss counters"""
+        return self.response_cache.get_stats()
+
+    def get_renderer_stats(self):
+        """Get markdown renderer statistics (queue depth and latency for the pandoc pool)"""
+        return self.markdown_converter.get_renderer_stats()
+
+    def get_http_pool_stats(self):
+        """Get shared HTTP connection pool statistics"""
+        return self.http_transport.get_stats()
+
     def get_available_models(self):
         """获取可用的模型配置"""
         return self.model_service.get_available_models()
@@ -232,4 +424,14 @@ class AIService:
         """Generate quantitative trading strategy using knowledge base"""
         return self.quant_trade_service.generate_strategy(user_prompt, knowledge_base_name, model_type)
 
-    
\ No newline at end of file
+    def submit_quant_trade_strategy_job(self, user_prompt, knowledge_base_name="quant_trade_api_doc", model_type='auto'):
+        """Queue quantitative trading strategy generation as a background job"""
+        return self.strategy_job_manager.submit(user_prompt, knowledge_base_name, model_type)
+
+    def get_quant_trade_strategy_job(self, job_id):
+        """Get a quantitative trading strategy job"""
+        return self.strategy_job_manager.get_job(job_id)
+
+    def wait_for_quant_trade_strategy_job(self, job_id, last_version, timeout=15):
+        """Wait for a quantitative trading strategy job to change"""
+        return self.strategy_job_manager.wait_for_update(job_id, last_version, timeout)
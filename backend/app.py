@@ -1,18 +1,110 @@
 import os
-from flask import Flask, request, jsonify
+import io
+import json
+import hmac
+import hashlib
+from flask import Flask, request, jsonify, Response, stream_with_context, send_file, g
 from flask_cors import CORS
 from dotenv import load_dotenv
-from ai_service import AIService
-from logger import api_logger
-import time
 
+# Loaded before the local imports below, several of which read settings at import time
 load_dotenv()
 
+from ai_service import AIService
+from strategy_job_manager import JobQueueFullError
+from token_budget import InputTooLargeError, fit_input, get_stats as get_token_budget_stats
+from request_coalescing import RequestCoalescer, IdempotencyKeyConflictError
+from admission import admission, OverloadedError
+from hedging import hedger, endpoint_scope
+from circuit_breaker import circuit_breakers
+from deadlines import DeadlineExceededError, deadline_scope, request_timeout
+from logger import api_logger, get_logging_stats, set_log_level
+from metrics import registry as metrics_registry, HTTP_REQUEST_SECONDS, ERRORS_TOTAL
+import tracing
+import compression
+import time
+
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['Server-Timing', 'X-Trace-Id', 'Idempotent-Replayed', 'X-Coalesced', 'Retry-After'])
 
 api_logger.info("Starting Flask application")
 ai_service = AIService()
+request_coalescer = RequestCoalescer()
+
+HTML_LIST_DEFAULT_LIMIT = int(os.getenv('HTML_LIST_DEFAULT_LIMIT', '50'))
+HTML_LIST_MAX_LIMIT = int(os.getenv('HTML_LIST_MAX_LIMIT', '500'))
+HTML_VIEW_MAX_AGE = int(os.getenv('HTML_VIEW_MAX_AGE', '31536000'))
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+app.config['USE_X_SENDFILE'] = os.getenv('USE_X_SENDFILE', 'false').lower() == 'true'
+
+@app.after_request
+def compress_response(response):
+    """Compress buffered JSON/HTML responses according to Accept-Encoding"""
+    try:
+        return compression.compress_response(response, request.accept_encodings)
+    except Exception as e:
+        api_logger.error(f"Error compressing response: {e}")
+        return response
+
+def _run_deduplicated(scope, payload, func, status_code=200):
+    """Run a generation request through the coalescer and build its JSON response
+
+    Identical concurrent requests share one execution; an Idempotency-Key
+    header replays the stored result of an earlier request. Only the
+    execution itself takes a slot of the scope's endpoint limiter, and its
+    LLM calls are hedged according to the scope's hedging policy. Everything
+    runs under the request deadline.
+    """
+    def admitted():
+        with admission.endpoint(scope), endpoint_scope(scope):
+            return func()
+
+    idempotency_key = request.headers.get('Idempotency-Key')
+    with deadline_scope(_request_timeout(scope)):
+        result, status_code, source = request_coalescer.execute(scope, payload, admitted, idempotency_key, status_code)
+    response = jsonify(result)
+    response.status_code = status_code
+    if source == 'replayed':
+        response.headers['Idempotent-Replayed'] = 'true'
+    elif source == 'coalesced':
+        response.headers['X-Coalesced'] = 'true'
+    return response
+
+def _request_timeout(endpoint):
+    """Deadline in seconds from the X-Request-Timeout header or the body's timeout, else the endpoint default"""
+    requested = request.headers.get('X-Request-Timeout')
+    if requested is None:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            requested = data.get('timeout')
+    return request_timeout(endpoint, requested)
+
+def _idempotency_conflict_response(error):
+    return jsonify({
+        'error': str(error)
+    }), 422
+
+def _overloaded_response(error):
+    response = jsonify({
+        'error': str(error),
+        'retry_after': error.retry_after
+    })
+    response.status_code = error.status_code
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def _deadline_exceeded_response(error):
+    return jsonify({
+        'error': str(error),
+        'stage': error.stage
+    }), 504
+
+def _input_too_large_response(error):
+    return jsonify({
+        'error': str(error),
+        'estimated_tokens': error.estimated_tokens,
+        'max_tokens': error.max_tokens
+    }), 413
 
 @app.route('/api/generate', methods=['POST'])
 def generate_content():
@@ -29,20 +121,36 @@ def generate_content():
                 'error': 'Missing required field: input'
             }), 400
 
-        user_input = data['input'].strip()
         prompt_type = data.get('prompt_type', None)
+        user_input = fit_input(data['input'].strip(), prompt_type)
         use_test_file = data.get('use_test_file', False)
         model_type = data.get('model_type', 'standard')  # 新增模型类型参数
 
         api_logger.info(f"Processing request - prompt_type: {prompt_type}, use_test_file: {use_test_file}, model_type: {model_type}, input_length: {len(user_input)}")
 
-        result = ai_service.generate_content(user_input, prompt_type, use_test_file, model_type)
+        response = _run_deduplicated(
+            'generate',
+            {'input': user_input, 'prompt_type': prompt_type, 'use_test_file': use_test_file, 'model_type': model_type},
+            lambda: ai_service.generate_content(user_input, prompt_type, use_test_file, model_type)
+        )
 
         processing_time = time.time() - start_time
-        api_logger.info(f"Request completed successfully - processing_time: {processing_time:.2f}s, format: {result.get('format', 'unknown')}")
-
-        return jsonify(result)
-
+        api_logger.info(f"Request completed successfully - processing_time: {processing_time:.2f}s, format: {response.get_json().get('format', 'unknown')}")
+
+        return response
+
+    except InputTooLargeError as e:
+        api_logger.warning(f"Rejecting request from {client_ip}: {e}")
+        return _input_too_large_response(e)
+    except IdempotencyKeyConflictError as e:
+        api_logger.warning(f"Rejecting request from {client_ip}: {e}")
+        return _idempotency_conflict_response(e)
+    except OverloadedError as e:
+        api_logger.warning(f"Shedding request from {client_ip}: {e}")
+        return _overloaded_response(e)
+    except DeadlineExceededError as e:
+        api_logger.warning(f"Request from {client_ip} ran out of time: {e}")
+        return _deadline_exceeded_response(e)
     except Exception as e:
         processing_time = time.time() - start_time
         api_logger.error(f"Error processing request from {client_ip}: {e} - processing_time: {processing_time:.2f}s")
@@ -50,6 +158,64 @@ def generate_content():
             'error': f'Internal server error: {str(e)}'
         }), 500
 
+@app.route('/api/generate/stream', methods=['POST'])
+def generate_content_stream():
+    """Stream generated content as Server-Sent Events"""
+    start_time = time.time()
+    client_ip = request.remote_addr
+    api_logger.info(f"Received POST /api/generate/stream request from {client_ip}")
+
+    data = request.get_json(silent=True)
+    if not data or 'input' not in data:
+        api_logger.warning(f"Missing required field 'input' in request from {client_ip}")
+        return jsonify({
+            'error': 'Missing required field: input'
+        }), 400
+
+    prompt_type = data.get('prompt_type', None)
+    try:
+        user_input = fit_input(data['input'].strip(), prompt_type)
+    except InputTooLargeError as e:
+        api_logger.warning(f"Rejecting streaming request from {client_ip}: {e}")
+        return _input_too_large_response(e)
+    use_test_file = data.get('use_test_file', False)
+    model_type = data.get('model_type', 'standard')
+
+    api_logger.info(f"Processing streaming request - prompt_type: {prompt_type}, use_test_file: {use_test_file}, model_type: {model_type}, input_length: {len(user_input)}")
+
+    def event_stream():
+        for event, payload in ai_service.generate_content_stream(user_input, prompt_type, use_test_file, model_type):
+            yield f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+            if event == 'done':
+                processing_time = time.time() - start_time
+                api_logger.info(f"Streaming request completed successfully - processing_time: {processing_time:.2f}s, format: {payload.get('format', 'unknown')}")
+
+    # Admission happens before the 200 is sent; the slot is held until the stream closes.
+    # The stream runs in a copy of this context, so it keeps the request deadline.
+    limiter = admission.endpoint_limiter('generate_stream')
+    with deadline_scope(_request_timeout('generate_stream')):
+        try:
+            acquired_at = limiter.acquire() if limiter else None
+        except OverloadedError as e:
+            api_logger.warning(f"Shedding streaming request from {client_ip}: {e}")
+            return _overloaded_response(e)
+        except DeadlineExceededError as e:
+            api_logger.warning(f"Streaming request from {client_ip} ran out of time: {e}")
+            return _deadline_exceeded_response(e)
+        events = tracing.stream_in_context(event_stream())
+
+    response = Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+    if limiter:
+        response.call_on_close(lambda: limiter.release(acquired_at))
+    return response
+
 @app.route('/api/prompts', methods=['GET'])
 def get_prompts():
     """Get available prompt types"""
@@ -58,11 +224,17 @@ def get_prompts():
 
     try:
         prompts = ai_service.get_available_prompts()
+        versions = ai_service.get_prompt_versions()
         api_logger.info(f"Returning {len(prompts)} available prompts to {client_ip}")
-        return jsonify({
+
+        response = jsonify({
             'prompts': prompts,
+            'versions': versions,
             'default': None
         })
+        list_etag = hashlib.sha1(json.dumps(versions, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        response.set_etag(list_etag)
+        return response.make_conditional(request)
     except Exception as e:
         api_logger.error(f"Error getting prompts for {client_ip}: {e}")
         return jsonify({
@@ -89,14 +261,37 @@ def log_frontend_event():
 
 @app.route('/api/html/files', methods=['GET'])
 def get_html_files():
-    """Get list of all HTML files"""
+    """Get a page of HTML files, newest first
+
+    Query parameters: limit, cursor (from next_cursor), prompt_type,
+    created_after, created_before, min_size, max_size and fields
+    (comma-separated).
+    """
     try:
-        files = ai_service.get_all_html_files()
-        api_logger.info(f"Returning {len(files)} HTML files")
+        args = request.args
+        limit = min(args.get('limit', HTML_LIST_DEFAULT_LIMIT, type=int), HTML_LIST_MAX_LIMIT)
+        fields = [field.strip() for field in args.get('fields', '').split(',') if field.strip()]
+
+        files, next_cursor = ai_service.list_html_files(
+            limit=limit,
+            cursor=args.get('cursor') or None,
+            prompt_type=args.get('prompt_type') or None,
+            created_after=args.get('created_after') or None,
+            created_before=args.get('created_before') or None,
+            min_size=args.get('min_size', type=int),
+            max_size=args.get('max_size', type=int),
+            fields=fields or None
+        )
+        api_logger.info(f"Returning {len(files)} HTML files, has_more: {next_cursor is not None}")
         return jsonify({
             'files': files,
-            'count': len(files)
+            'count': len(files),
+            'next_cursor': next_cursor
         })
+    except ValueError as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
     except Exception as e:
         api_logger.error(f"Error getting HTML files: {e}")
         return jsonify({
@@ -145,12 +340,44 @@ def delete_html_file(file_id):
 
 @app.route('/api/html/files/<file_id>/view', methods=['GET'])
 def view_html_file(file_id):
-    """View HTML file directly in browser"""
+    """View HTML file directly in browser
+
+    The file is streamed from disk (sendfile where the server supports it) with
+    a content-hash ETag; generated pages never change, so they are immutable.
+    """
     try:
-        result = ai_service.get_html_file(file_id)
-        if result:
-            api_logger.info(f"Direct view of HTML file: {file_id}")
-            return result['content'], 200, {'Content-Type': 'text/html; charset=utf-8'}
+        metadata = ai_service.get_html_file_for_serving(file_id)
+        if metadata:
+            filepath = metadata['filepath']
+            variants = compression.available_variants(filepath)
+            encoding = compression.negotiate(request.accept_encodings, list(variants))
+            api_logger.info(f"Direct view of HTML file: {file_id}, encoding: {encoding or 'identity'}")
+
+            if encoding:
+                # Each stored representation gets its own strong ETag
+                source = variants[encoding]
+                etag = f"{metadata['content_hash']}-{encoding}"
+            elif os.path.exists(filepath):
+                source = filepath
+                etag = metadata['content_hash']
+            else:
+                # Client accepts none of the stored encodings and the original was not kept
+                source = io.BytesIO(compression.read_bytes(filepath))
+                etag = metadata['content_hash']
+
+            response = send_file(
+                source,
+                mimetype='text/html',
+                etag=etag,
+                last_modified=os.path.getmtime(compression.stored_path(filepath)),
+                max_age=HTML_VIEW_MAX_AGE,
+                conditional=True
+            )
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+            response.vary.add('Accept-Encoding')
+            response.cache_control.immutable = True
+            return response
         else:
             api_logger.warning(f"HTML file not found for view: {file_id}")
             return "HTML file not found", 404
@@ -158,6 +385,83 @@ def view_html_file(file_id):
         api_logger.error(f"Error viewing HTML file {file_id}: {e}")
         return f"Error loading HTML file: {str(e)}", 500
 
+@app.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Get response cache hit/miss counters"""
+    try:
+        return jsonify(ai_service.get_cache_stats())
+    except Exception as e:
+        api_logger.error(f"Error getting cache stats: {e}")
+        return jsonify({
+            'error': f'Internal server error: {str(e)}'
+        }), 500
+
+@app.route('/api/http/stats', methods=['GET'])
+def get_http_pool_stats():
+    """Get upstream HTTP connection pool statistics"""
+    try:
+        return jsonify(ai_service.get_http_pool_stats())
+    except Exception as e:
+        api_logger.error(f"Error getting HTTP pool stats: {e}")
+        return jsonify({
+            'error': f'Internal server error: {str(e)}'
+        }), 500
+
+@app.route('/api/coalescing/stats', methods=['GET'])
+def get_coalescing_stats():
+    """Get request coalescing and Idempotency-Key replay counters"""
+    try:
+        return jsonify(request_coalescer.get_stats())
+    except Exception as e:
+        api_logger.error(f"Error getting coalescing stats: {e}")
+        return jsonify({
+            'error': f'Internal server error: {str(e)}'
+        }), 500
+
+@app.route('/api/tokens/stats', methods=['GET'])
+def get_token_stats():
+    """Get input limits, estimator calibration and learned output budgets"""
+    try:
+        return jsonify(get_token_budget_stats())
+    except Exception as e:
+        api_logger.error(f"Error getting token budget stats: {e}")
+        return jsonify({
+            'error': f'Internal server error: {str(e)}'
+        }), 500
+
+@app.route('/api/admission/stats', methods=['GET'])
+def get_admission_stats():
+    """Get per-endpoint and per-model concurrency limiter statistics"""
+    try:
+        return jsonify(admission.get_stats())
+    except Exception as e:
+        api_logger.error(f"Error getting admission stats: {e}")
+        return jsonify({
+            'error': f'Internal server error: {str(e)}'
+        }), 500
+
+@app.route('/api/hedging/stats', methods=['GET'])
+def get_hedging_stats():
+    """Get hedged LLM call outcomes and extra token spend"""
+    try:
+        return jsonify(hedger.get_stats())
+    except Exception as e:
+        api_logger.error(f"Error getting hedging stats: {e}")
+        return jsonify({
+            'error': f'Internal server error: {str(e)}'
+        }), 500
+
+@app.route('/api/renderer/stats', methods=['GET'])
+def get_renderer_stats():
+    """Get markdown renderer statistics"""
+    try:
+        return jsonify(ai_service.get_renderer_stats())
+    except Exception as e:
+        api_logger.error(f"Error getting renderer stats: {e}")
+        return jsonify({
+            'error': f'Internal server error: {str(e)}'
+        }), 500
+
 @app.route('/api/generate_quant_trade_strategy', methods=['POST'])
 def generate_quant_trade_strategy():
     """Generate quantitative trading strategy using knowledge base"""
@@ -184,15 +488,33 @@ def generate_quant_trade_strategy():
                 'error': 'Prompt cannot be empty'
             }), 400
 
+        user_prompt = fit_input(user_prompt, 'quant_strategy')
+
         api_logger.info(f"Processing quant trade strategy request - knowledge_base: {knowledge_base_name}, model_type: {model_type}, prompt_length: {len(user_prompt)}")
 
-        result = ai_service.generate_quant_trade_strategy(user_prompt, knowledge_base_name, model_type)
+        response = _run_deduplicated(
+            'generate_quant_trade_strategy',
+            {'prompt': user_prompt, 'knowledge_base_name': knowledge_base_name, 'model_type': model_type},
+            lambda: ai_service.generate_quant_trade_strategy(user_prompt, knowledge_base_name, model_type)
+        )
 
         processing_time = time.time() - start_time
-        api_logger.info(f"Quant trade strategy request completed successfully - processing_time: {processing_time:.2f}s, format: {result.get('format', 'unknown')}")
-
-        return jsonify(result)
-
+        api_logger.info(f"Quant trade strategy request completed successfully - processing_time: {processing_time:.2f}s, format: {response.get_json().get('format', 'unknown')}")
+
+        return response
+
+    except InputTooLargeError as e:
+        api_logger.warning(f"Rejecting quant trade strategy request from {client_ip}: {e}")
+        return _input_too_large_response(e)
+    except IdempotencyKeyConflictError as e:
+        api_logger.warning(f"Rejecting quant trade strategy request from {client_ip}: {e}")
+        return _idempotency_conflict_response(e)
+    except OverloadedError as e:
+        api_logger.warning(f"Shedding quant trade strategy request from {client_ip}: {e}")
+        return _overloaded_response(e)
+    except DeadlineExceededError as e:
+        api_logger.warning(f"Quant trade strategy request from {client_ip} ran out of time: {e}")
+        return _deadline_exceeded_response(e)
     except Exception as e:
         processing_time = time.time() - start_time
         api_logger.error(f"Error processing quant trade strategy request from {client_ip}: {e} - processing_time: {processing_time:.2f}s")
@@ -200,6 +522,117 @@ def generate_quant_trade_strategy():
             'error': f'Internal server error: {str(e)}'
         }), 500
 
+@app.route('/api/generate_quant_trade_strategy/jobs', methods=['POST'])
+def submit_quant_trade_strategy_job():
+    """Queue quantitative trading strategy generation and return a job id"""
+    client_ip = request.remote_addr
+    api_logger.info(f"Received POST /api/generate_quant_trade_strategy/jobs request from {client_ip}")
+
+    try:
+        data = request.get_json()
+
+        if not data or 'prompt' not in data:
+            api_logger.warning(f"Missing required field 'prompt' in job request from {client_ip}")
+            return jsonify({
+                'error': 'Missing required field: prompt'
+            }), 400
+
+        user_prompt = data['prompt'].strip()
+        knowledge_base_name = data.get('knowledge_base_name', 'quant_trade_api_doc')
+        model_type = data.get('model_type', 'standard')
+
+        if not user_prompt:
+            api_logger.warning(f"Empty prompt in job request from {client_ip}")
+            return jsonify({
+                'error': 'Prompt cannot be empty'
+            }), 400
+
+        user_prompt = fit_input(user_prompt, 'quant_strategy')
+
+        def submit_job():
+            job = ai_service.submit_quant_trade_strategy_job(user_prompt, knowledge_base_name, model_type)
+            job_id = job['job_id']
+            return {
+                'job_id': job_id,
+                'status': job['status'],
+                'status_url': f"/api/generate_quant_trade_strategy/jobs/{job_id}",
+                'events_url': f"/api/generate_quant_trade_strategy/jobs/{job_id}/events"
+            }
+
+        # A retried submission with the same Idempotency-Key gets the original job back
+        return _run_deduplicated(
+            'generate_quant_trade_strategy/jobs',
+            {'prompt': user_prompt, 'knowledge_base_name': knowledge_base_name, 'model_type': model_type},
+            submit_job,
+            status_code=202
+        )
+
+    except JobQueueFullError as e:
+        api_logger.warning(f"Rejecting strategy job from {client_ip}: {e}")
+        return jsonify({
+            'error': str(e)
+        }), 503
+    except InputTooLargeError as e:
+        api_logger.warning(f"Rejecting strategy job from {client_ip}: {e}")
+        return _input_too_large_response(e)
+    except IdempotencyKeyConflictError as e:
+        api_logger.warning(f"Rejecting strategy job from {client_ip}: {e}")
+        return _idempotency_conflict_response(e)
+    except OverloadedError as e:
+        api_logger.warning(f"Shedding strategy job from {client_ip}: {e}")
+        return _overloaded_response(e)
+    except DeadlineExceededError as e:
+        api_logger.warning(f"Strategy job submission from {client_ip} ran out of time: {e}")
+        return _deadline_exceeded_response(e)
+    except Exception as e:
+        api_logger.error(f"Error submitting strategy job from {client_ip}: {e}")
+        return jsonify({
+            'error': f'Internal server error: {str(e)}'
+        }), 500
+
+@app.route('/api/generate_quant_trade_strategy/jobs/<job_id>', methods=['GET'])
+def get_quant_trade_strategy_job(job_id):
+    """Get status, per-stage progress and result of a strategy job"""
+    job = ai_service.get_quant_trade_strategy_job(job_id)
+    if not job:
+        return jsonify({
+            'error': 'Job not found'
+        }), 404
+    return jsonify(job)
+
+@app.route('/api/generate_quant_trade_strategy/jobs/<job_id>/events', methods=['GET'])
+def stream_quant_trade_strategy_job(job_id):
+    """Stream strategy job progress as Server-Sent Events"""
+    job = ai_service.get_quant_trade_strategy_job(job_id)
+    if not job:
+        return jsonify({
+            'error': 'Job not found'
+        }), 404
+
+    def event_stream():
+        current = job
+        last_version = -1
+        while current:
+            if current['version'] != last_version:
+                last_version = current['version']
+                event = 'done' if current['status'] in ('completed', 'failed') else 'progress'
+                yield f"event: {event}\ndata: {json.dumps(current, ensure_ascii=False)}\n\n"
+                if event == 'done':
+                    return
+            else:
+                # Keep the connection alive through proxies while waiting
+                yield ": keep-alive\n\n"
+            current = ai_service.wait_for_quant_trade_strategy_job(job_id, last_version)
+
+    return Response(
+        stream_with_context(tracing.stream_in_context(event_stream())),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
 @app.route('/api/generate_quant_trade_strategy/knowledge_bases', methods=['GET'])
 def get_knowledge_bases():
     """Get available knowledge bases for quantitative trading"""
@@ -207,7 +640,8 @@ def get_knowledge_bases():
     api_logger.info(f"Received GET /api/generate_quant_trade_strategy/knowledge_bases request from {client_ip}")
 
     try:
-        knowledge_bases = ai_service.knowledge_base_service.get_knowledge_base_list()
+        force_refresh = request.args.get('refresh', 'false').lower() == 'true'
+        knowledge_bases = ai_service.knowledge_base_service.get_knowledge_base_list(force_refresh)
         api_logger.info(f"Returning {len(knowledge_bases)} knowledge bases to {client_ip}")
         return jsonify({
             'knowledge_bases': knowledge_bases
@@ -231,8 +665,11 @@ def get_available_models():
             'models': models,
             'current_config': {
                 'standard_model': models['standard'],
-                'lightweight_model': models['lightweight']
-            }
+                'lightweight_model': models['lightweight'],
+                'routing_policy': ai_service.model_service.router.policy
+            },
+            'pool': ai_service.model_service.get_model_pool(),
+            'circuit_breakers': circuit_breakers.get_stats()
         })
     except Exception as e:
         api_logger.error(f"Error getting available models for {client_ip}: {e}")
@@ -259,6 +696,7 @@ def select_model():
         user_input = data['input'].strip()
         model_type = data.get('model_type', 'auto')
         prompt_type = data.get('prompt_type', None)
+        policy = data.get('policy', None)
 
         if not user_input:
             api_logger.warning(f"Empty input in model selection request from {client_ip}")
@@ -272,17 +710,18 @@ def select_model():
         else:
             system_prompt = ai_service.prompt_service.get_default_prompt()
 
-        # 选择模型
-        selected_model = ai_service.model_service.select_model(user_input, system_prompt, model_type)
+        # 选择模型，并说明决策依据
+        decision = ai_service.model_service.explain_selection(user_input, system_prompt, model_type, prompt_type, policy)
 
         processing_time = time.time() - start_time
-        api_logger.info(f"Model selection completed successfully - selected_model: {selected_model}, processing_time: {processing_time:.2f}s")
+        api_logger.info(f"Model selection completed successfully - selected_model: {decision['model']}, processing_time: {processing_time:.2f}s")
 
         return jsonify({
-            'selected_model': selected_model,
+            'selected_model': decision['model'],
             'model_type': model_type,
             'input_length': len(user_input),
-            'reasoning': f"Model selected based on input analysis and model_type: {model_type}"
+            'reasoning': decision['reason'],
+            'decision': decision
         })
 
     except Exception as e:
@@ -292,18 +731,104 @@ def select_model():
             'error': f'Internal server error: {str(e)}'
         }), 500
 
+def _admin_authorized():
+    """Admin endpoints require X-Admin-Token to match ADMIN_TOKEN"""
+    token = request.headers.get('X-Admin-Token', '')
+    return hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8'))
+
+@app.route('/api/admin/logging', methods=['GET', 'PUT'])
+def admin_logging():
+    """Get logging pipeline stats, or change logger levels at runtime
+
+    PUT body: {"level": "INFO", "logger": "ai_service"}; logger is optional
+    and defaults to all application loggers.
+    """
+    if not ADMIN_TOKEN:
+        # Admin endpoints are disabled until a token is configured
+        return jsonify({
+            'error': 'Not found'
+        }), 404
+    if not _admin_authorized():
+        return jsonify({
+            'error': 'Unauthorized'
+        }), 401
+
+    try:
+        if request.method == 'PUT':
+            data = request.get_json(silent=True) or {}
+            if 'level' not in data:
+                return jsonify({
+                    'error': 'Missing required field: level'
+                }), 400
+            levels = set_log_level(data['level'], data.get('logger'))
+            api_logger.warning(f"Log level changed to {data['level']} for {data.get('logger') or 'all loggers'} by {request.remote_addr}")
+            return jsonify({
+                'levels': levels
+            })
+
+        return jsonify(get_logging_stats())
+    except ValueError as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        api_logger.error(f"Error in logging admin endpoint: {e}")
+        return jsonify({
+            'error': f'Internal server error: {str(e)}'
+        }), 500
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus metrics; ?format=json gives per-series count, avg and p50/p95/p99"""
+    try:
+        if request.args.get('format') == 'json':
+            return jsonify(metrics_registry.get_summary())
+        return Response(metrics_registry.render_prometheus(), mimetype='text/plain; version=0.0.4')
+    except Exception as e:
+        api_logger.error(f"Error rendering metrics: {e}")
+        return jsonify({
+            'error': f'Internal server error: {str(e)}'
+        }), 500
+
 @app.before_request
 def log_request_info():
     """Log request information"""
-    api_logger.debug(f"{request.method} {request.path} from {request.remote_addr}")
+    g.request_start_time = time.perf_counter()
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.trace_span = tracing.begin_span(
+        f"{request.method} {endpoint}",
+        traceparent=request.headers.get('traceparent'),
+        **{'http.method': request.method, 'http.target': request.path}
+    )
+    api_logger.debug("%s %s from %s", request.method, request.path, request.remote_addr)
 
 @app.after_request
 def log_response_info(response):
     """Log response information"""
-    api_logger.debug(f"Response {response.status_code} for {request.path}")
+    api_logger.debug("Response %s for %s", response.status_code, request.path)
+    start_time = g.get('request_start_time')
+    if start_time is not None:
+        # Streaming endpoints are measured until the response starts
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start_time,
+                                     endpoint=endpoint, method=request.method, status=response.status_code)
+        if response.status_code >= 500:
+            ERRORS_TOTAL.inc(component='http')
+
+    span = g.get('trace_span')
+    if span is not None and span.trace_id:
+        span.set_attribute('http.status_code', response.status_code)
+        response.headers['X-Trace-Id'] = span.trace_id
+        response.headers['Server-Timing'] = span.server_timing()
+        if response.is_streamed:
+            # The trace covers the whole stream, not just the time to the first byte
+            span.detach()
+            response.call_on_close(span.end)
+        else:
+            span.end()
     return response
 
 if __name__ == '__main__':
     api_logger.info("Flask application starting on port 5000")
-    api_logger.info(f"Available endpoints: /api/generate, /api/prompts, /health, /api/html/files/*, /api/generate_quant_trade_strategy, /api/models, /api/models/select")
+    api_logger.info(f"Available endpoints: /api/generate, /api/generate/stream, /api/prompts, /health, /api/html/files/*, /api/generate_quant_trade_strategy, /api/models, /api/models/select")
     app.run(debug=False, host='0.0.0.0', port=5000)
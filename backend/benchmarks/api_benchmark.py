@@ -0,0 +1,241 @@
+"""Load benchmark for the backend API against the local fake GLM server
+
+Drives /api/generate, /api/generate/stream, /api/generate_quant_trade_strategy
+and the /api/html/files endpoints at the given concurrency levels and reports
+throughput and latency percentiles per scenario.
+
+By default the backend runs in-process on a temporary data directory, wired
+to an in-process fake GLM server, so nothing touches open.bigmodel.cn or the
+real Data directory. Use --base-url to benchmark an already running backend
+(started against benchmarks/fake_glm_server.py).
+
+Usage (from the backend directory):
+    python benchmarks/api_benchmark.py --concurrency 1,8,32 --requests 100
+    python benchmarks/api_benchmark.py --latency-ms 800 --tokens-per-second 60 --json-out bench.json
+    python benchmarks/api_benchmark.py --baseline bench.json --max-regression 0.2
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+from fake_glm_server import FakeGLMServer, add_config_arguments, config_from_args
+
+SCENARIOS = ('generate', 'generate_stream', 'quant', 'html_list', 'html_view')
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def start_backend(fake_server, enable_cache):
+    """Run the Flask app in-process on a temporary data directory
+
+    The backend resolves ../Data relative to the working directory, so the
+    process moves into <tmp>/run before the app is imported.
+    """
+    work_dir = tempfile.mkdtemp(prefix='copychat-bench-')
+    run_dir = os.path.join(work_dir, 'run')
+    os.makedirs(run_dir)
+    os.chdir(run_dir)
+
+    os.environ.update({
+        'GLM_API_KEY': 'benchmark',
+        'AI_BASE_URL': fake_server.llm_base_url,
+        'KB_BASE_URL': fake_server.kb_base_url,
+        'PRJ_PATH': os.path.join(work_dir, 'prj'),
+        'RESPONSE_CACHE_ENABLED': 'true' if enable_cache else 'false',
+        'LOG_CONSOLE_LEVEL': os.environ.get('LOG_CONSOLE_LEVEL', 'WARNING'),
+        'TRACE_EXPORTER': os.environ.get('TRACE_EXPORTER', 'none')
+    })
+
+    from werkzeug.serving import make_server
+    from app import app
+
+    # Per-request access lines would drown the results table
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="benchmark-backend", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", work_dir
+
+
+class ScenarioRunner:
+    """Issues one scenario's requests from a pool of concurrent workers"""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url
+        self.client = httpx.Client(base_url=base_url, timeout=timeout,
+                                   limits=httpx.Limits(max_connections=256, max_keepalive_connections=256))
+        self._counter = 0
+        self._lock = threading.Lock()
+        self.file_ids = []
+
+    def _next_index(self):
+        with self._lock:
+            self._counter += 1
+            return self._counter
+
+    def request(self, scenario, repeat_inputs=False):
+        """Issue one request, returning True on success"""
+        index = 0 if repeat_inputs else self._next_index()
+        if scenario == 'generate':
+            response = self.client.post('/api/generate', json={'input': f"解释一下第一性原理 #{index}"})
+        elif scenario == 'generate_stream':
+            with self.client.stream('POST', '/api/generate/stream', json={'input': f"解释一下盘活存量资产 #{index}"}) as response:
+                body = ''.join(response.iter_text())
+            return response.status_code == 200 and 'event: done' in body
+        elif scenario == 'quant':
+            response = self.client.post('/api/generate_quant_trade_strategy', json={'prompt': f"双均线交易策略 #{index}"})
+        elif scenario == 'html_list':
+            response = self.client.get('/api/html/files', params={'limit': 50})
+        elif scenario == 'html_view':
+            file_id = self.file_ids[self._next_index() % len(self.file_ids)]
+            response = self.client.get(f"/api/html/files/{file_id}/view", headers={'Accept-Encoding': 'gzip'})
+        else:
+            raise ValueError(f"Unknown scenario: {scenario}")
+        return response.status_code == 200
+
+    def load_file_ids(self):
+        response = self.client.get('/api/html/files', params={'limit': 500, 'fields': 'file_id'})
+        self.file_ids = [entry['file_id'] for entry in response.json().get('files', [])]
+        return self.file_ids
+
+    def run(self, scenario, concurrency, requests, repeat_inputs=False):
+        """Run requests at the given concurrency and return the measurements"""
+        latencies = []
+        errors = 0
+        remaining = [requests]
+        lock = threading.Lock()
+
+        def worker():
+            nonlocal errors
+            while True:
+                with lock:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+                start = time.perf_counter()
+                try:
+                    ok = self.request(scenario, repeat_inputs)
+                except Exception:
+                    ok = False
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append(elapsed)
+                    if not ok:
+                        errors += 1
+
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for future in [executor.submit(worker) for _ in range(concurrency)]:
+                future.result()
+        wall_time = time.perf_counter() - start_time
+
+        return {
+            'scenario': scenario,
+            'concurrency': concurrency,
+            'requests': len(latencies),
+            'errors': errors,
+            'throughput': len(latencies) / wall_time if wall_time else 0.0,
+            'mean_ms': sum(latencies) / len(latencies) * 1000,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'max_ms': max(latencies) * 1000
+        }
+
+
+def compare_with_baseline(results, baseline_path, max_regression):
+    """List scenarios whose p95 grew or throughput dropped beyond max_regression"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {(entry['scenario'], entry['concurrency']): entry for entry in json.load(f)['results']}
+
+    regressions = []
+    for result in results:
+        previous = baseline.get((result['scenario'], result['concurrency']))
+        if not previous:
+            continue
+        if result['p95_ms'] > previous['p95_ms'] * (1 + max_regression):
+            regressions.append(f"{result['scenario']}@{result['concurrency']}: p95 {previous['p95_ms']:.1f}ms -> {result['p95_ms']:.1f}ms")
+        if result['throughput'] < previous['throughput'] * (1 - max_regression):
+            regressions.append(f"{result['scenario']}@{result['concurrency']}: throughput {previous['throughput']:.1f}/s -> {result['throughput']:.1f}/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', help='benchmark a running backend instead of an in-process one')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--concurrency', default='1,4,16')
+    parser.add_argument('--requests', type=int, default=50, help='requests per scenario and concurrency level')
+    parser.add_argument('--warmup', type=int, default=3, help='untimed requests per scenario')
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--cache', action='store_true', help='enable the response cache and repeat inputs')
+    parser.add_argument('--json-out', help='write results to this file')
+    parser.add_argument('--baseline', help='results file to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.2, help='allowed p95/throughput change vs baseline')
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    fake_server = None
+    base_url = args.base_url
+    if not base_url:
+        fake_server = FakeGLMServer(config=config_from_args(args)).start()
+        base_url, work_dir = start_backend(fake_server, args.cache)
+        print(f"In-process backend at {base_url}, fake GLM at {fake_server.base_url}, data in {work_dir}")
+
+    runner = ScenarioRunner(base_url, args.timeout)
+    print(f"Fake GLM latency: {args.latency_ms}ms, tokens/s: {args.tokens_per_second or 'instant'}, requests per level: {args.requests}")
+    print(f"{'scenario':<16} {'conc':>5} {'reqs':>6} {'errors':>6} {'req/s':>9} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+
+    results = []
+    for scenario in scenarios:
+        if scenario == 'html_view' and not runner.load_file_ids():
+            print(f"{scenario:<16} skipped: no stored HTML files (run a generate scenario with html in --mix first)")
+            continue
+        for _ in range(args.warmup):
+            runner.request(scenario, args.cache)
+        for level in levels:
+            result = runner.run(scenario, level, args.requests, args.cache)
+            results.append(result)
+            print(f"{scenario:<16} {level:>5} {result['requests']:>6} {result['errors']:>6} {result['throughput']:>9.1f} "
+                  f"{result['mean_ms']:>9.1f} {result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} {result['p99_ms']:>9.1f} {result['max_ms']:>9.1f}")
+
+    if fake_server:
+        print(f"Fake GLM requests by model: {fake_server.requests_by_model}")
+
+    if args.json_out:
+        with open(args.json_out, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'results': results}, f, ensure_ascii=False, indent=2)
+        print(f"Results written to {args.json_out}")
+
+    if args.baseline:
+        regressions = compare_with_baseline(results, args.baseline, args.max_regression)
+        if regressions:
+            print("Regressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("No regressions against baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,336 @@
+"""Local stand-in for the GLM chat-completions and knowledge base list APIs
+
+Serves the endpoints used by ZhipuAiClient and KnowledgeBaseService with
+configurable latency, token rate and canned markdown / HTML / SVG outputs,
+so the backend can be exercised without calling open.bigmodel.cn.
+
+Usage (from the backend directory):
+    python benchmarks/fake_glm_server.py --port 18080 --latency-ms 300 --tokens-per-second 80
+    # then start the backend with
+    # AI_BASE_URL=http://127.0.0.1:18080/api/paas/v4 KB_BASE_URL=http://127.0.0.1:18080/api/llm-application/open
+"""
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+CANNED_OUTPUTS = {
+    'markdown': """# 第一性原理
+
+## 本质
+
+把问题拆解到最基本的事实，再从这些事实出发重新推导解决方案。
+
+## 对比
+
+| 方法 | 出发点 | 适用场景 |
+|------|--------|----------|
+| 类比推理 | 已有经验 | 渐进改良 |
+| 第一性原理 | 基本事实 | 颠覆创新 |
+
+## 示例
+
+```python
+def cost_of_battery(materials):
+    return sum(price * weight for price, weight in materials)
+```
+
+> 从材料成本出发，而不是从市场价格出发。
+""",
+    'html': """<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+<meta charset="utf-8">
+<title>学习卡片</title>
+<style>
+body { font-family: sans-serif; max-width: 720px; margin: 0 auto; padding: 2em; }
+.card { border: 1px solid #ddd; border-radius: 8px; padding: 1em 1.5em; margin: 1em 0; }
+.word { font-size: 2em; color: #2c3e50; }
+</style>
+</head>
+<body>
+<div class="card"><div class="word">serendipity</div><p>意外发现珍奇事物的运气。</p></div>
+<div class="card"><h3>例句</h3><p>Finding this book was pure serendipity.</p></div>
+</body>
+</html>
+""",
+    'svg': """# 盘活存量资产
+
+## 本质
+
+将未来的现金流一次性变现。
+
+```svg
+<svg xmlns="http://www.w3.org/2000/svg" width="400" height="200" viewBox="0 0 400 200">
+  <rect x="10" y="10" width="380" height="180" rx="12" fill="#f6f8fa" stroke="#2c3e50"/>
+  <circle cx="100" cy="100" r="40" fill="#3498db"/>
+  <path d="M150 100 L300 100" stroke="#e74c3c" stroke-width="4" marker-end="url(#arrow)"/>
+  <text x="200" y="170" text-anchor="middle" font-size="16">未来现金流 → 今天的资金</text>
+</svg>
+```
+
+## 通俗解释
+
+好比把一棵果树未来十年的果子提前卖掉。
+""",
+    'steps': """1. 步骤一：获取行情数据
+   - 拉取标的的日线数据
+2. 步骤二：计算均线指标
+   - 计算短期与长期移动平均线
+3. 步骤三：生成交易信号
+   - 金叉买入，死叉卖出
+4. 步骤四：风险管理
+   - 设置止损与仓位上限
+""",
+    'code': """```python
+import pandas as pd
+
+
+def generate_signals(prices, short_window=5, long_window=20):
+    data = pd.DataFrame({'close': prices})
+    data['short_ma'] = data['close'].rolling(short_window).mean()
+    data['long_ma'] = data['close'].rolling(long_window).mean()
+    data['signal'] = (data['short_ma'] > data['long_ma']).astype(int)
+    data['position'] = data['signal'].diff()
+    return data
+
+
+if __name__ == '__main__':
+    print(generate_signals(list(range(100))).tail())
+```
+"""
+}
+
+KNOWLEDGE_BASES = [
+    {'id': 'kb-quant-0001', 'name': 'quant_trade_api_doc', 'description': 'Quant trading API documentation'},
+    {'id': 'kb-general-0002', 'name': 'general_doc', 'description': 'General documentation'}
+]
+
+
+class FakeGLMConfig:
+    """Latency and output settings shared by all requests"""
+
+    def __init__(self, latency_ms=300, jitter_ms=50, tokens_per_second=0, chars_per_token=2,
+                 chunk_tokens=4, mix='markdown=2,html=1,svg=1', error_rate=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.tokens_per_second = tokens_per_second
+        self.chars_per_token = chars_per_token
+        self.chunk_tokens = chunk_tokens
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.mix = []
+        for item in mix.split(','):
+            name, _, weight = item.partition('=')
+            if name.strip() not in CANNED_OUTPUTS:
+                raise ValueError(f"Unknown canned output: {name}")
+            self.mix.extend([name.strip()] * int(weight or 1))
+        self._lock = threading.Lock()
+        self._counter = 0
+
+    def next_output(self, messages):
+        """Pick the canned output for a request: quant prompts get steps or code,
+        everything else cycles through the configured mix"""
+        system_prompt = next((m.get('content', '') for m in messages if m.get('role') == 'system'), '')
+        if '量化交易分析师' in system_prompt:
+            return 'steps'
+        if '量化交易' in system_prompt:
+            return 'code'
+        with self._lock:
+            name = self.mix[self._counter % len(self.mix)]
+            self._counter += 1
+        return name
+
+    def first_token_delay(self):
+        jitter = self.random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0
+        return max(0.0, (self.latency_ms + jitter) / 1000)
+
+    def token_count(self, text):
+        return max(1, len(text) // self.chars_per_token)
+
+    def generation_delay(self, tokens):
+        return tokens / self.tokens_per_second if self.tokens_per_second else 0.0
+
+
+class FakeGLMHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/knowledge') or '/knowledge?' in self.path:
+            time.sleep(self.config.first_token_delay() / 4)
+            self._send_json(200, {'code': 200, 'message': 'ok', 'data': {'list': KNOWLEDGE_BASES, 'total': len(KNOWLEDGE_BASES)}})
+        else:
+            self._send_json(404, {'error': {'message': f'Not found: {self.path}'}})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+
+        if not self.path.endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': f'Not found: {self.path}'}})
+            return
+
+        if self.config.error_rate and self.config.random.random() < self.config.error_rate:
+            time.sleep(self.config.first_token_delay())
+            self._send_json(500, {'error': {'code': '500', 'message': 'Injected failure'}})
+            return
+
+        model = body.get('model', 'glm-4.6')
+        output = CANNED_OUTPUTS[self.config.next_output(body.get('messages', []))]
+        prompt_tokens = sum(self.config.token_count(m.get('content') or '') for m in body.get('messages', []))
+        completion_tokens = self.config.token_count(output)
+        self.server.record_request(model)
+
+        if body.get('stream'):
+            self._stream_completion(model, output, prompt_tokens, completion_tokens)
+        else:
+            time.sleep(self.config.first_token_delay() + self.config.generation_delay(completion_tokens))
+            self._send_json(200, {
+                'id': uuid.uuid4().hex,
+                'created': int(time.time()),
+                'model': model,
+                'object': 'chat.completion',
+                'choices': [{
+                    'index': 0,
+                    'finish_reason': 'stop',
+                    'message': {'role': 'assistant', 'content': output}
+                }],
+                'usage': {
+                    'prompt_tokens': prompt_tokens,
+                    'completion_tokens': completion_tokens,
+                    'total_tokens': prompt_tokens + completion_tokens
+                }
+            })
+
+    def _stream_completion(self, model, output, prompt_tokens, completion_tokens):
+        completion_id = uuid.uuid4().hex
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        time.sleep(self.config.first_token_delay())
+        chunk_chars = self.config.chunk_tokens * self.config.chars_per_token
+        for start in range(0, len(output), chunk_chars):
+            piece = output[start:start + chunk_chars]
+            self._write_event({
+                'id': completion_id,
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'delta': {'role': 'assistant', 'content': piece}}]
+            })
+            time.sleep(self.config.generation_delay(self.config.chunk_tokens))
+
+        self._write_event({
+            'id': completion_id,
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{'index': 0, 'finish_reason': 'stop', 'delta': {'role': 'assistant', 'content': ''}}],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens
+            }
+        })
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _write_event(self, payload):
+        self.wfile.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode('utf-8'))
+        self.wfile.flush()
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakeGLMServer(ThreadingHTTPServer):
+    """Threaded fake GLM server, runnable in the background of a benchmark"""
+
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, config=None):
+        super().__init__((host, port), FakeGLMHandler)
+        self.config = config or FakeGLMConfig()
+        self.requests_by_model = {}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    @property
+    def llm_base_url(self):
+        return f"{self.base_url}/api/paas/v4"
+
+    @property
+    def kb_base_url(self):
+        return f"{self.base_url}/api/llm-application/open"
+
+    def record_request(self, model):
+        with self._stats_lock:
+            self.requests_by_model[model] = self.requests_by_model.get(model, 0) + 1
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="fake-glm-server", daemon=True).start()
+        return self
+
+
+def add_config_arguments(parser):
+    """Fake server options, shared with the benchmark runner"""
+    parser.add_argument('--latency-ms', type=float, default=300, help='time to first token')
+    parser.add_argument('--jitter-ms', type=float, default=50)
+    parser.add_argument('--tokens-per-second', type=float, default=0, help='generation rate, 0 for instant')
+    parser.add_argument('--chunk-tokens', type=int, default=4, help='tokens per streamed chunk')
+    parser.add_argument('--mix', default='markdown=2,html=1,svg=1', help='weighted canned outputs for generate requests')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of completions failing with HTTP 500')
+    parser.add_argument('--seed', type=int, default=None)
+
+
+def config_from_args(args):
+    return FakeGLMConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        tokens_per_second=args.tokens_per_second,
+        chunk_tokens=args.chunk_tokens,
+        mix=args.mix,
+        error_rate=args.error_rate,
+        seed=args.seed
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18080)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server = FakeGLMServer(args.host, args.port, config_from_args(args))
+    print(f"Fake GLM server listening on {server.base_url}")
+    print(f"  AI_BASE_URL={server.llm_base_url}")
+    print(f"  KB_BASE_URL={server.kb_base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
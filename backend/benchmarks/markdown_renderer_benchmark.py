@@ -0,0 +1,110 @@
+"""Benchmark the markdown renderers on concept_svg style output
+
+Usage (from the backend directory):
+    python benchmarks/markdown_renderer_benchmark.py --iterations 50
+    python benchmarks/markdown_renderer_benchmark.py --renderers python,pandoc --pandoc-script ../trans_markdown.sh
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from markdown_renderer import PythonMarkdownRenderer, PandocRenderer, RendererError
+
+# Representative answer for the concept_svg prompt after SVG extraction:
+# explanation sections, a comparison table, a code block and SVG image references
+SAMPLE_MARKDOWN = """# 盘活存量资产
+
+## 本质
+
+将未来的现金流一次性变现，用今天的确定性换取明天的不确定性。
+
+## 通俗解释
+
+好比把一棵果树未来十年的果子提前卖掉：果农立刻拿到钱，买家获得十年的采摘权。
+
+![](public/images/svg_20250101_120000_abcd1234_1.svg)
+
+## 对比
+
+| 方式 | 资金到账 | 经营权 | 风险承担 |
+|------|----------|--------|----------|
+| 传统经营 | 逐年 | 景区 | 景区 |
+| 盘活存量 | 一次性 | 金融机构 | 金融机构 |
+| 资产证券化 | 一次性 | 景区 | 投资者 |
+
+## 示例
+
+```python
+def present_value(cash_flows, rate):
+    return sum(cf / (1 + rate) ** (i + 1) for i, cf in enumerate(cash_flows))
+
+print(present_value([100] * 10, 0.05))
+```
+
+> 留白与简约：把复杂的金融安排还原成一句话。
+
+![](public/images/svg_20250101_120000_abcd1234_2.svg)
+"""
+
+
+def run_benchmark(renderer, markdown_content, iterations, work_dir):
+    """Render the document repeatedly, returning per-run latencies in ms"""
+    markdown_filepath = os.path.join(work_dir, f"bench_{renderer.name}.md")
+    html_filepath = os.path.join(work_dir, f"bench_{renderer.name}.html")
+    latencies = []
+
+    for _ in range(iterations):
+        start = time.perf_counter()
+        # Include the markdown write, which both pipelines pay before rendering
+        with open(markdown_filepath, 'w', encoding='utf-8') as f:
+            f.write(markdown_content)
+        renderer.render_to_file(markdown_content, markdown_filepath, html_filepath, "结果页面展示 - concept_svg")
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return latencies
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--renderers', default='python,pandoc')
+    parser.add_argument('--pandoc-script', default=os.getenv('PANDOC_SCRIPT', '../trans_markdown.sh'))
+    args = parser.parse_args()
+
+    renderers = []
+    for name in args.renderers.split(','):
+        name = name.strip()
+        try:
+            if name == 'python':
+                renderers.append(PythonMarkdownRenderer())
+            elif name == 'pandoc':
+                if not os.path.exists(args.pandoc_script):
+                    print(f"Skipping pandoc: script not found at {args.pandoc_script}")
+                    continue
+                renderers.append(PandocRenderer(args.pandoc_script))
+        except RendererError as e:
+            print(f"Skipping {name}: {e}")
+
+    print(f"Document: {len(SAMPLE_MARKDOWN)} chars, iterations: {args.iterations}")
+    print(f"{'renderer':<10} {'mean ms':>10} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10}")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for renderer in renderers:
+            latencies = run_benchmark(renderer, SAMPLE_MARKDOWN, args.iterations, work_dir)
+            print(f"{renderer.name:<10} {statistics.mean(latencies):>10.2f} {percentile(latencies, 50):>10.2f} "
+                  f"{percentile(latencies, 95):>10.2f} {max(latencies):>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
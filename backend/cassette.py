@@ -0,0 +1,217 @@
+import os
+import json
+import time
+import base64
+import hashlib
+import threading
+import httpx
+from logger import backend_logger
+
+# off, record (call upstream and save), replay (serve saved responses only)
+# or auto (replay when recorded, otherwise record)
+LLM_CASSETTE_MODE = os.getenv('LLM_CASSETTE_MODE', 'off').lower()
+LLM_CASSETTE_DIR = os.getenv('LLM_CASSETTE_DIR', '../Data/cassettes')
+# Multiplies recorded delays on replay: 1 keeps the original timing, 0 replays instantly
+LLM_CASSETTE_TIME_SCALE = float(os.getenv('LLM_CASSETTE_TIME_SCALE', '1'))
+
+# Only GLM chat completions and knowledge base calls are recorded; other
+# upstream traffic on the shared client (e.g. trace export) passes through
+RECORDED_PATH_SUFFIXES = ('/chat/completions', '/knowledge')
+# Body fields that differ between otherwise identical requests
+IGNORED_BODY_FIELDS = ('request_id',)
+
+
+def request_key(request):
+    """Hash of method, path, query and canonical JSON body, ignoring host and headers
+    so recordings replay regardless of base URL and API key"""
+    body = request.read()
+    try:
+        payload = json.loads(body) if body else None
+        if isinstance(payload, dict):
+            payload = {key: value for key, value in payload.items() if key not in IGNORED_BODY_FIELDS}
+        body = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    except ValueError:
+        pass
+
+    digest = hashlib.sha256()
+    digest.update(request.method.encode('utf-8'))
+    digest.update(request.url.raw_path)
+    digest.update(b'\n')
+    digest.update(body)
+    return digest.hexdigest()
+
+
+class _RecordingStream(httpx.SyncByteStream):
+    """Passes response chunks through, noting when each arrived, and saves
+    the cassette once the body has been read to the end"""
+
+    def __init__(self, stream, on_complete, start_time):
+        self._stream = stream
+        self._on_complete = on_complete
+        self._start_time = start_time
+        self._chunks = []
+
+    def __iter__(self):
+        for chunk in self._stream:
+            self._chunks.append((time.perf_counter() - self._start_time, chunk))
+            yield chunk
+        self._on_complete(self._chunks)
+
+    def close(self):
+        self._stream.close()
+
+
+class _ReplayStream(httpx.SyncByteStream):
+    """Yields recorded chunks at their recorded offsets, scaled"""
+
+    def __init__(self, chunks, start_time, time_scale):
+        self._chunks = chunks
+        self._start_time = start_time
+        self._time_scale = time_scale
+
+    def __iter__(self):
+        for offset, chunk in self._chunks:
+            delay = self._start_time + offset * self._time_scale - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            yield chunk
+
+
+class CassetteStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.recorded = 0
+        self.skipped = 0
+        self.replayed = 0
+        self.misses = 0
+        self.passthrough = 0
+
+    def inc(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            return {'recorded': self.recorded, 'skipped': self.skipped, 'replayed': self.replayed, 'misses': self.misses, 'passthrough': self.passthrough}
+
+
+class CassetteTransport(httpx.BaseTransport):
+    """httpx transport wrapper that records upstream responses or replays them
+
+    Each recorded response is stored as <sha256 of request>.json in the
+    cassette directory with its status, headers, time to headers and every
+    body chunk with its arrival offset, so replayed streams keep the original
+    time to first token and token rate. Only successful (2xx) responses are
+    recorded; errors and throttling pass through so a later run retries them.
+    """
+
+    def __init__(self, transport, mode=LLM_CASSETTE_MODE, cassette_dir=LLM_CASSETTE_DIR, time_scale=LLM_CASSETTE_TIME_SCALE):
+        self._transport = transport
+        self.mode = mode
+        self.cassette_dir = cassette_dir
+        self.time_scale = time_scale
+        self.stats = CassetteStats()
+        os.makedirs(self.cassette_dir, exist_ok=True)
+        backend_logger.info(f"CassetteTransport initialized - mode: {mode}, dir: {cassette_dir}, time_scale: {time_scale}")
+
+    def _path(self, key):
+        return os.path.join(self.cassette_dir, f"{key}.json")
+
+    def handle_request(self, request):
+        if not request.url.path.endswith(RECORDED_PATH_SUFFIXES):
+            self.stats.inc('passthrough')
+            return self._transport.handle_request(request)
+
+        key = request_key(request)
+        if self.mode in ('replay', 'auto'):
+            cassette = self._load(key)
+            if cassette is not None:
+                self.stats.inc('replayed')
+                return self._replay(request, cassette)
+            if self.mode == 'replay':
+                self.stats.inc('misses')
+                message = f"No cassette recorded for {request.method} {request.url.path} (key: {key[:12]})"
+                backend_logger.warning(message)
+                # A client error the SDK will not retry, so misses fail fast
+                return httpx.Response(404, headers={'x-should-retry': 'false'},
+                                      json={'error': {'code': 'cassette_miss', 'message': message}}, request=request)
+
+        return self._record(request, key)
+
+    def _record(self, request, key):
+        start_time = time.perf_counter()
+        response = self._transport.handle_request(request)
+        headers_delay = time.perf_counter() - start_time
+        if not response.is_success:
+            self.stats.inc('skipped')
+            backend_logger.info(f"Not recording {request.method} {request.url.path} - status: {response.status_code}")
+            return response
+
+        def save(chunks):
+            cassette = {
+                'request': {'method': request.method, 'path': request.url.path},
+                'recorded_at': time.time(),
+                'status_code': response.status_code,
+                'headers': [[name.decode('latin-1'), value.decode('latin-1')] for name, value in response.headers.raw],
+                'headers_delay': headers_delay,
+                'chunks': [[offset, base64.b64encode(chunk).decode('ascii')] for offset, chunk in chunks]
+            }
+            try:
+                temp_path = f"{self._path(key)}.{threading.get_ident()}.tmp"
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(cassette, f)
+                os.replace(temp_path, self._path(key))
+                self.stats.inc('recorded')
+            except Exception as e:
+                backend_logger.warning(f"Failed to save cassette {key[:12]}: {e}")
+
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers.raw,
+            stream=_RecordingStream(response.stream, save, start_time),
+            extensions=response.extensions
+        )
+
+    def _replay(self, request, cassette):
+        start_time = time.perf_counter()
+        delay = cassette['headers_delay'] * self.time_scale
+        if delay > 0:
+            time.sleep(delay)
+        chunks = [(offset, base64.b64decode(chunk)) for offset, chunk in cassette['chunks']]
+        return httpx.Response(
+            status_code=cassette['status_code'],
+            headers=[(name, value) for name, value in cassette['headers']],
+            stream=_ReplayStream(chunks, start_time, self.time_scale),
+            request=request
+        )
+
+    def _load(self, key):
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            backend_logger.warning(f"Failed to load cassette {key[:12]}: {e}")
+            return None
+
+    def get_stats(self):
+        stats = self.stats.snapshot()
+        stats.update({'mode': self.mode, 'dir': self.cassette_dir, 'time_scale': self.time_scale})
+        return stats
+
+    def get_pool_state(self):
+        return self._transport.get_pool_state()
+
+    def close(self):
+        self._transport.close()
+
+
+def wrap_transport(transport):
+    """Wrap the upstream transport according to LLM_CASSETTE_MODE"""
+    if LLM_CASSETTE_MODE == 'off':
+        return transport
+    if LLM_CASSETTE_MODE not in ('record', 'replay', 'auto'):
+        backend_logger.warning(f"Unknown LLM_CASSETTE_MODE '{LLM_CASSETTE_MODE}', recording and replay disabled")
+        return transport
+    return CassetteTransport(transport)
@@ -0,0 +1,220 @@
+import os
+import time
+import threading
+from collections import deque
+import httpx
+from zai.core._errors import APIConnectionError
+from logger import ai_service_logger
+from metrics import CIRCUIT_STATE, CIRCUIT_TRANSITIONS_TOTAL, LLM_FALLBACK_TOTAL
+from admission import OverloadedError
+
+CIRCUIT_BREAKER_ENABLED = os.getenv('CIRCUIT_BREAKER_ENABLED', 'true').lower() == 'true'
+# The breaker trips on the last CIRCUIT_WINDOW calls once at least CIRCUIT_MIN_CALLS were made
+CIRCUIT_WINDOW = int(os.getenv('CIRCUIT_WINDOW', '20'))
+CIRCUIT_MIN_CALLS = int(os.getenv('CIRCUIT_MIN_CALLS', '10'))
+CIRCUIT_ERROR_RATE = float(os.getenv('CIRCUIT_ERROR_RATE', '0.5'))
+# A call is slow above this many seconds (time to first token for streams), 0 disables
+CIRCUIT_SLOW_CALL_SECONDS = float(os.getenv('CIRCUIT_SLOW_CALL_SECONDS', '60'))
+CIRCUIT_SLOW_CALL_RATE = float(os.getenv('CIRCUIT_SLOW_CALL_RATE', '0.5'))
+# Seconds an open circuit rejects calls before letting probes through
+CIRCUIT_OPEN_SECONDS = float(os.getenv('CIRCUIT_OPEN_SECONDS', '30'))
+# Concurrent probes in half-open state; that many successes close the circuit
+CIRCUIT_HALF_OPEN_PROBES = int(os.getenv('CIRCUIT_HALF_OPEN_PROBES', '1'))
+# Fallback per model as model:fallback; other models fall back to LIGHTWEIGHT_MODEL
+CIRCUIT_FALLBACKS = os.getenv('CIRCUIT_FALLBACKS', '')
+LIGHTWEIGHT_MODEL = os.getenv('LIGHTWEIGHT_MODEL', 'glm-4.5-air')
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(OverloadedError):
+    """Raised when a model's circuit is open and so is its fallback's"""
+
+    def __init__(self, model, retry_after):
+        super().__init__(f"circuit:{model}", 'circuit open', retry_after, 503)
+        self.model = model
+
+
+def is_model_failure(error):
+    """Whether a failed call counts against the model's circuit
+
+    Server errors, timeouts and connection failures do; client errors such
+    as a bad request, a rejected key or a rate limit say nothing about the
+    model's health and do not.
+    """
+    status_code = getattr(error, 'status_code', None)
+    if status_code is not None:
+        return status_code >= 500
+    return isinstance(error, (APIConnectionError, httpx.TransportError, TimeoutError, ConnectionError))
+
+
+def parse_fallbacks(value):
+    """Parse model:fallback entries, comma separated"""
+    fallbacks = {}
+    for entry in value.split(','):
+        model, _, fallback = entry.strip().partition(':')
+        if model and fallback:
+            fallbacks[model] = fallback
+    return fallbacks
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker for one model
+
+    Closed, every call goes through and its outcome joins a window of the
+    last CIRCUIT_WINDOW calls; the circuit opens when the error rate or the
+    slow-call rate of the window crosses its threshold. Open, calls are
+    rejected for CIRCUIT_OPEN_SECONDS. Then up to CIRCUIT_HALF_OPEN_PROBES
+    probe calls go through: as many successes close the circuit, any failure
+    opens it again.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.state = CLOSED
+        self._lock = threading.Lock()
+        self._calls = deque(maxlen=CIRCUIT_WINDOW)
+        self._opened_at = 0.0
+        self._probes = []
+        self._probe_successes = 0
+        self.trip_reason = None
+        CIRCUIT_STATE.set(0, model=model)
+
+    def _transition(self, state, reason=None):
+        # Caller holds the lock
+        self.state = state
+        self._probes = []
+        self._probe_successes = 0
+        if state == OPEN:
+            self._opened_at = time.time()
+            self.trip_reason = reason
+        elif state == CLOSED:
+            self._calls.clear()
+            self.trip_reason = None
+        CIRCUIT_STATE.set(_STATE_VALUES[state], model=self.model)
+        CIRCUIT_TRANSITIONS_TOTAL.inc(model=self.model, state=state)
+        log = ai_service_logger.warning if state == OPEN else ai_service_logger.info
+        log(f"Circuit {state} - model: {self.model}" + (f", reason: {reason}" if reason else ""))
+
+    def allow(self):
+        """Return 'call' or 'probe' when a call may go through, None when it is rejected"""
+        with self._lock:
+            now = time.time()
+            if self.state == OPEN:
+                if now - self._opened_at < CIRCUIT_OPEN_SECONDS:
+                    return None
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                # A probe that never reported back (shed, abandoned) stops counting after a while
+                self._probes = [started for started in self._probes if now - started < CIRCUIT_OPEN_SECONDS]
+                if len(self._probes) >= CIRCUIT_HALF_OPEN_PROBES:
+                    return None
+                self._probes.append(now)
+                return 'probe'
+            return 'call'
+
+    def retry_after(self):
+        with self._lock:
+            remaining = CIRCUIT_OPEN_SECONDS - (time.time() - self._opened_at)
+        return max(1, int(remaining + 0.999))
+
+    def record(self, duration, ok, probe=False):
+        slow = bool(CIRCUIT_SLOW_CALL_SECONDS) and duration > CIRCUIT_SLOW_CALL_SECONDS
+        with self._lock:
+            if probe:
+                if self._probes:
+                    self._probes.pop(0)
+                if self.state != HALF_OPEN:
+                    return
+                if not ok or slow:
+                    self._transition(OPEN, f"half-open probe {'failed' if not ok else f'took {duration:.1f}s'}")
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= CIRCUIT_HALF_OPEN_PROBES:
+                    self._transition(CLOSED)
+                return
+
+            if self.state != CLOSED:
+                # A call that started before the circuit opened
+                return
+            self._calls.append((ok, slow))
+            if len(self._calls) < CIRCUIT_MIN_CALLS:
+                return
+            error_rate = sum(1 for call in self._calls if not call[0]) / len(self._calls)
+            slow_rate = sum(1 for call in self._calls if call[1]) / len(self._calls)
+            if error_rate >= CIRCUIT_ERROR_RATE:
+                self._transition(OPEN, f"error rate {error_rate:.0%} over the last {len(self._calls)} calls")
+            elif CIRCUIT_SLOW_CALL_SECONDS and slow_rate >= CIRCUIT_SLOW_CALL_RATE:
+                self._transition(OPEN, f"{slow_rate:.0%} of the last {len(self._calls)} calls slower than {CIRCUIT_SLOW_CALL_SECONDS:.0f}s")
+
+    def get_stats(self):
+        with self._lock:
+            calls = list(self._calls)
+            return {
+                'state': self.state,
+                'trip_reason': self.trip_reason,
+                'window_calls': len(calls),
+                'window_errors': sum(1 for call in calls if not call[0]),
+                'window_slow_calls': sum(1 for call in calls if call[1]),
+                'probes_in_flight': len(self._probes),
+                'open_seconds_remaining': max(0.0, CIRCUIT_OPEN_SECONDS - (time.time() - self._opened_at)) if self.state == OPEN else 0.0
+            }
+
+
+class CircuitBreakers:
+    """Per-model breakers and fallback routing, created on first use"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._breakers = {}
+        self.fallbacks = parse_fallbacks(CIRCUIT_FALLBACKS)
+        ai_service_logger.info(f"CircuitBreakers initialized - enabled: {CIRCUIT_BREAKER_ENABLED}, fallbacks: {self.fallbacks or 'none'} (default {LIGHTWEIGHT_MODEL})")
+
+    def breaker(self, model):
+        with self._lock:
+            breaker = self._breakers.get(model)
+            if breaker is None:
+                breaker = self._breakers[model] = CircuitBreaker(model)
+            return breaker
+
+    def route(self, model):
+        """Return (model to call, whether the call is a half-open probe)
+
+        A model with an open circuit is replaced by its fallback; raises
+        CircuitOpenError when the fallback's circuit is open too.
+        """
+        if not CIRCUIT_BREAKER_ENABLED:
+            return model, False
+        permit = self.breaker(model).allow()
+        if permit is not None:
+            return model, permit == 'probe'
+
+        fallback = self.fallbacks.get(model, LIGHTWEIGHT_MODEL)
+        if fallback and fallback != model:
+            permit = self.breaker(fallback).allow()
+            if permit is not None:
+                LLM_FALLBACK_TOTAL.inc(model=model, fallback=fallback)
+                ai_service_logger.warning(f"Circuit open for {model}, falling back to {fallback}")
+                return fallback, permit == 'probe'
+        raise CircuitOpenError(model, self.breaker(model).retry_after())
+
+    def record(self, model, duration, ok, probe=False):
+        if CIRCUIT_BREAKER_ENABLED:
+            self.breaker(model).record(duration, ok, probe)
+
+    def get_stats(self):
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {
+            'enabled': CIRCUIT_BREAKER_ENABLED,
+            'fallbacks': self.fallbacks,
+            'default_fallback': LIGHTWEIGHT_MODEL,
+            'models': {model: breaker.get_stats() for model, breaker in sorted(breakers.items())}
+        }
+
+
+circuit_breakers = CircuitBreakers()
@@ -0,0 +1,181 @@
+import os
+import gzip
+from logger import backend_logger
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+PRECOMPRESS_ENABLED = os.getenv('PRECOMPRESS_ENABLED', 'true').lower() == 'true'
+PRECOMPRESS_MIN_SIZE = int(os.getenv('PRECOMPRESS_MIN_SIZE', '1024'))
+# Keep the uncompressed file next to its compressed variants; when disabled
+# only the variants are stored and readers decompress on demand
+PRECOMPRESS_KEEP_ORIGINAL = os.getenv('PRECOMPRESS_KEEP_ORIGINAL', 'true').lower() == 'true'
+RESPONSE_COMPRESSION_ENABLED = os.getenv('RESPONSE_COMPRESSION_ENABLED', 'true').lower() == 'true'
+RESPONSE_COMPRESSION_MIN_SIZE = int(os.getenv('RESPONSE_COMPRESSION_MIN_SIZE', '1024'))
+
+# File suffix per content coding, in order of preference
+VARIANT_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+
+def supported_encodings():
+    """Content codings this process can produce, best first"""
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def compress(data, encoding, level=None):
+    """Compress bytes with the given content coding
+
+    Stored files use the maximum level since they are compressed once and
+    served many times; responses default to a cheaper level.
+    """
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=9 if level is None else level, mtime=0)
+    if encoding == 'br':
+        if brotli is None:
+            raise ValueError("brotli is not installed")
+        return brotli.compress(data, quality=11 if level is None else level)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def decompress(data, encoding):
+    if encoding == 'gzip':
+        return gzip.decompress(data)
+    if encoding == 'br':
+        if brotli is None:
+            raise ValueError("brotli is not installed")
+        return brotli.decompress(data)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def negotiate(accept_encodings, available):
+    """Pick the best content coding from a request's Accept-Encoding
+
+    accept_encodings is werkzeug's request.accept_encodings; available lists
+    the codings on offer, best first. Returns None for identity.
+    """
+    if not available:
+        return None
+    return accept_encodings.best_match(available)
+
+
+def precompress_file(filepath, data=None):
+    """Write compressed variants of a stored file (filepath + .gz / .br)
+
+    Returns the list of encodings written. Variants that do not shrink the
+    file are skipped. Without PRECOMPRESS_KEEP_ORIGINAL the original is
+    removed once a variant exists.
+    """
+    if not PRECOMPRESS_ENABLED:
+        return []
+
+    try:
+        if data is None:
+            with open(filepath, 'rb') as f:
+                data = f.read()
+        if len(data) < PRECOMPRESS_MIN_SIZE:
+            return []
+
+        written = []
+        for encoding in supported_encodings():
+            compressed = compress(data, encoding)
+            if len(compressed) >= len(data):
+                continue
+            variant_path = filepath + VARIANT_SUFFIXES[encoding]
+            tmp_path = f"{variant_path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(compressed)
+            os.replace(tmp_path, variant_path)
+            written.append(encoding)
+
+        if written and not PRECOMPRESS_KEEP_ORIGINAL and os.path.exists(filepath):
+            os.remove(filepath)
+
+        backend_logger.debug(f"Precompressed {filepath}: {len(data)} bytes, variants: {written}")
+        return written
+    except Exception as e:
+        backend_logger.error(f"Error precompressing {filepath}: {e}")
+        return []
+
+
+def available_variants(filepath):
+    """Map of encoding -> path for the compressed variants present on disk"""
+    variants = {}
+    for encoding in supported_encodings():
+        variant_path = filepath + VARIANT_SUFFIXES[encoding]
+        if os.path.exists(variant_path):
+            variants[encoding] = variant_path
+    return variants
+
+
+def stored_file_exists(filepath):
+    """True if the file or any compressed variant of it is stored"""
+    if os.path.exists(filepath):
+        return True
+    return any(os.path.exists(filepath + suffix) for suffix in VARIANT_SUFFIXES.values())
+
+
+def read_bytes(filepath):
+    """Read a stored file, transparently decompressing a variant if the original is gone"""
+    if os.path.exists(filepath):
+        with open(filepath, 'rb') as f:
+            return f.read()
+
+    for encoding, suffix in VARIANT_SUFFIXES.items():
+        variant_path = filepath + suffix
+        if os.path.exists(variant_path):
+            with open(variant_path, 'rb') as f:
+                return decompress(f.read(), encoding)
+
+    raise FileNotFoundError(filepath)
+
+
+def read_text(filepath):
+    return read_bytes(filepath).decode('utf-8')
+
+
+def stored_path(filepath):
+    """Path actually holding the file: the original or, if it was removed, a variant"""
+    for path in [filepath] + [filepath + suffix for suffix in VARIANT_SUFFIXES.values()]:
+        if os.path.exists(path):
+            return path
+    raise FileNotFoundError(filepath)
+
+
+def remove_stored_file(filepath):
+    """Remove a stored file together with its compressed variants"""
+    for path in [filepath] + [filepath + suffix for suffix in VARIANT_SUFFIXES.values()]:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def compress_response(response, accept_encodings):
+    """Compress a buffered Flask response in place when the client accepts it
+
+    Streamed, file and already encoded responses are left alone. A strong
+    ETag is weakened since it no longer identifies the exact bytes sent.
+    """
+    if not RESPONSE_COMPRESSION_ENABLED:
+        return response
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in ('application/json', 'text/html', 'text/plain')):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < RESPONSE_COMPRESSION_MIN_SIZE:
+        return response
+
+    encoding = negotiate(accept_encodings, supported_encodings())
+    if encoding is None:
+        return response
+
+    response.set_data(compress(data, encoding, level=5 if encoding == 'br' else 6))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,124 @@
+import os
+import time
+import contextvars
+from contextlib import contextmanager
+import httpx
+from logger import backend_logger
+from metrics import DEADLINE_EXCEEDED_TOTAL
+
+# Deadline in seconds per endpoint as endpoint:seconds, applied when the caller does not pass one
+DEADLINE_DEFAULTS = os.getenv('DEADLINE_DEFAULTS', 'generate:60,generate_stream:120,generate_quant_trade_strategy:300')
+# Upper bound for deadlines passed by callers
+DEADLINE_MAX_SECONDS = float(os.getenv('DEADLINE_MAX_SECONDS', '600'))
+
+# Socket timeouts capped at the remaining time can fire a hair before the deadline
+_CLOCK_SLACK = 0.01
+
+_deadline = contextvars.ContextVar('deadline', default=None)
+
+
+class DeadlineExceededError(Exception):
+    """Raised when a request's deadline passes; stage names where work was abandoned"""
+
+    def __init__(self, stage):
+        super().__init__(f"Deadline exceeded during {stage}")
+        self.stage = stage
+
+
+def parse_defaults(value):
+    """Parse endpoint:seconds entries, comma separated"""
+    defaults = {}
+    for entry in value.split(','):
+        endpoint, _, seconds = entry.strip().partition(':')
+        if endpoint and seconds:
+            defaults[endpoint] = float(seconds)
+    return defaults
+
+
+_defaults = parse_defaults(DEADLINE_DEFAULTS)
+
+
+def request_timeout(endpoint, requested=None):
+    """Seconds a request may take: the caller's value capped at DEADLINE_MAX_SECONDS,
+    else the endpoint default, else None for no deadline"""
+    if requested is not None:
+        try:
+            seconds = float(requested)
+            if seconds > 0:
+                return min(seconds, DEADLINE_MAX_SECONDS)
+        except (TypeError, ValueError):
+            pass
+        backend_logger.warning(f"Ignoring invalid request timeout '{requested}' for {endpoint}")
+    return _defaults.get(endpoint)
+
+
+@contextmanager
+def deadline_scope(seconds):
+    """Run the with-block under a deadline seconds from now
+
+    A scope nested in another keeps the earlier of the two deadlines;
+    seconds=None keeps the current one. Thread pools that run work through
+    tracing.wrap carry the deadline along with the tracing context.
+    """
+    if seconds is None:
+        yield
+        return
+    deadline_at = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        deadline_at = min(deadline_at, current)
+    token = _deadline.set(deadline_at)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time():
+    """Seconds left before the current deadline (negative once passed), or None without one"""
+    deadline_at = _deadline.get()
+    if deadline_at is None:
+        return None
+    return deadline_at - time.monotonic()
+
+
+def deadline_passed():
+    remaining = remaining_time()
+    return remaining is not None and remaining <= _CLOCK_SLACK
+
+
+def deadline_exceeded(stage):
+    """Count and log an exceeded deadline, returning the error to raise"""
+    DEADLINE_EXCEEDED_TOTAL.inc(stage=stage)
+    backend_logger.warning(f"Deadline exceeded - stage: {stage}")
+    return DeadlineExceededError(stage)
+
+
+def check_deadline(stage):
+    """Raise DeadlineExceededError when the current deadline has passed"""
+    if deadline_passed():
+        raise deadline_exceeded(stage)
+
+
+def stage_timeout(default, stage):
+    """Time a stage may take: default capped at the time left before the deadline
+
+    Raises DeadlineExceededError when no time is left.
+    """
+    check_deadline(stage)
+    remaining = remaining_time()
+    if remaining is None:
+        return default
+    return min(default, remaining) if default else remaining
+
+
+def cap_http_timeout(timeout):
+    """Cap every phase of an httpx.Timeout at the time left before the deadline"""
+    remaining = remaining_time()
+    if remaining is None:
+        return timeout
+    remaining = max(remaining, 0.001)
+
+    def cap(value):
+        return remaining if value is None else min(value, remaining)
+    return httpx.Timeout(connect=cap(timeout.connect), read=cap(timeout.read), write=cap(timeout.write), pool=cap(timeout.pool))
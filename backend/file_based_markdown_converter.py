@@ -1,13 +1,17 @@
 import os
-import subprocess
 import re
 from datetime import datetime
 from logger import ai_service_logger
+import compression
+from metrics import RENDER_SECONDS, SVG_EXTRACTION_SECONDS, FILE_WRITE_SECONDS, ERRORS_TOTAL
+from tracing import start_span
+from markdown_renderer import create_renderer
+from deadlines import DeadlineExceededError, check_deadline
 
 class FileBasedMarkdownConverter:
-    """File-based Markdown to HTML converter using pandoc"""
+    """File-based Markdown to HTML converter with pluggable renderers (in-process or pandoc)"""
 
-    def __init__(self, data_dir="../Data"):
+    def __init__(self, data_dir="../Data", renderer=None):
         self.data_dir = data_dir
         self.markdown_dir = os.path.join(data_dir, "markdown")
         self.html_dir = os.path.join(data_dir, "html_files")
@@ -19,7 +23,9 @@ class FileBasedMarkdownConverter:
         os.makedirs(self.html_dir, exist_ok=True)
         os.makedirs(self.svg_dir, exist_ok=True)
 
-        ai_service_logger.info(f"FileBasedMarkdownConverter initialized - markdown_dir: {self.markdown_dir}, html_dir: {self.html_dir}, svg_dir: {self.svg_dir}")
+        self.renderer = renderer or create_renderer()
+
+        ai_service_logger.info(f"FileBasedMarkdownConverter initialized - markdown_dir: {self.markdown_dir}, html_dir: {self.html_dir}, svg_dir: {self.svg_dir}, renderer: {self.renderer.name}")
 
     def _extract_svg_content(self, content):
         """Extract SVG content from markdown and replace with file references"""
@@ -68,23 +74,35 @@ class FileBasedMarkdownConverter:
 
     def save_markdown_file(self, content, prompt_type=None, original_input=None, need_svg_extraction=False):
         """Save markdown content to a file and return file info"""
+        file_info, _ = self.save_markdown(content, prompt_type, original_input, need_svg_extraction)
+        return file_info
+
+    def save_markdown(self, content, prompt_type=None, original_input=None, need_svg_extraction=False):
+        """Save markdown content to a file
+
+        Returns (file_info, saved_content) where saved_content is the markdown as
+        written to disk (after SVG extraction), so it can be rendered without
+        reading the file back. Returns (None, None) on failure.
+        """
         try:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             random_suffix = os.urandom(4).hex()[:8]
             filename = f"markdown_{timestamp}_{random_suffix}.md"
             filepath = os.path.join(self.markdown_dir, filename)
-            filelen = len(content)
+            processed_content = content
             extracted_svgs = []
 
             if need_svg_extraction:
                 # Extract SVG content and replace with file references
-                processed_content, extracted_svgs = self._extract_svg_content(content)
-                filelen = len(processed_content)
-                with open(filepath, 'w', encoding='utf-8') as f:
-                    f.write(processed_content)
-            else:
-                with open(filepath, 'w', encoding='utf-8') as f:
-                    f.write(content)
+                with SVG_EXTRACTION_SECONDS.time(), start_span('svg.extract') as span:
+                    processed_content, extracted_svgs = self._extract_svg_content(content)
+                    span.set_attribute('svg_count', len(extracted_svgs))
+
+            content_bytes = processed_content.encode('utf-8')
+            with FILE_WRITE_SECONDS.time(kind='markdown'), start_span('file.write', kind='markdown'):
+                with open(filepath, 'wb') as f:
+                    f.write(content_bytes)
+                compression.precompress_file(filepath, content_bytes)
 
             file_info = {
                 'filename': filename,
@@ -92,25 +110,34 @@ class FileBasedMarkdownConverter:
                 'prompt_type': prompt_type,
                 'original_input': original_input,
                 'created_at': datetime.now().isoformat(),
-                'size': filelen,
+                'size': len(processed_content),
                 'extracted_svgs': extracted_svgs
             }
 
             ai_service_logger.info(f"Markdown file saved: {filename}, size: {len(processed_content)}, extracted_svgs: {len(extracted_svgs)}")
-            return file_info
+            return file_info, processed_content
 
         except Exception as e:
             ai_service_logger.error(f"Error saving markdown file: {e}")
-            return None
+            return None, None
 
-    def convert_markdown_to_html(self, markdown_file_info, title="AI Generated Content"):
-        """Convert markdown file to HTML using pandoc"""
+    def convert_markdown_to_html(self, markdown_file_info, title="AI Generated Content", markdown_content=None):
+        """Convert markdown file to HTML using the configured renderer
+
+        markdown_content, when given, is the saved markdown already in memory and
+        lets in-process renderers skip reading the file back.
+        """
         try:
+            check_deadline('markdown.render')
             markdown_filepath = markdown_file_info['filepath']
 
-            if not os.path.exists(markdown_filepath):
-                ai_service_logger.error(f"Markdown file not found: {markdown_filepath}")
-                return None
+            if markdown_content is None:
+                if not compression.stored_file_exists(markdown_filepath):
+                    ai_service_logger.error(f"Markdown file not found: {markdown_filepath}")
+                    return None, None
+                if not os.path.exists(markdown_filepath):
+                    # Only the compressed variants are stored
+                    markdown_content = compression.read_text(markdown_filepath)
 
             # Generate HTML filename
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -118,57 +145,48 @@ class FileBasedMarkdownConverter:
             html_filename = f"html_{timestamp}_{random_suffix}.html"
             html_filepath = os.path.join(self.html_dir, html_filename)
 
-            # Use pandoc to convert
-            cmd =[
-                "../trans_markdown.sh",
-                markdown_filepath,
-                html_filepath
-            ]
-
-            ai_service_logger.info(f"Running pandoc command: {' '.join(cmd)}")
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-
-            if result.returncode == 0:
-                # Read the converted HTML content
-                with open(html_filepath, 'r', encoding='utf-8') as f:
-                    html_content = f.read()
-
-                html_file_info = {
-                    'filename': html_filename,
-                    'filepath': html_filepath,
-                    'title': title,
-                    'source_markdown': markdown_file_info['filename'],
-                    'prompt_type': markdown_file_info['prompt_type'],
-                    'original_input': markdown_file_info['original_input'],
-                    'created_at': datetime.now().isoformat(),
-                    'size': len(html_content)
-                }
+            with RENDER_SECONDS.time(renderer=self.renderer.name), start_span('markdown.render', renderer=self.renderer.name):
+                html_content = self.renderer.render_to_file(markdown_content, markdown_filepath, html_filepath, title)
+            compression.precompress_file(html_filepath, html_content.encode('utf-8'))
+
+            html_file_info = {
+                'filename': html_filename,
+                'filepath': html_filepath,
+                'title': title,
+                'source_markdown': markdown_file_info['filename'],
+                'prompt_type': markdown_file_info['prompt_type'],
+                'original_input': markdown_file_info['original_input'],
+                'created_at': datetime.now().isoformat(),
+                'size': len(html_content),
+                'renderer': self.renderer.name
+            }
 
-                ai_service_logger.info(f"Markdown converted to HTML: {html_filename}, source: {markdown_file_info['filename']}")
-                return html_file_info, html_content
-            else:
-                ai_service_logger.error(f"Pandoc conversion failed: {result.stderr}")
-                return None, None
+            ai_service_logger.info(f"Markdown converted to HTML: {html_filename}, source: {markdown_file_info['filename']}, renderer: {self.renderer.name}")
+            return html_file_info, html_content
 
-        except subprocess.TimeoutExpired:
-            ai_service_logger.error("Pandoc conversion timed out")
-            return None, None
+        except DeadlineExceededError:
+            raise
         except Exception as e:
             ai_service_logger.error(f"Error converting markdown to HTML: {e}")
+            ERRORS_TOTAL.inc(component='render')
             return None, None
 
+    def get_renderer_stats(self):
+        """Get statistics of the configured renderer"""
+        return self.renderer.get_stats()
+
     def process_markdown_content(self, content, prompt_type=None, original_input=None, title=None):
         """Complete workflow: save markdown, convert to HTML, return results"""
         if not title:
             title = f"AI Generated Content - {prompt_type or 'Default'}"
 
         # Step 1: Save markdown file
-        markdown_file_info = self.save_markdown_file(content, prompt_type, original_input)
+        markdown_file_info, saved_content = self.save_markdown(content, prompt_type, original_input)
         if not markdown_file_info:
             return None, None
 
         # Step 2: Convert to HTML
-        html_file_info, html_content = self.convert_markdown_to_html(markdown_file_info, title)
+        html_file_info, html_content = self.convert_markdown_to_html(markdown_file_info, title, saved_content)
         if not html_file_info:
             return markdown_file_info, None
 
@@ -178,9 +196,8 @@ class FileBasedMarkdownConverter:
         """Get markdown file content"""
         try:
             filepath = os.path.join(self.markdown_dir, filename)
-            if os.path.exists(filepath):
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    content = f.read()
+            if compression.stored_file_exists(filepath):
+                content = compression.read_text(filepath)
                 return {
                     'filename': filename,
                     'filepath': filepath,
@@ -195,17 +212,26 @@ class FileBasedMarkdownConverter:
         """Get list of all markdown files"""
         try:
             files = []
+            # A markdown file may be stored only as compressed variants
+            filenames = set()
             for filename in os.listdir(self.markdown_dir):
+                for suffix in compression.VARIANT_SUFFIXES.values():
+                    if filename.endswith(suffix):
+                        filename = filename[:-len(suffix)]
+                        break
                 if filename.endswith('.md'):
-                    filepath = os.path.join(self.markdown_dir, filename)
-                    stat = os.stat(filepath)
-                    files.append({
-                        'filename': filename,
-                        'filepath': filepath,
-                        'size': stat.st_size,
-                        'created_at': datetime.fromtimestamp(stat.st_ctime).isoformat(),
-                        'modified_at': datetime.fromtimestamp(stat.st_mtime).isoformat()
-                    })
+                    filenames.add(filename)
+
+            for filename in filenames:
+                filepath = os.path.join(self.markdown_dir, filename)
+                stat = os.stat(compression.stored_path(filepath))
+                files.append({
+                    'filename': filename,
+                    'filepath': filepath,
+                    'size': stat.st_size,
+                    'created_at': datetime.fromtimestamp(stat.st_ctime).isoformat(),
+                    'modified_at': datetime.fromtimestamp(stat.st_mtime).isoformat()
+                })
             return sorted(files, key=lambda x: x['created_at'], reverse=True)
         except Exception as e:
             ai_service_logger.error(f"Error listing markdown files: {e}")
@@ -0,0 +1,217 @@
+import os
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from functools import partial
+from logger import ai_service_logger
+from metrics import percentile, LLM_CALL_SECONDS, HEDGED_CALLS_TOTAL, HEDGE_EXTRA_TOKENS_TOTAL
+from admission import OverloadedError
+import tracing
+
+HEDGING_ENABLED = os.getenv('HEDGING_ENABLED', 'false').lower() == 'true'
+# A call still running at this percentile of its observed latency is duplicated
+HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', '95'))
+# Endpoints whose LLM calls may be hedged, as endpoint or endpoint:percentile
+HEDGE_ENDPOINTS = os.getenv('HEDGE_ENDPOINTS', 'generate,generate_quant_trade_strategy')
+# Models that may be hedged, as model or model:percentile (0 disables); empty allows every model
+HEDGE_MODELS = os.getenv('HEDGE_MODELS', '')
+HEDGE_MIN_SAMPLES = int(os.getenv('HEDGE_MIN_SAMPLES', '20'))
+HEDGE_MIN_DELAY = float(os.getenv('HEDGE_MIN_DELAY', '0.5'))
+# Tokens spent on losing attempts may not exceed this share of all LLM tokens
+HEDGE_MAX_EXTRA_TOKEN_RATIO = float(os.getenv('HEDGE_MAX_EXTRA_TOKEN_RATIO', '0.05'))
+HEDGE_MAX_WORKERS = int(os.getenv('HEDGE_MAX_WORKERS', '16'))
+
+_current_endpoint = contextvars.ContextVar('hedging_endpoint', default=None)
+
+
+@contextmanager
+def endpoint_scope(endpoint):
+    """Mark LLM calls made in the with-block as made on behalf of an endpoint"""
+    token = _current_endpoint.set(endpoint)
+    try:
+        yield
+    finally:
+        _current_endpoint.reset(token)
+
+
+def parse_policies(value):
+    """Parse name or name:percentile entries, comma separated; None means the default percentile"""
+    policies = {}
+    for entry in value.split(','):
+        name, _, pct = entry.strip().partition(':')
+        if name:
+            policies[name] = float(pct) if pct else None
+    return policies
+
+
+def _response_tokens(response):
+    usage = getattr(response, 'usage', None)
+    return getattr(usage, 'total_tokens', None) or 0
+
+
+class Hedger:
+    """Duplicates slow chat completions and keeps the first response
+
+    A hedge-eligible call runs on the hedging pool. If it has not returned
+    after the observed latency percentile of its model and prompt_type, a
+    second identical call is sent, but only when the model has a free
+    concurrency slot and the extra-token budget allows it. The first
+    successful response is returned. A losing attempt that has not started
+    is cancelled; one already in flight cannot be aborted by the synchronous
+    client, so it is abandoned and its tokens are charged to the budget.
+
+    The budget caps the tokens of losing attempts at
+    HEDGE_MAX_EXTRA_TOKEN_RATIO of all tokens, with the expected cost of
+    each in-flight hedge reserved up front.
+    """
+
+    def __init__(self):
+        self.endpoints = parse_policies(HEDGE_ENDPOINTS)
+        self.models = parse_policies(HEDGE_MODELS)
+        self.executor = ThreadPoolExecutor(max_workers=HEDGE_MAX_WORKERS, thread_name_prefix='llm-hedge')
+        self._lock = threading.Lock()
+        self._attempts = 0
+        self._avg_tokens = {}
+        self.total_tokens = 0
+        self.extra_tokens = 0
+        self.reserved_tokens = 0
+        self.outcomes = {'not_needed': 0, 'primary_won': 0, 'hedge_won': 0, 'failed': 0,
+                         'skipped_budget': 0, 'skipped_no_slot': 0, 'skipped_busy': 0}
+        ai_service_logger.info(f"Hedger initialized - enabled: {HEDGING_ENABLED}, endpoints: {self.endpoints}, models: {self.models or 'all'}, percentile: {HEDGE_PERCENTILE}")
+
+    def delay(self, model, prompt_type):
+        """Seconds after which a call should be hedged, or None if it is not hedged"""
+        if not HEDGING_ENABLED:
+            return None
+        endpoint = _current_endpoint.get()
+        if endpoint not in self.endpoints:
+            return None
+        if self.models and model not in self.models:
+            return None
+
+        # The endpoint's percentile wins over the model's
+        pct = self.endpoints[endpoint]
+        if pct is None:
+            pct = self.models.get(model)
+        if pct is None:
+            pct = HEDGE_PERCENTILE
+        if not pct:
+            return None
+
+        latencies = LLM_CALL_SECONDS.recent(model=model, prompt_type=prompt_type or 'default')
+        if len(latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return max(HEDGE_MIN_DELAY, percentile(latencies, pct))
+
+    def record_tokens(self, prompt_type, tokens):
+        """Count tokens of every LLM call; the budget is a share of this total"""
+        if not tokens:
+            return
+        key = prompt_type or 'default'
+        with self._lock:
+            self.total_tokens += tokens
+            average = self._avg_tokens.get(key)
+            self._avg_tokens[key] = tokens if average is None else average + (tokens - average) * 0.1
+
+    def _count(self, model, outcome):
+        with self._lock:
+            self.outcomes[outcome] += 1
+        HEDGED_CALLS_TOTAL.inc(model=model, outcome=outcome)
+
+    def _reserve(self, prompt_type):
+        """Reserve the expected cost of a hedge, or return None when over budget"""
+        key = prompt_type or 'default'
+        with self._lock:
+            cost = int(round(self._avg_tokens.get(key, 0)))
+            if self.extra_tokens + self.reserved_tokens + cost > HEDGE_MAX_EXTRA_TOKEN_RATIO * self.total_tokens:
+                return None
+            self.reserved_tokens += cost
+            return cost
+
+    def _settle(self, model, cost, future=None):
+        """Replace a reservation with what the losing attempt actually spent"""
+        tokens = 0
+        if future is not None and not future.cancelled() and future.exception() is None:
+            tokens = _response_tokens(future.result())
+        with self._lock:
+            self.reserved_tokens -= cost
+            self.extra_tokens += tokens
+        if tokens:
+            HEDGE_EXTRA_TOKENS_TOTAL.inc(tokens, model=model)
+
+    def _attempt_done(self, future):
+        with self._lock:
+            self._attempts -= 1
+
+    def _submit(self, attempt, hedge):
+        with self._lock:
+            self._attempts += 1
+        future = self.executor.submit(tracing.wrap(attempt), hedge)
+        future.add_done_callback(self._attempt_done)
+        return future
+
+    def run(self, model, prompt_type, delay, attempt):
+        """Run attempt(hedge) once, and again with hedge=True if it is still running after delay"""
+        with self._lock:
+            busy = self._attempts + 2 > HEDGE_MAX_WORKERS
+        if busy:
+            self._count(model, 'skipped_busy')
+            return attempt(False)
+
+        primary = self._submit(attempt, False)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            self._count(model, 'not_needed')
+            return primary.result()
+
+        cost = self._reserve(prompt_type)
+        if cost is None:
+            self._count(model, 'skipped_budget')
+            return primary.result()
+
+        ai_service_logger.info(f"Hedging LLM call - model: {model}, prompt_type: {prompt_type}, after: {delay:.2f}s")
+        hedge = self._submit(attempt, True)
+        winner = None
+        pending = {primary, hedge}
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            # On a tie the primary wins
+            for future in (primary, hedge):
+                if future in done and future.exception() is None:
+                    winner = future
+                    break
+
+        if hedge.done() and isinstance(hedge.exception(), OverloadedError):
+            outcome = 'skipped_no_slot'
+        elif winner is None:
+            outcome = 'failed'
+        else:
+            outcome = 'hedge_won' if winner is hedge else 'primary_won'
+        self._count(model, outcome)
+
+        if winner is None:
+            self._settle(model, cost)
+            return primary.result()
+        loser = primary if winner is hedge else hedge
+        loser.cancel()
+        loser.add_done_callback(partial(self._settle, model, cost))
+        return winner.result()
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'enabled': HEDGING_ENABLED,
+                'endpoints': self.endpoints,
+                'models': self.models,
+                'percentile': HEDGE_PERCENTILE,
+                'max_extra_token_ratio': HEDGE_MAX_EXTRA_TOKEN_RATIO,
+                'total_tokens': self.total_tokens,
+                'extra_tokens': self.extra_tokens,
+                'reserved_tokens': self.reserved_tokens,
+                'attempts_in_flight': self._attempts,
+                'outcomes': dict(self.outcomes)
+            }
+
+
+hedger = Hedger()
@@ -1,45 +1,174 @@
 import os
-import json
 import re
+import json
 import uuid
+import base64
+import bisect
+import hashlib
+import threading
 from datetime import datetime
 from logger import backend_logger
+import compression
+from metadata_store import create_metadata_store
+from metrics import FILE_WRITE_SECONDS
+from tracing import start_span
+
+class HtmlFileIndex:
+    """Pre-sorted in-memory index of HTML file summaries
+
+    Keeps (created_at, file_id) keys sorted overall and per prompt type, updated
+    incrementally on save and delete, so a page of the listing is a bisect plus
+    a short walk instead of a full rebuild and sort.
+    """
+
+    SUMMARY_FIELDS = ('file_id', 'filename', 'prompt_type', 'created_at', 'content_length', 'original_input')
+    PREVIEW_LENGTH = 100
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = []
+        self._keys_by_prompt = {}
+        self._summaries = {}
+
+    def load(self, entries):
+        """Build the index from metadata entries"""
+        with self._lock:
+            self._keys = []
+            self._keys_by_prompt = {}
+            self._summaries = {}
+            for entry in entries:
+                self._summaries[entry['file_id']] = self._summarize(entry)
+            for summary in self._summaries.values():
+                key = (summary['created_at'], summary['file_id'])
+                self._keys.append(key)
+                self._keys_by_prompt.setdefault(self._prompt_key(summary['prompt_type']), []).append(key)
+            self._keys.sort()
+            for keys in self._keys_by_prompt.values():
+                keys.sort()
+
+    def add(self, entry):
+        with self._lock:
+            if entry['file_id'] in self._summaries:
+                self._remove(entry['file_id'])
+            summary = self._summarize(entry)
+            key = (summary['created_at'], summary['file_id'])
+            self._summaries[summary['file_id']] = summary
+            bisect.insort(self._keys, key)
+            bisect.insort(self._keys_by_prompt.setdefault(self._prompt_key(summary['prompt_type']), []), key)
+
+    def remove(self, file_id):
+        with self._lock:
+            self._remove(file_id)
+
+    def _remove(self, file_id):
+        summary = self._summaries.pop(file_id, None)
+        if not summary:
+            return
+        key = (summary['created_at'], file_id)
+        for keys in (self._keys, self._keys_by_prompt.get(self._prompt_key(summary['prompt_type']), [])):
+            position = bisect.bisect_left(keys, key)
+            if position < len(keys) and keys[position] == key:
+                del keys[position]
+
+    def __len__(self):
+        return len(self._summaries)
+
+    def query(self, limit, cursor=None, prompt_type=None, created_after=None, created_before=None,
+              min_size=None, max_size=None):
+        """Return (summaries, next_cursor), newest first
+
+        created_after is inclusive and created_before exclusive; both are ISO
+        dates or timestamps, such as 2025-01-31. Raises ValueError for a bad
+        limit, date or cursor.
+        """
+        if limit < 1:
+            raise ValueError(f"Invalid limit: {limit}, must be at least 1")
+        created_after = self._parse_timestamp('created_after', created_after)
+        created_before = self._parse_timestamp('created_before', created_before)
+
+        with self._lock:
+            keys = self._keys if prompt_type is None else self._keys_by_prompt.get(self._prompt_key(prompt_type), [])
+
+            upper = len(keys)
+            if cursor is not None:
+                upper = bisect.bisect_left(keys, self.decode_cursor(cursor))
+            if created_before:
+                upper = min(upper, bisect.bisect_left(keys, (created_before, '')))
+            lower = bisect.bisect_left(keys, (created_after, '')) if created_after else 0
+
+            results = []
+            position = upper - 1
+            while position >= lower and len(results) <= limit:
+                summary = self._summaries[keys[position][1]]
+                size = summary['content_length'] or 0
+                if (min_size is None or size >= min_size) and (max_size is None or size <= max_size):
+                    results.append(summary)
+                position -= 1
+
+        next_cursor = None
+        if len(results) > limit:
+            results = results[:limit]
+            last = results[-1]
+            next_cursor = self.encode_cursor((last['created_at'], last['file_id']))
+        return [dict(summary) for summary in results], next_cursor
+
+    def _summarize(self, entry):
+        original_input = entry.get('original_input') or ''
+        if len(original_input) > self.PREVIEW_LENGTH:
+            original_input = original_input[:self.PREVIEW_LENGTH] + '...'
+        return {
+            'file_id': entry['file_id'],
+            'filename': entry['filename'],
+            'prompt_type': entry.get('prompt_type'),
+            'created_at': entry['created_at'],
+            'content_length': entry.get('content_length'),
+            'original_input': original_input
+        }
+
+    @staticmethod
+    def _parse_timestamp(name, value):
+        """Normalize an ISO date or timestamp to the local-time format of created_at"""
+        if value is None:
+            return None
+        try:
+            timestamp = datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid {name}: {value}, expected an ISO date such as 2025-01-31")
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone().replace(tzinfo=None)
+        return timestamp.isoformat()
+
+    def _prompt_key(self, prompt_type):
+        return prompt_type or 'default'
+
+    @staticmethod
+    def encode_cursor(key):
+        raw = json.dumps(list(key), ensure_ascii=False).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            created_at, file_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            return (str(created_at), str(file_id))
+        except Exception:
+            raise ValueError(f"Invalid cursor: {cursor}")
+
 
 class HTMLManager:
     def __init__(self, data_dir='../Data/html_files'):
         self.data_dir = data_dir
-        self.metadata_file = os.path.join(data_dir, 'metadata.json')
         self._ensure_directories()
-        self._load_metadata()
+        self.metadata_store = create_metadata_store(data_dir)
+        self.file_index = HtmlFileIndex()
+        self.file_index.load(self.metadata_store.list_all())
+        backend_logger.info(f"HTML file index built with {len(self.file_index)} entries")
 
     def _ensure_directories(self):
         """Ensure the data directory exists"""
         os.makedirs(self.data_dir, exist_ok=True)
         backend_logger.info(f"HTML data directory: {self.data_dir}")
 
-    def _load_metadata(self):
-        """Load existing metadata or create new"""
-        if os.path.exists(self.metadata_file):
-            try:
-                with open(self.metadata_file, 'r', encoding='utf-8') as f:
-                    self.metadata = json.load(f)
-                backend_logger.info(f"Loaded metadata for {len(self.metadata)} HTML files")
-            except Exception as e:
-                backend_logger.error(f"Error loading metadata: {e}")
-                self.metadata = {}
-        else:
-            self.metadata = {}
-            self._save_metadata()
-
-    def _save_metadata(self):
-        """Save metadata to file"""
-        try:
-            with open(self.metadata_file, 'w', encoding='utf-8') as f:
-                json.dump(self.metadata, f, ensure_ascii=False, indent=2)
-            backend_logger.debug("Metadata saved successfully")
-        except Exception as e:
-            backend_logger.error(f"Error saving metadata: {e}")
-
     def is_html_content(self, content):
         """Check if content is HTML format"""
         # Check for HTML tags
@@ -98,8 +227,11 @@ class HTMLManager:
 
         # Save HTML content to file
         try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(clean_content)
+            content_bytes = clean_content.encode('utf-8')
+            with FILE_WRITE_SECONDS.time(kind='html'), start_span('file.write', kind='html'):
+                with open(filepath, 'wb') as f:
+                    f.write(content_bytes)
+                compression.precompress_file(filepath, content_bytes)
 
             # Create metadata entry
             metadata_entry = {
@@ -109,11 +241,12 @@ class HTMLManager:
                 'prompt_type': prompt_type,
                 'original_input': original_input,
                 'created_at': datetime.now().isoformat(),
-                'content_length': len(clean_content)
+                'content_length': len(clean_content),
+                'content_hash': hashlib.sha256(content_bytes).hexdigest()
             }
 
-            self.metadata[file_id] = metadata_entry
-            self._save_metadata()
+            self.metadata_store.put(metadata_entry)
+            self.file_index.add(metadata_entry)
 
             backend_logger.info(f"HTML content saved: {filename} (ID: {file_id})")
             return metadata_entry
@@ -124,16 +257,15 @@ class HTMLManager:
 
     def get_html_file(self, file_id):
         """Get HTML file content and metadata"""
-        if file_id not in self.metadata:
+        metadata = self.metadata_store.get(file_id)
+        if not metadata:
             backend_logger.warning(f"HTML file not found: {file_id}")
             return None
 
-        metadata = self.metadata[file_id]
         filepath = metadata['filepath']
 
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                content = f.read()
+            content = compression.read_text(filepath)
 
             return {
                 'metadata': metadata,
@@ -143,40 +275,76 @@ class HTMLManager:
             backend_logger.error(f"Error reading HTML file {file_id}: {e}")
             return None
 
+    def html_file_exists(self, file_id):
+        """Check that a file still has metadata and a stored copy on disk"""
+        metadata = self.metadata_store.get(file_id)
+        return bool(metadata) and compression.stored_file_exists(metadata['filepath'])
+
+    def get_html_file_for_serving(self, file_id):
+        """Get metadata with an absolute filepath and content_hash for streaming the file
+
+        Pages never change after creation, so the hash is computed at save time;
+        entries saved before hashes were recorded are hashed once here.
+        """
+        metadata = self.metadata_store.get(file_id)
+        if not metadata:
+            backend_logger.warning(f"HTML file not found: {file_id}")
+            return None
+
+        filepath = os.path.abspath(metadata['filepath'])
+        if not compression.stored_file_exists(filepath):
+            backend_logger.error(f"HTML file missing on disk for {file_id}: {filepath}")
+            return None
+
+        if not metadata.get('content_hash'):
+            metadata['content_hash'] = hashlib.sha256(compression.read_bytes(filepath)).hexdigest()
+            self.metadata_store.put(metadata)
+            backend_logger.info(f"Recorded content hash for legacy HTML file {file_id}")
+
+        return dict(metadata, filepath=filepath)
+
     def get_all_html_files(self):
         """Get list of all HTML files"""
-        files = []
-        for file_id, metadata in self.metadata.items():
-            files.append({
-                'file_id': file_id,
-                'filename': metadata['filename'],
-                'prompt_type': metadata['prompt_type'],
-                'created_at': metadata['created_at'],
-                'content_length': metadata['content_length'],
-                'original_input': metadata.get('original_input', '')[:100] + '...' if len(metadata.get('original_input', '')) > 100 else metadata.get('original_input', '')
-            })
-
-        # Sort by creation time (newest first)
-        files.sort(key=lambda x: x['created_at'], reverse=True)
+        if not len(self.file_index):
+            return []
+        files, _ = self.file_index.query(len(self.file_index))
         return files
 
+    def list_html_files(self, limit=50, cursor=None, prompt_type=None, created_after=None,
+                        created_before=None, min_size=None, max_size=None, fields=None):
+        """Get one page of HTML files, newest first
+
+        Returns (files, next_cursor); next_cursor is None on the last page.
+        fields optionally restricts each entry to the given summary fields.
+        """
+        if fields:
+            unknown = set(fields) - set(HtmlFileIndex.SUMMARY_FIELDS)
+            if unknown:
+                raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+
+        files, next_cursor = self.file_index.query(
+            limit, cursor, prompt_type, created_after, created_before, min_size, max_size
+        )
+        if fields:
+            files = [{field: entry[field] for field in fields} for entry in files]
+        return files, next_cursor
+
     def delete_html_file(self, file_id):
         """Delete HTML file and its metadata"""
-        if file_id not in self.metadata:
+        metadata = self.metadata_store.get(file_id)
+        if not metadata:
             backend_logger.warning(f"HTML file not found for deletion: {file_id}")
             return False
 
-        metadata = self.metadata[file_id]
         filepath = metadata['filepath']
 
         try:
-            # Delete file
-            if os.path.exists(filepath):
-                os.remove(filepath)
+            # Delete file and its compressed variants
+            compression.remove_stored_file(filepath)
 
             # Remove from metadata
-            del self.metadata[file_id]
-            self._save_metadata()
+            self.metadata_store.delete(file_id)
+            self.file_index.remove(file_id)
 
             backend_logger.info(f"HTML file deleted: {file_id}")
             return True
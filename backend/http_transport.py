@@ -0,0 +1,199 @@
+import os
+import time
+import threading
+import httpx
+from zai import ZhipuAiClient
+from logger import backend_logger
+import cassette
+from deadlines import cap_http_timeout, deadline_passed
+
+
+class PoolStats:
+    """Thread-safe counters for the shared HTTP connection pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.reused_connections = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.errors = 0
+        self.timeouts = 0
+
+    def record(self, new_connection, wait_time):
+        with self._lock:
+            self.requests += 1
+            if new_connection:
+                self.new_connections += 1
+            else:
+                self.reused_connections += 1
+            self.total_wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+
+    def record_error(self, timeout=False):
+        with self._lock:
+            self.errors += 1
+            if timeout:
+                self.timeouts += 1
+
+    def snapshot(self):
+        with self._lock:
+            connected = self.new_connections + self.reused_connections
+            return {
+                'requests': self.requests,
+                'new_connections': self.new_connections,
+                'reused_connections': self.reused_connections,
+                'reuse_rate': self.reused_connections / connected if connected else 0.0,
+                'avg_wait_ms': self.total_wait_time / connected * 1000 if connected else 0.0,
+                'max_wait_ms': self.max_wait_time * 1000,
+                'errors': self.errors,
+                'timeouts': self.timeouts
+            }
+
+
+class InstrumentedTransport(httpx.BaseTransport):
+    """httpx transport wrapper that records connection reuse and pool wait time
+
+    Uses httpcore trace events: a request that opens a TCP connection used a
+    new connection, and the time before the connection is opened (or before
+    request headers are sent on a reused connection) is time spent waiting
+    for a pool slot.
+
+    Once the request deadline has passed nothing is sent, and a call that
+    timed out at the deadline is not retried: either way a 504 marked
+    x-should-retry: false stops the SDK from retrying.
+    """
+
+    def __init__(self, transport, stats):
+        self._transport = transport
+        self.stats = stats
+
+    def _deadline_response(self, request):
+        return httpx.Response(504, headers={'x-should-retry': 'false'},
+                              json={'error': {'code': '504', 'message': 'Request deadline exceeded'}}, request=request)
+
+    def handle_request(self, request):
+        if deadline_passed():
+            return self._deadline_response(request)
+        start = time.perf_counter()
+        state = {'new_connection': False, 'acquired_at': None}
+        previous_trace = request.extensions.get('trace')
+
+        def trace(event_name, info):
+            if event_name == 'connection.connect_tcp.started':
+                state['new_connection'] = True
+                state['acquired_at'] = time.perf_counter()
+            elif event_name.endswith('send_request_headers.started') and state['acquired_at'] is None:
+                state['acquired_at'] = time.perf_counter()
+            if previous_trace is not None:
+                previous_trace(event_name, info)
+
+        request.extensions['trace'] = trace
+        try:
+            response = self._transport.handle_request(request)
+        except httpx.TimeoutException:
+            self.stats.record_error(timeout=True)
+            if deadline_passed():
+                return self._deadline_response(request)
+            raise
+        except httpx.HTTPError:
+            self.stats.record_error()
+            raise
+
+        if state['acquired_at'] is not None:
+            self.stats.record(state['new_connection'], state['acquired_at'] - start)
+        return response
+
+    def get_pool_state(self):
+        """Get open/idle connection counts from the underlying pool"""
+        pool = getattr(self._transport, '_pool', None)
+        connections = list(getattr(pool, 'connections', []))
+        return {
+            'open_connections': len(connections),
+            'idle_connections': sum(1 for connection in connections if connection.is_idle())
+        }
+
+    def close(self):
+        self._transport.close()
+
+
+class HttpTransport:
+    """Shared keep-alive HTTP client used for all upstream calls"""
+
+    def __init__(self):
+        self.pool_size = int(os.getenv('HTTP_POOL_SIZE', '20'))
+        self.keepalive_expiry = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', '30'))
+        self.connect_timeout = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))
+        self.read_timeout = float(os.getenv('HTTP_READ_TIMEOUT', '120'))
+        self.write_timeout = float(os.getenv('HTTP_WRITE_TIMEOUT', '30'))
+        self.pool_timeout = float(os.getenv('HTTP_POOL_TIMEOUT', '10'))
+
+        self.stats = PoolStats()
+        limits = httpx.Limits(
+            max_connections=self.pool_size,
+            max_keepalive_connections=self.pool_size,
+            keepalive_expiry=self.keepalive_expiry
+        )
+        self.transport = InstrumentedTransport(httpx.HTTPTransport(limits=limits), self.stats)
+        # Record/replay sits outside the pool so replayed calls never touch the network
+        self.transport = cassette.wrap_transport(self.transport)
+        self.client = httpx.Client(transport=self.transport, timeout=self.timeout())
+
+        backend_logger.info(f"HttpTransport initialized - pool_size: {self.pool_size}, connect_timeout: {self.connect_timeout}s, read_timeout: {self.read_timeout}s, pool_timeout: {self.pool_timeout}s")
+
+    def timeout(self, read=None, connect=None):
+        """Build a per-call timeout, defaulting to the configured values
+
+        Within a request deadline every phase is capped at the time left.
+        """
+        return cap_http_timeout(httpx.Timeout(
+            connect=connect if connect is not None else self.connect_timeout,
+            read=read if read is not None else self.read_timeout,
+            write=self.write_timeout,
+            pool=self.pool_timeout
+        ))
+
+    def get_stats(self):
+        """Get pool statistics such as reuse rate and wait time"""
+        stats = self.stats.snapshot()
+        stats.update(self.transport.get_pool_state())
+        stats['pool_size'] = self.pool_size
+        if isinstance(self.transport, cassette.CassetteTransport):
+            stats['cassette'] = self.transport.get_stats()
+        return stats
+
+    def close(self):
+        self.client.close()
+
+
+_transport = None
+_llm_clients = {}
+_lock = threading.Lock()
+
+
+def get_http_transport():
+    """Get the process-wide shared HTTP transport"""
+    global _transport
+    with _lock:
+        if _transport is None:
+            _transport = HttpTransport()
+        return _transport
+
+
+def get_llm_client(api_key, base_url):
+    """Get the shared ZhipuAiClient for an API key and base URL"""
+    transport = get_http_transport()
+    with _lock:
+        client = _llm_clients.get((api_key, base_url))
+        if client is None:
+            llm_read_timeout = float(os.getenv('LLM_READ_TIMEOUT', str(transport.read_timeout)))
+            client = ZhipuAiClient(
+                api_key=api_key,
+                base_url=base_url,
+                http_client=transport.client,
+                timeout=transport.timeout(read=llm_read_timeout)
+            )
+            _llm_clients[(api_key, base_url)] = client
+            backend_logger.info(f"Shared ZhipuAiClient created for {base_url}")
+        return client
@@ -1,17 +1,24 @@
 import os
 import json
-import requests
 import re
+import time
+import threading
 from datetime import datetime
 from logger import ai_service_logger
-from zai import ZhipuAiClient
+from http_transport import get_http_transport, get_llm_client
+from llm_gateway import LLMGateway
+from admission import OverloadedError
+from deadlines import DeadlineExceededError, deadline_passed
+from request_coalescing import SingleFlight
+from metrics import KB_LOOKUP_SECONDS, FILE_WRITE_SECONDS
+from tracing import start_span
 
 
 class KnowledgeBaseService:
     def __init__(self, api_key, llm_base_url="https://open.bigmodel.cn/api/paas/v4"):
         self.api_key = api_key
         # Knowledge base API URL (different from LLM API)
-        self.kb_base_url = "https://open.bigmodel.cn/api/llm-application/open"
+        self.kb_base_url = os.getenv('KB_BASE_URL', 'https://open.bigmodel.cn/api/llm-application/open')
         # LLM API URL (for knowledge retrieval tools)
         self.llm_base_url = llm_base_url
         self.headers = {
@@ -19,15 +26,36 @@ class KnowledgeBaseService:
             'Content-Type': 'application/json',
             'accept': '*/*'
         }
-        # Separate client for LLM operations (knowledge retrieval)
-        self.llm_client = ZhipuAiClient(api_key=api_key, base_url=llm_base_url)
+        # Shared pooled transport and LLM client (knowledge retrieval)
+        self.http_transport = get_http_transport()
+        self.llm_client = get_llm_client(api_key, llm_base_url)
+        self.llm_gateway = LLMGateway(self.llm_client)
+        self.kb_read_timeout = float(os.getenv('KB_READ_TIMEOUT', '10'))
 
         # Initialize strategy directory for saving generated strategies
         self.data_dir = "../Data"
         self.strategy_dir = os.path.join(self.data_dir, "strategies")
         os.makedirs(self.strategy_dir, exist_ok=True)
 
+        # Knowledge base list cache: a name index served while fresh, served stale
+        # while a background refresh runs, and only fetched inline when empty
+        self.kb_cache_ttl = float(os.getenv('KB_CACHE_TTL', '300'))
+        self.kb_refresh_interval = float(os.getenv('KB_REFRESH_INTERVAL', '0'))
+        self.kb_retry_interval = float(os.getenv('KB_REFRESH_RETRY_INTERVAL', '30'))
+        self._kb_list = None
+        self._kb_index = {}
+        self._kb_loaded_at = 0.0
+        self._kb_last_attempt = 0.0
+        self._kb_lock = threading.Lock()
+        self._kb_refreshing = False
+        # Requests finding the cache empty share one inline fetch
+        self._kb_first_load = SingleFlight()
+
+        if self.kb_refresh_interval > 0:
+            threading.Thread(target=self._periodic_refresh_loop, name="kb-refresh", daemon=True).start()
+
         ai_service_logger.info("KnowledgeBaseService initialized")
+        ai_service_logger.info(f"Knowledge base cache - ttl: {self.kb_cache_ttl}s, refresh_interval: {self.kb_refresh_interval}s")
         ai_service_logger.info(f"Knowledge base API URL: {self.kb_base_url}")
         ai_service_logger.info(f"LLM API URL: {self.llm_base_url}")
         ai_service_logger.info(f"Strategy directory: {self.strategy_dir}")
@@ -46,8 +74,9 @@ class KnowledgeBaseService:
             filepath = os.path.join(self.strategy_dir, filename)
 
             # Save the strategy code
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(python_code)
+            with FILE_WRITE_SECONDS.time(kind='strategy'), start_span('file.write', kind='strategy'):
+                with open(filepath, 'w', encoding='utf-8') as f:
+                    f.write(python_code)
 
             file_info = {
                 'filename': filename,
@@ -92,40 +121,131 @@ class KnowledgeBaseService:
             ai_service_logger.error(f"Error extracting Python code: {e}")
             return strategy_content.strip()
 
-    def get_knowledge_base_list(self):
-        """获取知识库列表"""
+    def _fetch_knowledge_base_list(self):
+        """Fetch the knowledge base list from the API, raising on failure"""
+        url = f"{self.kb_base_url}/knowledge"
+        ai_service_logger.info(f"Getting knowledge base list from: {url}")
+        with KB_LOOKUP_SECONDS.time(operation='list'), start_span('kb.list'):
+            response = self.http_transport.client.get(
+                url,
+                headers=self.headers,
+                timeout=self.http_transport.timeout(read=self.kb_read_timeout)
+            )
+        response.raise_for_status()
+
+        result = response.json()
+        if result.get('code') != 200:
+            raise RuntimeError(f"Failed to get knowledge base list: {result.get('message')}")
+
+        knowledge_list = result.get('data', {}).get('list', [])
+        ai_service_logger.info(f"Successfully retrieved knowledge base list, total: {len(knowledge_list)}")
+        return knowledge_list
+
+    def refresh_knowledge_base_cache(self):
+        """Fetch the knowledge base list and rebuild the name index
+
+        Returns True on success. On failure the previously cached list is kept.
+        A fetch cut short by the calling request's deadline does not start the
+        retry backoff, so other requests can still load the list inline.
+        """
+        previous_attempt = self._kb_last_attempt
+        self._kb_last_attempt = time.time()
         try:
-            url = f"{self.kb_base_url}/knowledge"
-            ai_service_logger.info(f"Getting knowledge base list from: {url}")
-            response = requests.get(url, headers=self.headers)
-            response.raise_for_status()
-
-            result = response.json()
-            if result.get('code') == 200:
-                knowledge_list = result.get('data', {}).get('list', [])
-                ai_service_logger.info(f"Successfully retrieved knowledge base list, total: {len(knowledge_list)}")
-                return knowledge_list
-            else:
-                ai_service_logger.error(f"Failed to get knowledge base list: {result.get('message')}")
-                return []
+            knowledge_list = self._fetch_knowledge_base_list()
         except Exception as e:
+            if deadline_passed():
+                self._kb_last_attempt = previous_attempt
             ai_service_logger.error(f"Error getting knowledge base list: {e}")
-            return []
+            return False
+
+        index = {}
+        for kb in knowledge_list:
+            index.setdefault(kb.get('name'), kb)
+
+        with self._kb_lock:
+            self._kb_list = knowledge_list
+            self._kb_index = index
+            self._kb_loaded_at = time.time()
+        return True
+
+    def _refresh_in_background(self):
+        """Start a background refresh unless one is running or a retry is not yet due"""
+        with self._kb_lock:
+            if self._kb_refreshing or time.time() - self._kb_last_attempt < self.kb_retry_interval:
+                return
+            self._kb_refreshing = True
+
+        def run():
+            try:
+                self.refresh_knowledge_base_cache()
+            finally:
+                self._kb_refreshing = False
+
+        ai_service_logger.debug("Refreshing knowledge base cache in background")
+        threading.Thread(target=run, name="kb-revalidate", daemon=True).start()
+
+    def _periodic_refresh_loop(self):
+        """Keep the knowledge base cache warm"""
+        while True:
+            self.refresh_knowledge_base_cache()
+            time.sleep(self.kb_refresh_interval)
+
+    def _ensure_knowledge_base_cache(self, force_refresh=False):
+        """Make sure the cache is populated, revalidating stale entries in the background"""
+        if force_refresh:
+            self.refresh_knowledge_base_cache()
+        elif self._kb_list is None:
+            # Nothing to serve yet: concurrent callers wait for one inline fetch
+            # instead of each sending their own
+            self._kb_first_load.do('knowledge_base_list', self._load_if_empty)
+        elif time.time() - self._kb_loaded_at > self.kb_cache_ttl:
+            self._refresh_in_background()
+
+    def _load_if_empty(self):
+        """Fetch the list inline unless it was loaded meanwhile or a recent attempt just failed"""
+        if self._kb_list is not None:
+            return True
+        if time.time() - self._kb_last_attempt < self.kb_retry_interval:
+            return False
+        return self.refresh_knowledge_base_cache()
+
+    def get_knowledge_base_list(self, force_refresh=False):
+        """获取知识库列表"""
+        self._ensure_knowledge_base_cache(force_refresh)
+        return list(self._kb_list or [])
 
     def get_knowledge_base_by_name(self, name):
         """根据名称获取知识库"""
         try:
-            knowledge_bases = self.get_knowledge_base_list()
-            for kb in knowledge_bases:
-                if kb.get('name') == name:
-                    ai_service_logger.info(f"Found knowledge base '{name}' with ID: {kb.get('id')}")
-                    return kb
+            with KB_LOOKUP_SECONDS.time(operation='lookup'), start_span('kb.lookup', name=name):
+                self._ensure_knowledge_base_cache()
+                kb = self._kb_index.get(name)
+            if kb:
+                ai_service_logger.info(f"Found knowledge base '{name}' with ID: {kb.get('id')}")
+                return kb
+
+            # The knowledge base may have been created since the last refresh
+            if self._kb_list is not None:
+                self._refresh_in_background()
             ai_service_logger.warning(f"Knowledge base '{name}' not found")
             return None
+        except DeadlineExceededError:
+            raise
         except Exception as e:
             ai_service_logger.error(f"Error getting knowledge base by name: {e}")
             return None
 
+    def get_knowledge_base_cache_info(self):
+        """Get the state of the knowledge base cache"""
+        loaded = self._kb_list is not None
+        return {
+            'loaded': loaded,
+            'entries': len(self._kb_list) if loaded else 0,
+            'age_seconds': time.time() - self._kb_loaded_at if loaded else None,
+            'ttl': self.kb_cache_ttl,
+            'refreshing': self._kb_refreshing
+        }
+
     def search_knowledge_base(self, knowledge_id, query, top_k=5):
         """使用官方工具调用方式搜索知识库内容"""
         try:
@@ -148,14 +268,15 @@ class KnowledgeBaseService:
             }
 
             # 使用LLM客户端工具调用检索知识库
-            response = self.llm_client.chat.completions.create(
-                model="glm-4.5-air",  # 使用支持工具的模型
-                messages=[
-                    {"role": "user", "content": query}
-                ],
-                tools=[retrieval_tool],
-                stream=False
-            )
+            with KB_LOOKUP_SECONDS.time(operation='retrieval'), start_span('kb.retrieval', knowledge_id=knowledge_id):
+                response = self.llm_gateway.chat(
+                    "glm-4.5-air",  # 使用支持工具的模型
+                    [
+                        {"role": "user", "content": query}
+                    ],
+                    prompt_type='kb_retrieval',
+                    tools=[retrieval_tool]
+                )
 
             # 解析响应，提取知识库内容
             response_content = response.choices[0].message.content
@@ -176,6 +297,8 @@ class KnowledgeBaseService:
 
             return search_results
 
+        except (OverloadedError, DeadlineExceededError):
+            raise
         except Exception as e:
             ai_service_logger.error(f"Error searching knowledge base with tools: {e}")
             return []
@@ -219,7 +342,7 @@ class KnowledgeBaseService:
             ai_service_logger.error(f"Error generating system prompt from knowledge: {e}")
             return None
 
-    def generate_strategy_with_knowledge_retrieval(self, user_prompt, knowledge_id, implementation_steps=None):
+    def generate_strategy_with_knowledge_retrieval(self, user_prompt, knowledge_id, implementation_steps=None, progress_callback=None):
         """使用知识库检索工具直接生成量化交易策略"""
         start_time = datetime.now()
         ai_service_logger.info(f"Starting strategy generation with knowledge retrieval - knowledge_id: {knowledge_id}, prompt_length: {len(user_prompt)}")
@@ -279,14 +402,16 @@ class KnowledgeBaseService:
             ai_service_logger.debug(f"System prompt length: {len(system_prompt)} characters")
 
             # 使用LLM客户端工具调用生成策略
-            response = self.llm_client.chat.completions.create(
-                model="glm-4.5",
-                messages=[
+            served = {'model': "glm-4.5"}
+            response = self.llm_gateway.chat(
+                "glm-4.5",
+                [
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt}
                 ],
+                prompt_type='quant_kb_strategy',
                 tools=[retrieval_tool],
-                stream=False
+                on_model=lambda model: served.update(model=model)
             )
 
             strategy_content = response.choices[0].message.content
@@ -296,7 +421,13 @@ class KnowledgeBaseService:
             ai_service_logger.debug(f"Generated strategy preview: {strategy_content[:200]}...")
 
             # Save the generated strategy to file
+            if progress_callback:
+                progress_callback('file_save', 'started')
+            file_save_start = time.time()
             strategy_file_info = self.save_strategy_file(strategy_content, knowledge_id, user_prompt)
+            file_save_time = time.time() - file_save_start
+            if progress_callback:
+                progress_callback('file_save', 'completed' if strategy_file_info else 'failed')
 
             if strategy_file_info:
                 ai_service_logger.info(f"Strategy saved to file: {strategy_file_info['filename']}")
@@ -311,11 +442,16 @@ class KnowledgeBaseService:
                 "content": strategy_content,
                 "knowledge_used": knowledge_id,
                 "source": "knowledge_retrieval",
+                "model": served['model'],
                 "file_info": strategy_file_info,
                 "processing_time": processing_time,
+                "file_save_time": file_save_time,
                 "content_length": content_length
             }
 
+        except (OverloadedError, DeadlineExceededError):
+            # Falling back to another generation would only queue again
+            raise
         except Exception as e:
             processing_time = (datetime.now() - start_time).total_seconds()
             ai_service_logger.error(f"Error generating strategy with knowledge retrieval: {e} - processing_time: {processing_time:.2f}s")
@@ -0,0 +1,222 @@
+import time
+from logger import ai_service_logger
+from metrics import LLM_CALL_SECONDS, LLM_TIME_TO_FIRST_TOKEN_SECONDS, LLM_ERRORS_TOTAL, LLM_TOKENS_TOTAL, LLM_PREDICTED_TOKENS_TOTAL, LLM_TOKEN_PREDICTION_RATIO, TOKEN_BUDGET_EVENTS_TOTAL
+from tracing import start_span
+from model_router import model_stats
+from token_budget import estimator, output_budgets
+from admission import admission
+from hedging import hedger
+from circuit_breaker import circuit_breakers, is_model_failure
+from deadlines import DeadlineExceededError, check_deadline, deadline_exceeded, deadline_passed, cap_http_timeout
+
+
+class LLMGateway:
+    """Single entry point for chat completion calls
+
+    Wraps an LLM client so every call site gets the same latency and error
+    metrics, labelled by model and prompt_type. prompt_type names the prompt
+    for user-facing generation and the pipeline step for internal calls.
+    Each call also feeds the rolling per-model statistics used for routing.
+
+    A max_tokens argument is the call site's ceiling: once enough completions
+    have been seen for the prompt_type, the learned output budget is requested
+    instead, and reported usage trains the budgets and the token estimator.
+    A non-streaming completion cut off by a learned budget below the ceiling
+    is retried once with the ceiling, so a truncated answer is never returned
+    and cached; streams report it through on_truncated instead.
+
+    Calls hold a slot of the model's concurrency limiter for their whole
+    duration (streams until exhausted); a shed call raises OverloadedError
+    before anything is sent and is not counted as an LLM error.
+
+    Non-streaming calls made within an endpoint that allows hedging are
+    duplicated when they run past the observed latency percentile of their
+    model and prompt_type; see hedging.Hedger.
+
+    Every call first goes through the model's circuit breaker: while the
+    circuit is open the call is sent to the fallback model instead, and the
+    outcome of each call feeds the breaker of the model that served it.
+
+    Within a request deadline the call's timeout is capped at the time left,
+    and a stream is abandoned once the deadline passes.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def _apply_deadline(self, stage, kwargs):
+        check_deadline(stage)
+        if 'timeout' not in kwargs:
+            timeout = cap_http_timeout(self.client.timeout)
+            if timeout is not self.client.timeout:
+                kwargs['timeout'] = timeout
+
+    def _apply_budget(self, prompt_type, kwargs):
+        if kwargs.get('max_tokens'):
+            kwargs['max_tokens'] = output_budgets.max_tokens(prompt_type, kwargs['max_tokens'])
+        return kwargs.get('max_tokens')
+
+    def _truncated_by_budget(self, finish_reason, max_tokens, ceiling):
+        return finish_reason == 'length' and bool(max_tokens) and bool(ceiling) and max_tokens < ceiling
+
+    def _record_prediction(self, labels, kind, predicted, actual):
+        LLM_PREDICTED_TOKENS_TOTAL.inc(predicted, kind=kind, **labels)
+        LLM_TOKEN_PREDICTION_RATIO.observe(actual / predicted, prompt_type=labels['prompt_type'], kind=kind)
+
+    def _record_usage(self, labels, messages, usage, max_tokens, finish_reason):
+        if usage is None:
+            return
+        prompt_tokens = getattr(usage, 'prompt_tokens', None)
+        completion_tokens = getattr(usage, 'completion_tokens', None)
+        if prompt_tokens:
+            LLM_TOKENS_TOTAL.inc(prompt_tokens, kind='prompt', **labels)
+            predicted = estimator.estimate_messages(messages)
+            if predicted:
+                self._record_prediction(labels, 'prompt', predicted, prompt_tokens)
+            estimator.calibrate(messages, prompt_tokens)
+        if completion_tokens:
+            LLM_TOKENS_TOTAL.inc(completion_tokens, kind='completion', **labels)
+            if max_tokens:
+                self._record_prediction(labels, 'completion', max_tokens, completion_tokens)
+            output_budgets.record(labels['prompt_type'], completion_tokens, max_tokens, truncated=finish_reason == 'length')
+        hedger.record_tokens(labels['prompt_type'], (prompt_tokens or 0) + (completion_tokens or 0))
+
+    def chat(self, model, messages, prompt_type=None, on_model=None, **kwargs):
+        """Run a non-streaming chat completion and return the response
+
+        on_model, if given, is called with the model the call is routed to,
+        which is the fallback model while the requested model's circuit is
+        open. response.model is whatever the upstream reports and may be a
+        versioned alias of it.
+        """
+        requested = model
+        try:
+            model, probe = circuit_breakers.route(model)
+            if on_model:
+                on_model(model)
+            hedge_delay = None if probe else hedger.delay(model, prompt_type)
+            if hedge_delay is None:
+                with admission.model(model):
+                    return self._chat(model, messages, prompt_type, probe=probe, **kwargs)
+
+            def attempt(hedge):
+                # A hedge is only sent on a free slot, it never queues
+                with admission.model(model, queue=not hedge):
+                    return self._chat(model, messages, prompt_type, hedge=hedge, **kwargs)
+            return hedger.run(model, prompt_type, hedge_delay, attempt)
+        finally:
+            # A routing probe reserved for a call that was shed or rerouted frees its slot
+            model_stats.release_probe(requested)
+
+    def _chat(self, model, messages, prompt_type=None, hedge=False, probe=False, learned_budget=True, **kwargs):
+        labels = {'model': model, 'prompt_type': prompt_type or 'default'}
+        call_kwargs = dict(kwargs)
+        ceiling = kwargs.get('max_tokens')
+        max_tokens = self._apply_budget(prompt_type, kwargs) if learned_budget else ceiling
+        self._apply_deadline('llm.chat', kwargs)
+        start_time = time.perf_counter()
+        try:
+            with start_span('llm.chat', max_tokens=max_tokens or 0, hedge=hedge, **labels):
+                model_stats.probe_sent(model)
+                response = self.client.chat.completions.create(model=model, messages=messages, stream=False, **kwargs)
+        except Exception as e:
+            duration = time.perf_counter() - start_time
+            LLM_ERRORS_TOTAL.inc(**labels)
+            LLM_CALL_SECONDS.observe(duration, **labels)
+            # A call cut short by the request deadline says nothing about the model
+            check_deadline('llm.chat')
+            model_stats.record(model, duration, ok=False)
+            circuit_breakers.record(model, duration, ok=not is_model_failure(e), probe=probe)
+            raise
+
+        duration = time.perf_counter() - start_time
+        LLM_CALL_SECONDS.observe(duration, **labels)
+        model_stats.record(model, duration, completion_tokens=getattr(response.usage, 'completion_tokens', None))
+        circuit_breakers.record(model, duration, ok=True, probe=probe)
+        if not response.model:
+            response.model = model
+        finish_reason = response.choices[0].finish_reason if response.choices else None
+        self._record_usage(labels, messages, response.usage, max_tokens, finish_reason)
+        if self._truncated_by_budget(finish_reason, max_tokens, ceiling):
+            TOKEN_BUDGET_EVENTS_TOTAL.inc(event='budget_retry', prompt_type=labels['prompt_type'])
+            ai_service_logger.warning(f"Retrying with the call site's max_tokens - model: {model}, prompt_type: {labels['prompt_type']}, learned: {max_tokens}, ceiling: {ceiling}")
+            return self._chat(model, messages, prompt_type, hedge=hedge, learned_budget=False, **call_kwargs)
+        return response
+
+    def chat_stream(self, model, messages, prompt_type=None, on_model=None, on_truncated=None, **kwargs):
+        """Run a streaming chat completion, yielding the text deltas
+
+        The call is measured from the request until the stream is exhausted,
+        with time to first token recorded separately. on_model, if given, is
+        called with the model that serves the call before the first delta.
+        on_truncated, if given, is called once the stream ends when a learned
+        output budget below the call site's max_tokens cut it off.
+        """
+        requested = model
+        try:
+            model, probe = circuit_breakers.route(model)
+            if on_model:
+                on_model(model)
+            with admission.model(model):
+                yield from self._chat_stream(model, messages, prompt_type, probe=probe, on_truncated=on_truncated, **kwargs)
+        finally:
+            model_stats.release_probe(requested)
+
+    def _chat_stream(self, model, messages, prompt_type=None, probe=False, on_truncated=None, **kwargs):
+        labels = {'model': model, 'prompt_type': prompt_type or 'default'}
+        ceiling = kwargs.get('max_tokens')
+        max_tokens = self._apply_budget(prompt_type, kwargs)
+        self._apply_deadline('llm.chat_stream', kwargs)
+        start_time = time.perf_counter()
+        first_token = True
+        time_to_first_token = None
+        usage = None
+        finish_reason = None
+        ok = False
+        failed = False
+        cut_by_deadline = False
+        try:
+            with start_span('llm.chat_stream', max_tokens=max_tokens or 0, **labels) as span:
+                model_stats.probe_sent(model)
+                response = self.client.chat.completions.create(model=model, messages=messages, stream=True, **kwargs)
+                for chunk in response:
+                    check_deadline('llm.chat_stream')
+                    if getattr(chunk, 'usage', None) is not None:
+                        usage = chunk.usage
+                    if not chunk.choices:
+                        continue
+                    finish_reason = chunk.choices[0].finish_reason or finish_reason
+                    delta = chunk.choices[0].delta.content
+                    if not delta:
+                        continue
+                    if first_token:
+                        first_token = False
+                        time_to_first_token = time.perf_counter() - start_time
+                        LLM_TIME_TO_FIRST_TOKEN_SECONDS.observe(time_to_first_token, **labels)
+                        span.set_attribute('time_to_first_token', time_to_first_token)
+                        ai_service_logger.info(f"First token received from LLM - model: {model}, time_to_first_token: {time_to_first_token:.2f}s")
+                    yield delta
+            ok = True
+            self._record_usage(labels, messages, usage, max_tokens, finish_reason)
+            if on_truncated and self._truncated_by_budget(finish_reason, max_tokens, ceiling):
+                on_truncated()
+        except Exception as e:
+            # A stream cut short by the request deadline says nothing about the model
+            cut_by_deadline = deadline_passed()
+            failed = not cut_by_deadline and is_model_failure(e)
+            LLM_ERRORS_TOTAL.inc(**labels)
+            if cut_by_deadline and not isinstance(e, DeadlineExceededError):
+                raise deadline_exceeded('llm.chat_stream') from e
+            raise
+        finally:
+            duration = time.perf_counter() - start_time
+            LLM_CALL_SECONDS.observe(duration, **labels)
+            if not cut_by_deadline:
+                # A stream's length depends on its output, so the breaker judges it on time to first token;
+                # a client error answered by the model counts as a call it handled
+                circuit_breakers.record(model, time_to_first_token if time_to_first_token is not None else duration, ok=not failed, probe=probe)
+            if not cut_by_deadline and (ok or time_to_first_token is None):
+                # A stream abandoned by the client after output started says nothing about the model
+                generation_time = duration - time_to_first_token if time_to_first_token is not None else None
+                completion_tokens = getattr(usage, 'completion_tokens', None)
+                model_stats.record(model, duration, ok=ok, completion_tokens=completion_tokens, generation_time=generation_time)
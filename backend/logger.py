@@ -1,69 +1,200 @@
 import os
+import queue
+import atexit
 import logging
-from logging.handlers import TimedRotatingFileHandler
+import threading
+from logging.handlers import TimedRotatingFileHandler, QueueHandler, QueueListener
 from datetime import datetime
 
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'DEBUG').upper()
+LOG_FILE_LEVEL = os.getenv('LOG_FILE_LEVEL', 'DEBUG').upper()
+LOG_CONSOLE_LEVEL = os.getenv('LOG_CONSOLE_LEVEL', 'INFO').upper()
+LOG_MAX_MESSAGE_LENGTH = int(os.getenv('LOG_MAX_MESSAGE_LENGTH', '2000'))
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+
+
+class TruncatingFormatter(logging.Formatter):
+    """Formatter that caps the message length, leaving tracebacks intact"""
+
+    def __init__(self, fmt=None, datefmt=None, max_length=0):
+        super().__init__(fmt, datefmt)
+        self.max_length = max_length
+
+    def format(self, record):
+        if not hasattr(record, 'trace_id'):
+            record.trace_id = '-'
+        message = record.getMessage()
+        if self.max_length and len(message) > self.max_length:
+            record.msg = f"{message[:self.max_length]}... [truncated {len(message) - self.max_length} chars]"
+            record.args = None
+        return super().format(record)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that hands records over unformatted and never blocks
+
+    Records stay in-process, so message formatting is left to the listener
+    thread. When the queue is full the record is dropped and counted instead
+    of stalling the calling request thread.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Any thread may log, and += on an attribute is not atomic
+            with self._dropped_lock:
+                self.dropped += 1
+
+
+class LoggingPipeline:
+    """Single queue and writer thread shared by all application loggers
+
+    Request threads only enqueue records; one QueueListener owns the dated
+    log file and the console, so each file has exactly one writer.
+    """
+
+    def __init__(self, log_dir='logs'):
+        self.log_dir = log_dir
+        self._lock = threading.Lock()
+        self.queue = queue.Queue(LOG_QUEUE_SIZE)
+        self.queue_handler = NonBlockingQueueHandler(self.queue)
+        self.listener = None
+
+    def start(self):
+        """Create the file and console handlers and start the writer thread"""
+        with self._lock:
+            if self.listener is not None:
+                return
+
+            # Create log directory if it doesn't exist
+            os.makedirs(self.log_dir, exist_ok=True)
+
+            # Generate log filename with current date
+            current_date = datetime.now().strftime('%Y-%m-%d')
+            log_filename = os.path.join(self.log_dir, f'{current_date}.log')
+
+            # File handler with date rotation
+            file_handler = TimedRotatingFileHandler(
+                log_filename,
+                when='midnight',
+                interval=1,
+                backupCount=30,
+                encoding='utf-8'
+            )
+            file_handler.setLevel(LOG_FILE_LEVEL)
+
+            # Console handler
+            console_handler = logging.StreamHandler()
+            console_handler.setLevel(LOG_CONSOLE_LEVEL)
+
+            # Formatter
+            formatter = TruncatingFormatter(
+                '%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] - %(message)s',
+                datefmt='%Y-%m-%d %H:%M:%S',
+                max_length=LOG_MAX_MESSAGE_LENGTH
+            )
+            file_handler.setFormatter(formatter)
+            console_handler.setFormatter(formatter)
+
+            self.listener = QueueListener(self.queue, file_handler, console_handler, respect_handler_level=True)
+            self.listener.start()
+            atexit.register(self.stop)
+
+    def stop(self):
+        """Flush queued records and stop the writer thread"""
+        with self._lock:
+            if self.listener is not None:
+                self.listener.stop()
+                self.listener = None
+
+    def get_stats(self):
+        return {
+            'queue_depth': self.queue.qsize(),
+            'queue_size': LOG_QUEUE_SIZE,
+            'dropped': self.queue_handler.dropped,
+            'max_message_length': LOG_MAX_MESSAGE_LENGTH
+        }
+
+
 class Logger:
     def __init__(self, name, log_dir='logs'):
         self.log_dir = log_dir
         self.logger = logging.getLogger(name)
-        self.logger.setLevel(logging.DEBUG)
+        self.logger.setLevel(LOG_LEVEL)
 
         # Avoid duplicate handlers
         if not self.logger.handlers:
             self._setup_handlers()
 
     def _setup_handlers(self):
-        """Setup file and console handlers"""
-        # Create log directory if it doesn't exist
-        os.makedirs(self.log_dir, exist_ok=True)
-
-        # Generate log filename with current date
-        current_date = datetime.now().strftime('%Y-%m-%d')
-        log_filename = os.path.join(self.log_dir, f'{current_date}.log')
-
-        # File handler with date rotation
-        file_handler = TimedRotatingFileHandler(
-            log_filename,
-            when='midnight',
-            interval=1,
-            backupCount=30,
-            encoding='utf-8'
-        )
-        file_handler.setLevel(logging.DEBUG)
-
-        # Console handler
-        console_handler = logging.StreamHandler()
-        console_handler.setLevel(logging.INFO)
-
-        # Formatter
-        formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S'
-        )
-        file_handler.setFormatter(formatter)
-        console_handler.setFormatter(formatter)
-
-        # Add handlers to logger
-        self.logger.addHandler(file_handler)
-        self.logger.addHandler(console_handler)
-
-    def debug(self, message):
-        self.logger.debug(message)
-
-    def info(self, message):
-        self.logger.info(message)
-
-    def warning(self, message):
-        self.logger.warning(message)
-
-    def error(self, message):
-        self.logger.error(message)
-
-    def critical(self, message):
-        self.logger.critical(message)
+        """Attach the shared queue handler and make sure its writer is running"""
+        pipeline.start()
+        self.logger.addHandler(pipeline.queue_handler)
+
+    # Messages may use %-style arguments, which are only formatted on the
+    # writer thread and only if the record passes the level checks
+    def debug(self, message, *args, **kwargs):
+        self.logger.debug(message, *args, **kwargs)
+
+    def info(self, message, *args, **kwargs):
+        self.logger.info(message, *args, **kwargs)
+
+    def warning(self, message, *args, **kwargs):
+        self.logger.warning(message, *args, **kwargs)
+
+    def error(self, message, *args, **kwargs):
+        self.logger.error(message, *args, **kwargs)
+
+    def critical(self, message, *args, **kwargs):
+        self.logger.critical(message, *args, **kwargs)
+
+    def is_enabled_for(self, level):
+        return self.logger.isEnabledFor(level)
+
+
+def get_log_levels():
+    """Get the current level of each application logger"""
+    return {name: logging.getLevelName(logger.logger.level) for name, logger in LOGGERS.items()}
+
+
+def set_log_level(level, name=None):
+    """Change the level of one application logger, or all of them, at runtime"""
+    level = str(level).upper()
+    if level not in ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'):
+        raise ValueError(f"Invalid log level: {level}")
+    if name is not None and name not in LOGGERS:
+        raise ValueError(f"Unknown logger: {name}")
+
+    for logger_name, logger in LOGGERS.items():
+        if name is None or logger_name == name:
+            logger.logger.setLevel(level)
+    return get_log_levels()
+
+
+def get_logging_stats():
+    stats = pipeline.get_stats()
+    stats['levels'] = get_log_levels()
+    return stats
+
+
+pipeline = LoggingPipeline('logs')
 
 # Create logger instances
 backend_logger = Logger('backend', 'logs')
 ai_service_logger = Logger('ai_service', 'logs')
-api_logger = Logger('api', 'logs')
\ No newline at end of file
+api_logger = Logger('api', 'logs')
+
+LOGGERS = {
+    'backend': backend_logger,
+    'ai_service': ai_service_logger,
+    'api': api_logger
+}
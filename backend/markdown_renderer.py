@@ -0,0 +1,181 @@
+import os
+import html
+import tempfile
+import threading
+import subprocess
+from abc import ABC, abstractmethod
+from logger import ai_service_logger
+from deadlines import stage_timeout, check_deadline
+
+try:
+    import markdown
+except ImportError:
+    markdown = None
+
+try:
+    from pygments.formatters import HtmlFormatter
+except ImportError:
+    HtmlFormatter = None
+
+
+class RendererError(Exception):
+    """Raised when a renderer fails to produce HTML"""
+
+
+HTML_PAGE_TEMPLATE = """<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1.0">
+<title>{title}</title>
+<style>
+body {{ max-width: 960px; margin: 0 auto; padding: 2em 1.5em; font-family: -apple-system, "PingFang SC", "Microsoft YaHei", sans-serif; line-height: 1.7; color: #333; }}
+h1, h2, h3, h4, h5, h6 {{ line-height: 1.3; margin-top: 1.4em; }}
+table {{ border-collapse: collapse; margin: 1em 0; }}
+th, td {{ border: 1px solid #ddd; padding: 6px 12px; }}
+th {{ background: #f6f8fa; }}
+pre {{ padding: 1em; overflow-x: auto; background: #f6f8fa; border-radius: 4px; }}
+code {{ font-family: Consolas, Monaco, monospace; font-size: 0.92em; }}
+img {{ max-width: 100%; height: auto; }}
+blockquote {{ margin: 1em 0; padding: 0 1em; color: #666; border-left: 4px solid #ddd; }}
+{highlight_css}
+</style>
+</head>
+<body>
+{body}
+</body>
+</html>
+"""
+
+
+class MarkdownRenderer(ABC):
+    """Renders a markdown document into a standalone HTML page"""
+
+    name = 'base'
+
+    @abstractmethod
+    def render_to_file(self, markdown_content, markdown_filepath, html_filepath, title):
+        """Render markdown into html_filepath and return the HTML content
+
+        markdown_content is the document already held in memory and
+        markdown_filepath the copy already saved on disk; backends use
+        whichever they need.
+        """
+
+    def get_stats(self):
+        """Get renderer statistics"""
+        return {'renderer': self.name}
+
+
+class PythonMarkdownRenderer(MarkdownRenderer):
+    """In-process renderer built on Python-Markdown and Pygments"""
+
+    name = 'python'
+    extensions = ['extra', 'codehilite', 'sane_lists', 'toc']
+
+    def __init__(self):
+        if markdown is None:
+            raise RendererError("Python-Markdown is not installed")
+
+        self.extension_configs = {
+            'codehilite': {'css_class': 'codehilite', 'guess_lang': False}
+        }
+        self.highlight_css = HtmlFormatter().get_style_defs('.codehilite') if HtmlFormatter else ''
+        # Markdown instances are expensive to build but not thread-safe, keep one per thread
+        self._local = threading.local()
+
+    def _get_converter(self):
+        converter = getattr(self._local, 'converter', None)
+        if converter is None:
+            converter = markdown.Markdown(
+                extensions=self.extensions,
+                extension_configs=self.extension_configs,
+                output_format='html'
+            )
+            self._local.converter = converter
+        return converter
+
+    def render(self, markdown_content, title):
+        """Render markdown to a standalone HTML page in memory"""
+        converter = self._get_converter()
+        try:
+            body = converter.convert(markdown_content)
+        finally:
+            converter.reset()
+        return HTML_PAGE_TEMPLATE.format(
+            title=html.escape(title or ''),
+            highlight_css=self.highlight_css,
+            body=body
+        )
+
+    def render_to_file(self, markdown_content, markdown_filepath, html_filepath, title):
+        if markdown_content is None:
+            with open(markdown_filepath, 'r', encoding='utf-8') as f:
+                markdown_content = f.read()
+
+        html_content = self.render(markdown_content, title)
+        with open(html_filepath, 'w', encoding='utf-8') as f:
+            f.write(html_content)
+        return html_content
+
+
+class PandocRenderer(MarkdownRenderer):
+    """Renderer that runs the pandoc conversion script in a subprocess"""
+
+    name = 'pandoc'
+
+    def __init__(self, script_path=None, timeout=30):
+        self.script_path = script_path or os.getenv('PANDOC_SCRIPT', '../trans_markdown.sh')
+        self.timeout = timeout
+
+    def render_to_file(self, markdown_content, markdown_filepath, html_filepath, title):
+        temp_filepath = None
+        if not os.path.exists(markdown_filepath):
+            # Only compressed variants are stored, give the script a plain copy
+            with tempfile.NamedTemporaryFile('w', suffix='.md', encoding='utf-8', delete=False) as f:
+                f.write(markdown_content)
+                temp_filepath = f.name
+        cmd = [self.script_path, temp_filepath or markdown_filepath, html_filepath]
+
+        ai_service_logger.info(f"Running pandoc command: {' '.join(cmd)}")
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=stage_timeout(self.timeout, 'pandoc'))
+        except subprocess.TimeoutExpired:
+            check_deadline('pandoc')
+            raise RendererError("Pandoc conversion timed out")
+        finally:
+            if temp_filepath:
+                os.remove(temp_filepath)
+
+        if result.returncode != 0:
+            raise RendererError(f"Pandoc conversion failed: {result.stderr}")
+
+        # Read the converted HTML content
+        with open(html_filepath, 'r', encoding='utf-8') as f:
+            return f.read()
+
+
+def create_renderer(name=None):
+    """Create the renderer selected by name or the MARKDOWN_RENDERER setting
+
+    'auto' (the default) prefers the in-process renderer and falls back to
+    pandoc when Python-Markdown is not installed. 'pandoc_pool' uses the
+    batched pandoc worker pool.
+    """
+    name = (name or os.getenv('MARKDOWN_RENDERER', 'auto')).lower()
+
+    if name == 'pandoc':
+        return PandocRenderer()
+    if name == 'pandoc_pool':
+        # Imported here: pandoc_service builds on this module
+        from pandoc_service import PandocPoolRenderer
+        return PandocPoolRenderer()
+    if name == 'python':
+        return PythonMarkdownRenderer()
+    if name != 'auto':
+        raise ValueError(f"Unknown markdown renderer: {name}")
+
+    if markdown is not None:
+        return PythonMarkdownRenderer()
+    ai_service_logger.warning("Python-Markdown not installed, falling back to pandoc renderer")
+    return PandocRenderer()
@@ -0,0 +1,169 @@
+import os
+import json
+import sqlite3
+import threading
+from logger import backend_logger
+
+
+class JsonMetadataStore:
+    """Metadata kept in a single JSON file that is rewritten on every change"""
+
+    def __init__(self, json_path):
+        self.json_path = json_path
+        self._lock = threading.Lock()
+        self._entries = {}
+
+        if os.path.exists(json_path):
+            try:
+                with open(json_path, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+                backend_logger.info(f"Loaded metadata for {len(self._entries)} HTML files")
+            except Exception as e:
+                backend_logger.error(f"Error loading metadata: {e}")
+        else:
+            self._save()
+
+    def get(self, file_id):
+        return self._entries.get(file_id)
+
+    def put(self, entry):
+        with self._lock:
+            self._entries[entry['file_id']] = entry
+            self._save()
+
+    def delete(self, file_id):
+        with self._lock:
+            if self._entries.pop(file_id, None) is None:
+                return False
+            self._save()
+            return True
+
+    def list_all(self):
+        """List entries, newest first"""
+        return sorted(self._entries.values(), key=lambda entry: entry['created_at'], reverse=True)
+
+    def count(self):
+        return len(self._entries)
+
+    def _save(self):
+        """Write all metadata to a temporary file and swap it in"""
+        tmp_path = f"{self.json_path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.json_path)
+            backend_logger.debug("Metadata saved successfully")
+        except Exception as e:
+            backend_logger.error(f"Error saving metadata: {e}")
+
+
+class SQLiteMetadataStore:
+    """Metadata kept in SQLite (WAL mode) with indexes on created_at and prompt_type
+
+    Each entry is stored as a JSON document next to the indexed columns, so new
+    metadata fields need no schema change. Writes touch a single row.
+    """
+
+    def __init__(self, db_path, legacy_json_path=None):
+        self.db_path = db_path
+        self._local = threading.local()
+
+        connection = self._connection()
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS html_files (
+                file_id TEXT PRIMARY KEY,
+                created_at TEXT NOT NULL,
+                prompt_type TEXT,
+                content_length INTEGER,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_html_files_created_at ON html_files (created_at);
+            CREATE INDEX IF NOT EXISTS idx_html_files_prompt_type ON html_files (prompt_type, created_at);
+        """)
+
+        if legacy_json_path:
+            self._migrate_from_json(legacy_json_path)
+
+        backend_logger.info(f"SQLite metadata store ready: {db_path}, entries: {self.count()}")
+
+    def _connection(self):
+        """Get this thread's connection"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _migrate_from_json(self, json_path):
+        """One-time import of the legacy metadata.json, renamed once imported"""
+        if not os.path.exists(json_path):
+            return
+
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except Exception as e:
+            backend_logger.error(f"Error reading legacy metadata {json_path}: {e}")
+            return
+
+        connection = self._connection()
+        with connection:
+            connection.executemany(
+                "INSERT OR IGNORE INTO html_files (file_id, created_at, prompt_type, content_length, data) VALUES (?, ?, ?, ?, ?)",
+                [self._row(entry) for entry in entries.values()]
+            )
+        os.replace(json_path, f"{json_path}.migrated")
+        backend_logger.info(f"Migrated {len(entries)} metadata entries from {json_path}")
+
+    def _row(self, entry):
+        return (
+            entry['file_id'],
+            entry['created_at'],
+            entry.get('prompt_type'),
+            entry.get('content_length'),
+            json.dumps(entry, ensure_ascii=False)
+        )
+
+    def get(self, file_id):
+        row = self._connection().execute(
+            "SELECT data FROM html_files WHERE file_id = ?", (file_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, entry):
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO html_files (file_id, created_at, prompt_type, content_length, data) VALUES (?, ?, ?, ?, ?)",
+                self._row(entry)
+            )
+
+    def delete(self, file_id):
+        connection = self._connection()
+        with connection:
+            cursor = connection.execute("DELETE FROM html_files WHERE file_id = ?", (file_id,))
+        return cursor.rowcount > 0
+
+    def list_all(self):
+        """List entries, newest first"""
+        rows = self._connection().execute(
+            "SELECT data FROM html_files ORDER BY created_at DESC"
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def count(self):
+        return self._connection().execute("SELECT COUNT(*) FROM html_files").fetchone()[0]
+
+
+def create_metadata_store(data_dir):
+    """Create the metadata store selected by HTML_METADATA_BACKEND (sqlite or json)"""
+    backend = os.getenv('HTML_METADATA_BACKEND', 'sqlite').lower()
+    json_path = os.path.join(data_dir, 'metadata.json')
+
+    if backend == 'json':
+        return JsonMetadataStore(json_path)
+    if backend == 'sqlite':
+        return SQLiteMetadataStore(os.path.join(data_dir, 'metadata.db'), legacy_json_path=json_path)
+    raise ValueError(f"Unknown metadata backend: {backend}")
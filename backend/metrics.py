@@ -0,0 +1,280 @@
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# Recent observations kept per series for exact p50/p95/p99
+METRICS_RESERVOIR_SIZE = int(os.getenv('METRICS_RESERVOIR_SIZE', '1024'))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(label_names, label_values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            series = {key: self._snapshot(value) for key, value in self._series.items()}
+        for key in sorted(series):
+            lines.extend(self._render_series(key, series[key]))
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonic counter with labels"""
+
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def _snapshot(self, value):
+        return value
+
+    def _render_series(self, key, value):
+        return [f"{self.name}{_format_labels(self.label_names, key)} {value}"]
+
+    def get_summary(self):
+        with self._lock:
+            return {','.join(key) or 'total': value for key, value in self._series.items()}
+
+
+class Gauge(Counter):
+    """Value that can go up and down, such as queue depth or requests in flight"""
+
+    type_name = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._series[self._key(labels)] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class _HistogramSeries:
+    def __init__(self, bucket_count):
+        self.bucket_counts = [0] * bucket_count
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=METRICS_RESERVOIR_SIZE)
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram with labels
+
+    Besides the Prometheus buckets, the most recent observations of each
+    series are kept so exact p50/p95/p99 can be reported without a query
+    backend.
+    """
+
+    type_name = 'histogram'
+
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _HistogramSeries(len(self.buckets))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series.bucket_counts[i] += 1
+                    break
+            series.count += 1
+            series.sum += value
+            series.recent.append(value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with-block, including when it raises"""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start_time, **labels)
+
+    def recent(self, **labels):
+        """Recent observations of one series, sorted"""
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return sorted(series.recent) if series else []
+
+    def percentiles(self, **labels):
+        """p50/p95/p99 over the recent observations of one series, or None"""
+        recent = self.recent(**labels)
+        if not recent:
+            return None
+        return {'p50': percentile(recent, 50), 'p95': percentile(recent, 95), 'p99': percentile(recent, 99)}
+
+    def _snapshot(self, series):
+        return list(series.bucket_counts), series.count, series.sum
+
+    def _render_series(self, key, snapshot):
+        bucket_counts, count, total = snapshot
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, bucket_counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.label_names, key, 'le="%s"' % bound)
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.label_names, key, 'le="+Inf"')
+        lines.append(f"{self.name}_bucket{labels} {count}")
+        lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {total}")
+        lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return lines
+
+    def get_summary(self):
+        """Count, mean and percentiles of every series, keyed by label values"""
+        with self._lock:
+            series = {key: (value.count, value.sum, sorted(value.recent)) for key, value in self._series.items()}
+
+        summary = {}
+        for key, (count, total, recent) in series.items():
+            summary[','.join(key) or 'total'] = {
+                'count': count,
+                'avg': total / count if count else 0.0,
+                'p50': percentile(recent, 50),
+                'p95': percentile(recent, 95),
+                'p99': percentile(recent, 99)
+            }
+        return summary
+
+
+class MetricsRegistry:
+    """Process-wide collection of metrics, rendered for /metrics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _register(self, metric_class, name, help_text, label_names, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = metric_class(name, help_text, label_names, **kwargs)
+            elif not isinstance(metric, metric_class):
+                raise ValueError(f"Metric {name} already registered as {metric.type_name}")
+            return metric
+
+    def counter(self, name, help_text, label_names=()):
+        return self._register(Counter, name, help_text, label_names)
+
+    def gauge(self, name, help_text, label_names=()):
+        return self._register(Gauge, name, help_text, label_names)
+
+    def histogram(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, help_text, label_names, buckets=buckets)
+
+    def render_prometheus(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def get_summary(self):
+        """JSON-friendly view with per-series percentiles for histograms"""
+        with self._lock:
+            metrics = dict(self._metrics)
+        return {name: {'type': metric.type_name, 'series': metric.get_summary()} for name, metric in sorted(metrics.items())}
+
+
+registry = MetricsRegistry()
+
+# Application metrics
+HTTP_REQUEST_SECONDS = registry.histogram(
+    'http_request_duration_seconds', 'HTTP request latency', ('endpoint', 'method', 'status'))
+LLM_CALL_SECONDS = registry.histogram(
+    'llm_call_duration_seconds', 'LLM chat completion latency', ('model', 'prompt_type'))
+LLM_TIME_TO_FIRST_TOKEN_SECONDS = registry.histogram(
+    'llm_time_to_first_token_seconds', 'Time to the first streamed token', ('model', 'prompt_type'))
+LLM_ERRORS_TOTAL = registry.counter(
+    'llm_errors_total', 'Failed LLM chat completion calls', ('model', 'prompt_type'))
+RENDER_SECONDS = registry.histogram(
+    'markdown_render_duration_seconds', 'Markdown to HTML rendering time', ('renderer',))
+SVG_EXTRACTION_SECONDS = registry.histogram(
+    'svg_extraction_duration_seconds', 'Time to extract inline SVG into files')
+FILE_WRITE_SECONDS = registry.histogram(
+    'file_write_duration_seconds', 'Time to write generated files, including compressed variants', ('kind',))
+KB_LOOKUP_SECONDS = registry.histogram(
+    'kb_lookup_duration_seconds', 'Knowledge base list and retrieval latency', ('operation',))
+PIPELINE_STAGE_SECONDS = registry.histogram(
+    'pipeline_stage_duration_seconds', 'Quant strategy pipeline stage duration', ('stage', 'status'))
+GENERATION_FORMAT_TOTAL = registry.counter(
+    'generation_format_total', 'Generated content by detected and displayed format', ('original_format', 'display_format'))
+LLM_TOKENS_TOTAL = registry.counter(
+    'llm_tokens_total', 'Tokens reported by the LLM, by kind (prompt or completion)', ('model', 'prompt_type', 'kind'))
+LLM_PREDICTED_TOKENS_TOTAL = registry.counter(
+    'llm_predicted_tokens_total', 'Tokens predicted before the call: estimated prompt tokens and requested max_tokens', ('model', 'prompt_type', 'kind'))
+LLM_TOKEN_PREDICTION_RATIO = registry.histogram(
+    'llm_token_prediction_ratio', 'Reported over predicted tokens per call, by kind', ('prompt_type', 'kind'),
+    buckets=(0.1, 0.25, 0.5, 0.75, 0.9, 1.0, 1.1, 1.25, 1.5, 2.0, 4.0))
+LLM_OUTPUT_BUDGET_TOKENS = registry.gauge(
+    'llm_output_budget_tokens', 'Learned max_tokens per prompt type', ('prompt_type',))
+TOKEN_BUDGET_EVENTS_TOTAL = registry.counter(
+    'token_budget_events_total', 'Inputs rejected or truncated, completions cut off by max_tokens and retried with the ceiling', ('event', 'prompt_type'))
+MODEL_ROUTING_TOTAL = registry.counter(
+    'model_routing_decisions_total', 'Auto model selections by chosen model and policy', ('model', 'policy'))
+COALESCED_REQUESTS_TOTAL = registry.counter(
+    'coalesced_requests_total', 'Generation requests executed, joined to an identical in-flight request or replayed by Idempotency-Key', ('endpoint', 'source'))
+ADMISSION_QUEUE_WAIT_SECONDS = registry.histogram(
+    'admission_queue_wait_seconds', 'Time admitted requests waited for a concurrency slot', ('limiter',))
+ADMISSION_REJECTED_TOTAL = registry.counter(
+    'admission_rejected_total', 'Requests shed by a concurrency limiter', ('limiter', 'reason'))
+ADMISSION_IN_FLIGHT = registry.gauge(
+    'admission_in_flight', 'Requests holding a concurrency slot', ('limiter',))
+ADMISSION_QUEUED = registry.gauge(
+    'admission_queued', 'Requests waiting for a concurrency slot', ('limiter',))
+HEDGED_CALLS_TOTAL = registry.counter(
+    'llm_hedged_calls_total', 'Hedge-eligible LLM calls by outcome', ('model', 'outcome'))
+HEDGE_EXTRA_TOKENS_TOTAL = registry.counter(
+    'llm_hedge_extra_tokens_total', 'Tokens spent on the losing attempt of hedged LLM calls', ('model',))
+CIRCUIT_STATE = registry.gauge(
+    'llm_circuit_state', 'Circuit breaker state per model: 0 closed, 1 half-open, 2 open', ('model',))
+CIRCUIT_TRANSITIONS_TOTAL = registry.counter(
+    'llm_circuit_transitions_total', 'Circuit breaker state changes', ('model', 'state'))
+LLM_FALLBACK_TOTAL = registry.counter(
+    'llm_fallback_total', 'LLM calls rerouted to a fallback model by an open circuit', ('model', 'fallback'))
+DEADLINE_EXCEEDED_TOTAL = registry.counter(
+    'deadline_exceeded_total', 'Requests abandoned because their deadline passed, by stage', ('stage',))
+ERRORS_TOTAL = registry.counter(
+    'errors_total', 'Errors by component', ('component',))
@@ -0,0 +1,280 @@
+import os
+import time
+import threading
+from collections import deque
+from logger import ai_service_logger
+from metrics import percentile
+
+# min_latency (fastest healthy model meeting the quality floor) or min_cost
+ROUTING_POLICY = os.getenv('ROUTING_POLICY', 'min_latency').lower()
+# Quality floor for simple inputs and for inputs that look complex (see assess_complexity)
+ROUTING_QUALITY_FLOOR = float(os.getenv('ROUTING_QUALITY_FLOOR', '0'))
+ROUTING_COMPLEX_QUALITY_FLOOR = float(os.getenv('ROUTING_COMPLEX_QUALITY_FLOOR', '0.85'))
+# Calls older than this many seconds drop out of the rolling statistics
+ROUTER_STATS_WINDOW = float(os.getenv('ROUTER_STATS_WINDOW', '300'))
+ROUTER_STATS_MAX_SAMPLES = int(os.getenv('ROUTER_STATS_MAX_SAMPLES', '200'))
+# Below this many recent calls a model has no reliable statistics and is probed,
+# one call at a time; a probe that never reports back stops counting after ROUTER_PROBE_TIMEOUT seconds
+ROUTER_MIN_SAMPLES = int(os.getenv('ROUTER_MIN_SAMPLES', '5'))
+ROUTER_PROBE_TIMEOUT = float(os.getenv('ROUTER_PROBE_TIMEOUT', '60'))
+# A probe reserved by routing whose call is not sent within this many seconds frees the slot
+ROUTER_PROBE_RESERVE_SECONDS = float(os.getenv('ROUTER_PROBE_RESERVE_SECONDS', '10'))
+# A model is degraded above this error rate, or above this p95 latency (0 disables)
+ROUTER_MAX_ERROR_RATE = float(os.getenv('ROUTER_MAX_ERROR_RATE', '0.2'))
+ROUTER_MAX_P95_SECONDS = float(os.getenv('ROUTER_MAX_P95_SECONDS', '0'))
+
+ROUTING_POLICIES = ('min_latency', 'min_cost')
+
+PROGRAMMING_KEYWORDS = [
+    '代码', '函数', '算法', 'python', 'javascript', 'java', 'c++', 'html', 'css',
+    '编程', '开发', '实现', '调试', 'bug', 'api', '数据库', '框架', 'typescript',
+    'react', 'vue', 'angular', 'node', 'express', 'django', 'flask'
+]
+
+COMPLEX_TASK_KEYWORDS = [
+    '分析', '设计', '优化', '实现', '架构', '方案', '策略', '流程',
+    '解释', '说明', '总结', '比较', '对比', '评估', '建议', '翻译',
+    '创建', '重构', '部署', '测试', '文档', '教程'
+]
+
+QUANT_TRADE_KEYWORDS = [
+    '量化', '交易', '策略', '回测', '风险', '收益', '股票', '期货',
+    '算法交易', '投资', '组合', '对冲', '套利', '技术分析'
+]
+
+
+def assess_complexity(user_input, system_prompt):
+    """Return why an input needs a high-quality model, or None for simple inputs"""
+    input_lower = user_input.strip().lower()
+
+    if len(input_lower) > 100:
+        return f"input longer than 100 characters ({len(input_lower)})"
+    if 'lisp' in system_prompt:
+        return "system prompt uses lisp"
+
+    for label, keywords in (('quant trade', QUANT_TRADE_KEYWORDS),
+                            ('programming', PROGRAMMING_KEYWORDS),
+                            ('complex task', COMPLEX_TASK_KEYWORDS)):
+        for keyword in keywords:
+            if keyword in input_lower:
+                return f"{label} keyword: {keyword}"
+
+    if '\n' in user_input or '•' in user_input or '-' in user_input or user_input.count('。') > 3:
+        return "multi-line or list formatting"
+    return None
+
+
+def parse_model_pool(value):
+    """Parse MODEL_POOL entries of the form name:quality:cost, comma separated"""
+    pool = {}
+    for entry in value.split(','):
+        if not entry.strip():
+            continue
+        name, _, rest = entry.strip().partition(':')
+        quality, _, cost = rest.partition(':')
+        pool[name] = {'quality': float(quality or 0.5), 'cost': float(cost or 1.0)}
+    return pool
+
+
+def parse_pins(value):
+    """Parse ROUTING_PINNED_MODELS entries of the form prompt_type:model"""
+    pins = {}
+    for entry in value.split(','):
+        prompt_type, _, model = entry.strip().partition(':')
+        if prompt_type and model:
+            pins[prompt_type] = model
+    return pins
+
+
+class ModelStats:
+    """Rolling per-model latency, error rate and token throughput
+
+    Fed by LLMGateway after every chat completion. Only calls from the last
+    ROUTER_STATS_WINDOW seconds count, so a degraded model that stops
+    receiving traffic falls back below ROUTER_MIN_SAMPLES and gets probed
+    again once the window has passed. Probes are handed out one at a time per
+    model: routing reserves the slot, LLMGateway marks it sent when the call
+    goes out (or releases it when the call is shed before being sent), and
+    the next call recorded for the model ends the probe.
+    """
+
+    def __init__(self, window=ROUTER_STATS_WINDOW, max_samples=ROUTER_STATS_MAX_SAMPLES):
+        self.window = window
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._probes = {}
+
+    def record(self, model, duration, ok=True, completion_tokens=None, generation_time=None):
+        """Record one call; generation_time excludes time to first token for streams"""
+        tokens_per_second = None
+        if completion_tokens and (generation_time or duration) > 0:
+            tokens_per_second = completion_tokens / (generation_time or duration)
+        with self._lock:
+            calls = self._calls.get(model)
+            if calls is None:
+                calls = self._calls[model] = deque(maxlen=self.max_samples)
+            calls.append((time.time(), duration, ok, tokens_per_second))
+            self._probes.pop(model, None)
+
+    def _probe_taken(self, model, now):
+        # Caller holds the lock
+        probe = self._probes.get(model)
+        if probe is None:
+            return False
+        return now - probe['at'] < (ROUTER_PROBE_TIMEOUT if probe['sent'] else ROUTER_PROBE_RESERVE_SECONDS)
+
+    def probe_available(self, model):
+        """Check, without reserving it, whether the model's probe slot is free"""
+        with self._lock:
+            return not self._probe_taken(model, time.time())
+
+    def try_probe(self, model):
+        """Reserve the model's probe slot for a call about to be made; False while it is taken"""
+        now = time.time()
+        with self._lock:
+            if self._probe_taken(model, now):
+                return False
+            self._probes[model] = {'at': now, 'sent': False}
+            return True
+
+    def probe_sent(self, model):
+        """A call to the model went out; a reserved probe now holds the slot until it is recorded"""
+        with self._lock:
+            probe = self._probes.get(model)
+            if probe is not None and not probe['sent']:
+                probe.update(at=time.time(), sent=True)
+
+    def release_probe(self, model):
+        """Free a reserved probe whose call was never sent"""
+        with self._lock:
+            probe = self._probes.get(model)
+            if probe is not None and not probe['sent']:
+                del self._probes[model]
+
+    def snapshot(self, model):
+        cutoff = time.time() - self.window
+        with self._lock:
+            calls = [call for call in self._calls.get(model, ()) if call[0] >= cutoff]
+
+        latencies = sorted(call[1] for call in calls if call[2])
+        throughputs = [call[3] for call in calls if call[3] is not None]
+        errors = sum(1 for call in calls if not call[2])
+        return {
+            'samples': len(calls),
+            'error_rate': errors / len(calls) if calls else 0.0,
+            'p50_seconds': percentile(latencies, 50),
+            'p95_seconds': percentile(latencies, 95),
+            'tokens_per_second': sum(throughputs) / len(throughputs) if throughputs else None
+        }
+
+    def get_all(self):
+        with self._lock:
+            models = list(self._calls)
+        return {model: self.snapshot(model) for model in models}
+
+
+model_stats = ModelStats()
+
+
+class ModelRouter:
+    """Chooses a model for auto model_type from rolling per-model statistics
+
+    Every decision is returned with the candidates considered and why the
+    winner was picked, for /api/models/select. Order of precedence: a model
+    pinned to the prompt_type, then the routing policy over models that meet
+    the quality floor. Degraded models are skipped while a healthy one is
+    available. A model without enough recent calls gets one probe call at a
+    time; every other request is ranked on the models with real statistics.
+    """
+
+    def __init__(self, models, policy=ROUTING_POLICY, pins=None, stats=model_stats):
+        self.models = models
+        self.policy = policy if policy in ROUTING_POLICIES else 'min_latency'
+        self.pins = pins or {}
+        self.stats = stats
+        if policy not in ROUTING_POLICIES:
+            ai_service_logger.warning(f"Unknown ROUTING_POLICY '{policy}', using min_latency")
+
+    def _candidate(self, name, required_quality):
+        profile = self.models.get(name, {'quality': 0.5, 'cost': 1.0})
+        stats = self.stats.snapshot(name)
+        candidate = {'model': name, 'quality': profile['quality'], 'cost': profile['cost']}
+        candidate.update(stats)
+        candidate['meets_quality'] = profile['quality'] >= required_quality
+        candidate['probing'] = stats['samples'] < ROUTER_MIN_SAMPLES
+
+        degraded = None
+        if not candidate['probing']:
+            if stats['error_rate'] > ROUTER_MAX_ERROR_RATE:
+                degraded = f"error rate {stats['error_rate']:.0%} above {ROUTER_MAX_ERROR_RATE:.0%}"
+            elif ROUTER_MAX_P95_SECONDS and stats['p95_seconds'] and stats['p95_seconds'] > ROUTER_MAX_P95_SECONDS:
+                degraded = f"p95 {stats['p95_seconds']:.2f}s above {ROUTER_MAX_P95_SECONDS:.2f}s"
+        candidate['healthy'] = degraded is None
+        candidate['degraded_reason'] = degraded
+        return candidate
+
+    def _rank(self, candidates, policy):
+        def latency(candidate):
+            # Models without statistics rank as if they were as fast as the fastest known one
+            return candidate['p50_seconds'] or 0.0
+
+        if policy == 'min_cost':
+            return sorted(candidates, key=lambda c: (c['cost'], latency(c), -c['quality']))
+        return sorted(candidates, key=lambda c: (latency(c), c['cost'], -c['quality']))
+
+    def _pick(self, eligible, policy, reserve_probe):
+        """Probe a model lacking statistics if its probe slot is free, else rank the rest"""
+        claim = self.stats.try_probe if reserve_probe else self.stats.probe_available
+        for candidate in self._rank([c for c in eligible if c['probing']], policy):
+            if claim(candidate['model']):
+                return candidate
+        established = [c for c in eligible if not c['probing']]
+        return self._rank(established or eligible, policy)[0]
+
+    def route(self, user_input, system_prompt, prompt_type=None, policy=None, reserve_probe=False):
+        """Pick a model and explain the decision
+
+        reserve_probe is set when a call to the chosen model follows; a dry
+        run leaves probe slots untouched.
+        """
+        policy = policy if policy in ROUTING_POLICIES else self.policy
+        complexity = assess_complexity(user_input, system_prompt)
+        required_quality = ROUTING_COMPLEX_QUALITY_FLOOR if complexity else ROUTING_QUALITY_FLOOR
+        candidates = [self._candidate(name, required_quality) for name in self.models]
+        decision = {
+            'policy': policy,
+            'prompt_type': prompt_type,
+            'complexity': complexity or 'simple input',
+            'required_quality': required_quality,
+            'candidates': candidates
+        }
+
+        pinned = self.pins.get(prompt_type or 'default')
+        if pinned:
+            pinned_candidate = next((c for c in candidates if c['model'] == pinned), None) or self._candidate(pinned, 0)
+            if pinned_candidate['healthy']:
+                decision.update(model=pinned, reason=f"pinned for prompt_type {prompt_type or 'default'}")
+                return decision
+            decision['pin_skipped'] = f"pinned model {pinned} degraded: {pinned_candidate['degraded_reason']}"
+
+        eligible = [c for c in candidates if c['meets_quality'] and c['healthy']]
+        if eligible:
+            chosen = self._pick(eligible, policy, reserve_probe)
+            reason = f"{policy} among {len(eligible)} healthy models with quality >= {required_quality}"
+        else:
+            # Fall back: relax the quality floor, then pick the least failing model
+            healthy = [c for c in candidates if c['healthy']]
+            if healthy:
+                chosen = sorted(healthy, key=lambda c: (-c['quality'], c['cost']))[0]
+                reason = f"fallback: no healthy model meets quality {required_quality}, using the best healthy one"
+            else:
+                chosen = sorted(candidates, key=lambda c: (c['error_rate'], -c['quality']))[0]
+                reason = "fallback: all models degraded, using the lowest error rate"
+
+        if chosen['probing']:
+            reason += f" (probing: {chosen['samples']} of {ROUTER_MIN_SAMPLES} samples)"
+        elif chosen['p50_seconds'] is not None:
+            reason += f" (p50 {chosen['p50_seconds']:.2f}s, cost {chosen['cost']})"
+        decision.update(model=chosen['model'], reason=reason)
+        return decision
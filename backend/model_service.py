@@ -1,5 +1,7 @@
 import os
 from logger import ai_service_logger
+from metrics import MODEL_ROUTING_TOTAL
+from model_router import ModelRouter, model_stats, parse_model_pool, parse_pins
 
 class ModelService:
     def __init__(self):
@@ -9,7 +11,13 @@ class ModelService:
         self.standard_model = os.getenv('STANDARD_MODEL', 'glm-4.6')
         self.lightweight_model = os.getenv('LIGHTWEIGHT_MODEL', 'glm-4.5-air')
 
-        ai_service_logger.info(f"Model configuration - Standard: {self.standard_model}, Lightweight: {self.lightweight_model}")
+        # 自动选择时可路由的模型池，格式 name:quality:cost
+        self.model_pool = parse_model_pool(os.getenv('MODEL_POOL', ''))
+        self.model_pool.setdefault(self.standard_model, {'quality': 0.9, 'cost': 1.0})
+        self.model_pool.setdefault(self.lightweight_model, {'quality': 0.7, 'cost': 0.2})
+        self.router = ModelRouter(self.model_pool, pins=parse_pins(os.getenv('ROUTING_PINNED_MODELS', '')))
+
+        ai_service_logger.info(f"Model configuration - Standard: {self.standard_model}, Lightweight: {self.lightweight_model}, pool: {list(self.model_pool)}, policy: {self.router.policy}")
 
     def get_available_models(self):
         """获取可用的模型配置"""
@@ -19,92 +27,56 @@ class ModelService:
             'auto': 'auto'  # 自动选择模式
         }
 
-    def select_model(self, user_input, system_prompt, model_type='auto'):
+    def get_model_pool(self):
+        """获取模型池配置及各模型的滚动统计"""
+        return [
+            dict(model=name, **profile, **model_stats.snapshot(name))
+            for name, profile in self.model_pool.items()
+        ]
+
+    def select_model(self, user_input, system_prompt, model_type='auto', prompt_type=None):
         """
         根据用户输入和指定类型选择GLM模型
 
         Args:
             user_input: 用户输入文本
             system_prompt: 系统提示词
-            model_type: 模型类型 ('auto', 'standard', 'lightweight')
+            model_type: 模型类型 ('auto', 'standard', 'lightweight' 或模型池中的模型名)
+            prompt_type: 提示词类型，用于按提示词固定模型
 
         Returns:
             选择的模型名称
         """
-        ai_service_logger.debug(f"Selecting model - type: {model_type}, input_length: {len(user_input)}")
-
-        # 如果明确指定了模型类型
-        if model_type == 'standard':
-            ai_service_logger.debug(f"Selected standard model: {self.standard_model}")
-            return self.standard_model
-        elif model_type == 'lightweight':
-            ai_service_logger.debug(f"Selected lightweight model: {self.lightweight_model}")
-            return self.lightweight_model
+        return self.explain_selection(user_input, system_prompt, model_type, prompt_type, reserve_probe=True)['model']
 
-        # 自动选择模式（默认行为）
-        return self._auto_select_model(user_input, system_prompt)
+    def is_auto(self, model_type):
+        """Whether model_type leaves the choice to the router"""
+        return model_type not in ('standard', 'lightweight') and model_type not in self.model_pool
 
-    def _auto_select_model(self, user_input, system_prompt):
+    def explain_selection(self, user_input, system_prompt, model_type='auto', prompt_type=None, policy=None, reserve_probe=False):
         """
-        根据用户输入智能选择模型
-        """
-        ai_service_logger.debug("Auto-selecting model based on user input analysis")
-
-        input_length = len(user_input.strip())
-
-        # 规则1: 基于输入长度或特殊关键词
-        if input_length > 100 or system_prompt.find('lisp') != -1:
-            ai_service_logger.debug("Selected standard model based on input length or lisp keyword")
-            return self.standard_model
+        选择模型并返回决策说明；reserve_probe 为 True 时表示随后会真正调用所选模型
 
-        # 规则2: 基于内容复杂度 - 编程相关
-        programming_keywords = [
-            '代码', '函数', '算法', 'python', 'javascript', 'java', 'c++', 'html', 'css',
-            '编程', '开发', '实现', '调试', 'bug', 'api', '数据库', '框架', 'typescript',
-            'react', 'vue', 'angular', 'node', 'express', 'django', 'flask'
-        ]
-
-        # 规则3: 基于内容复杂度 - 复杂任务词汇
-        complex_task_keywords = [
-            '分析', '设计', '优化', '实现', '架构', '方案', '策略', '流程',
-            '解释', '说明', '总结', '比较', '对比', '评估', '建议', '翻译',
-            '创建', '重构', '部署', '测试', '文档', '教程'
-        ]
-
-        # 规则4: 量化交易相关关键词
-        quant_trade_keywords = [
-            '量化', '交易', '策略', '回测', '风险', '收益', '股票', '期货',
-            '算法交易', '投资', '组合', '对冲', '套利', '技术分析'
-        ]
-
-        input_lower = user_input.lower()
-
-        # 检查是否包含量化交易关键词
-        for keyword in quant_trade_keywords:
-            if keyword in input_lower:
-                ai_service_logger.debug(f"Selected standard model based on quant trade keyword: {keyword}")
-                return self.standard_model
-
-        # 检查是否包含编程关键词
-        for keyword in programming_keywords:
-            if keyword in input_lower:
-                ai_service_logger.debug(f"Selected standard model based on programming keyword: {keyword}")
-                return self.standard_model
-
-        # 检查是否包含复杂任务词汇
-        for keyword in complex_task_keywords:
-            if keyword in input_lower:
-                ai_service_logger.debug(f"Selected standard model based on complex task keyword: {keyword}")
-                return self.standard_model
-
-        # 规则5: 基于特殊字符和格式（多行、列表等）
-        if '\n' in user_input or '•' in user_input or '-' in user_input or user_input.count('。') > 3:
-            ai_service_logger.debug("Selected standard model based on special characters or complex formatting")
-            return self.standard_model
+        Returns:
+            dict: model 为选择的模型，reason 为原因；自动选择时还包含候选模型统计
+        """
+        ai_service_logger.debug(f"Selecting model - type: {model_type}, prompt_type: {prompt_type}, input_length: {len(user_input)}")
 
-        # 默认使用轻量级模型
-        ai_service_logger.debug(f"Selected lightweight model as default: {self.lightweight_model}")
-        return self.lightweight_model
+        # 如果明确指定了模型类型或模型名
+        if model_type == 'standard':
+            decision = {'model': self.standard_model, 'reason': "model_type standard"}
+        elif model_type == 'lightweight':
+            decision = {'model': self.lightweight_model, 'reason': "model_type lightweight"}
+        elif model_type in self.model_pool:
+            decision = {'model': model_type, 'reason': "model requested by name"}
+        else:
+            # 自动选择模式（默认行为），由路由引擎根据各模型的实时表现选择
+            decision = self.router.route(user_input, system_prompt, prompt_type, policy, reserve_probe)
+            MODEL_ROUTING_TOTAL.inc(model=decision['model'], policy=decision['policy'])
+
+        decision['model_type'] = model_type
+        ai_service_logger.debug(f"Selected model: {decision['model']} - {decision['reason']}")
+        return decision
 
     def validate_model(self, model_name):
         """
@@ -116,7 +88,7 @@ class ModelService:
         Returns:
             bool: 是否为有效的模型名称
         """
-        valid_models = [self.standard_model, self.lightweight_model]
+        valid_models = [self.standard_model, self.lightweight_model] + list(self.model_pool)
         is_valid = model_name in valid_models
         ai_service_logger.debug(f"Model validation for '{model_name}': {is_valid}")
         return is_valid
\ No newline at end of file
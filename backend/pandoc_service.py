@@ -0,0 +1,216 @@
+import os
+import re
+import html
+import time
+import queue
+import shutil
+import threading
+import subprocess
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from logger import ai_service_logger
+from markdown_renderer import MarkdownRenderer, RendererError, HTML_PAGE_TEMPLATE
+from deadlines import stage_timeout, check_deadline
+
+
+class _ConversionJob:
+    def __init__(self, markdown_content, title, deadline):
+        self.markdown_content = markdown_content
+        self.title = title
+        self.deadline = deadline
+        self.enqueued_at = time.time()
+        self.future = Future()
+
+
+class PandocConversionService:
+    """Pandoc conversions served by a fixed pool of long-lived workers
+
+    Requests are queued; each worker drains up to PANDOC_BATCH_SIZE queued
+    documents at a time and converts them one pandoc run per document, so
+    footnotes, heading ids and link references never leak between
+    documents. Jobs that outlive their timeout while queued are failed
+    without being converted.
+    """
+
+    def __init__(self):
+        self.pandoc_path = os.getenv('PANDOC_PATH', 'pandoc')
+        if shutil.which(self.pandoc_path) is None:
+            raise RendererError(f"Pandoc executable not found: {self.pandoc_path}")
+        self.workers = int(os.getenv('PANDOC_WORKERS', '2'))
+        self.batch_size = int(os.getenv('PANDOC_BATCH_SIZE', '8'))
+        self.job_timeout = float(os.getenv('PANDOC_JOB_TIMEOUT', '30'))
+        self.max_queue = int(os.getenv('PANDOC_MAX_QUEUE', '200'))
+
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self.stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'timeouts': 0,
+            'batches': 0,
+            'batched_documents': 0,
+            'in_flight': 0
+        }
+        self.highlight_css = self._load_highlight_css()
+
+        for i in range(self.workers):
+            threading.Thread(target=self._worker_loop, name=f"pandoc-worker-{i + 1}", daemon=True).start()
+
+        ai_service_logger.info(f"PandocConversionService initialized - pandoc: {self.pandoc_path}, workers: {self.workers}, batch_size: {self.batch_size}, job_timeout: {self.job_timeout}s")
+
+    def submit(self, markdown_content, title, timeout=None):
+        """Queue a conversion and return a Future resolving to the HTML page"""
+        job = _ConversionJob(markdown_content, title, time.time() + (timeout or self.job_timeout))
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            raise RendererError(f"Pandoc conversion queue is full ({self.max_queue})")
+        with self._stats_lock:
+            self.stats['submitted'] += 1
+        return job.future
+
+    def convert(self, markdown_content, title, timeout=None):
+        """Convert markdown to a standalone HTML page, waiting for the result"""
+        timeout = timeout or self.job_timeout
+        future = self.submit(markdown_content, title, timeout)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            raise RendererError("Pandoc conversion timed out")
+
+    def get_stats(self):
+        """Get queue depth, throughput counters and conversion latency"""
+        with self._stats_lock:
+            stats = dict(self.stats)
+            latencies = sorted(self._latencies)
+        stats['queue_depth'] = self._queue.qsize()
+        stats['workers'] = self.workers
+        stats['avg_batch_size'] = stats['batched_documents'] / stats['batches'] if stats['batches'] else 0.0
+        if latencies:
+            stats['latency_ms'] = {
+                'avg': sum(latencies) / len(latencies) * 1000,
+                'p50': latencies[int(0.50 * (len(latencies) - 1))] * 1000,
+                'p95': latencies[int(0.95 * (len(latencies) - 1))] * 1000,
+                'max': latencies[-1] * 1000
+            }
+        return stats
+
+    def _worker_loop(self):
+        while True:
+            jobs = [self._queue.get()]
+            while len(jobs) < self.batch_size:
+                try:
+                    jobs.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            now = time.time()
+            live_jobs = []
+            for job in jobs:
+                if job.deadline <= now or not job.future.set_running_or_notify_cancel():
+                    self._fail(job, RendererError("Pandoc conversion timed out while queued"), timeout=True)
+                else:
+                    live_jobs.append(job)
+
+            if not live_jobs:
+                continue
+            with self._stats_lock:
+                self.stats['in_flight'] += len(live_jobs)
+                self.stats['batches'] += 1
+                self.stats['batched_documents'] += len(live_jobs)
+            try:
+                for job in live_jobs:
+                    self._convert(job)
+            except Exception as e:
+                # Never let one batch take the worker down with it
+                ai_service_logger.error(f"Pandoc worker failed on a batch of {len(live_jobs)} documents: {e}")
+                for job in live_jobs:
+                    if not job.future.done():
+                        self._fail(job, RendererError(f"Pandoc conversion failed: {e}"))
+            finally:
+                with self._stats_lock:
+                    self.stats['in_flight'] -= len(live_jobs)
+
+    def _convert(self, job):
+        """Convert one job in its own pandoc run"""
+        timeout = job.deadline - time.time()
+        if timeout <= 0:
+            self._fail(job, RendererError("Pandoc conversion timed out while queued"), timeout=True)
+            return
+        try:
+            body = self._run_pandoc(job.markdown_content, timeout)
+        except subprocess.TimeoutExpired:
+            self._fail(job, RendererError("Pandoc conversion timed out"), timeout=True)
+            return
+        except (RendererError, OSError) as e:
+            self._fail(job, e if isinstance(e, RendererError) else RendererError(f"Pandoc could not be run: {e}"))
+            return
+
+        page = HTML_PAGE_TEMPLATE.format(
+            title=html.escape(job.title or ''),
+            highlight_css=self.highlight_css,
+            body=body.strip()
+        )
+        with self._stats_lock:
+            self.stats['completed'] += 1
+            self._latencies.append(time.time() - job.enqueued_at)
+        job.future.set_result(page)
+
+    def _run_pandoc(self, markdown_content, timeout, standalone=False):
+        """Run pandoc once over stdin and return its stdout"""
+        cmd = [self.pandoc_path, '--from', 'markdown', '--to', 'html5']
+        if standalone:
+            cmd += ['--standalone', '--metadata', 'title=highlight']
+
+        result = subprocess.run(cmd, input=markdown_content, capture_output=True, text=True,
+                                encoding='utf-8', timeout=timeout)
+        if result.returncode != 0:
+            raise RendererError(f"Pandoc conversion failed: {result.stderr}")
+        return result.stdout
+
+    def _load_highlight_css(self):
+        """Extract pandoc's syntax highlighting CSS, which is only emitted in standalone mode"""
+        try:
+            output = self._run_pandoc("```python\nx = 1\n```\n", self.job_timeout, standalone=True)
+        except Exception as e:
+            ai_service_logger.warning(f"Could not load pandoc highlight styles: {e}")
+            return ''
+        return '\n'.join(re.findall(r'<style[^>]*>(.*?)</style>', output, re.DOTALL))
+
+    def _fail(self, job, error, timeout=False):
+        with self._stats_lock:
+            self.stats['failed'] += 1
+            if timeout:
+                self.stats['timeouts'] += 1
+        if not job.future.done():
+            job.future.set_exception(error)
+
+
+class PandocPoolRenderer(MarkdownRenderer):
+    """Renderer backed by the shared pandoc conversion service"""
+
+    name = 'pandoc_pool'
+
+    def __init__(self, service=None):
+        self.service = service or PandocConversionService()
+
+    def render_to_file(self, markdown_content, markdown_filepath, html_filepath, title):
+        if markdown_content is None:
+            with open(markdown_filepath, 'r', encoding='utf-8') as f:
+                markdown_content = f.read()
+
+        try:
+            html_content = self.service.convert(markdown_content, title, stage_timeout(self.service.job_timeout, 'pandoc'))
+        except RendererError:
+            check_deadline('pandoc')
+            raise
+        with open(html_filepath, 'w', encoding='utf-8') as f:
+            f.write(html_content)
+        return html_content
+
+    def get_stats(self):
+        stats = super().get_stats()
+        stats.update(self.service.get_stats())
+        return stats
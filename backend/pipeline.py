@@ -0,0 +1,86 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from logger import ai_service_logger
+from metrics import PIPELINE_STAGE_SECONDS
+import tracing
+from deadlines import check_deadline
+
+
+class StageGraph:
+    """Small dependency graph of pipeline stages executed on a thread pool
+
+    Each stage is a callable receiving the dict of results produced so far.
+    Stages whose dependencies are satisfied run concurrently. Durations are
+    recorded per stage, and the first stage failure is re-raised once the
+    stages already in flight have finished.
+    """
+
+    def __init__(self, executor, progress_callback=None):
+        self.executor = executor
+        self.progress_callback = progress_callback
+        self.stages = {}
+        self.results = {}
+        self.timings = {}
+
+    def add(self, name, func, deps=()):
+        """Register a stage and the stages it depends on"""
+        self.stages[name] = (func, tuple(deps))
+        return self
+
+    def run(self):
+        """Run all stages and return their results keyed by stage name"""
+        pending = dict(self.stages)
+        running = {}
+        error = None
+
+        while pending or running:
+            if error is None:
+                for name in [n for n, (_, deps) in pending.items() if all(d in self.results for d in deps)]:
+                    func, _ = pending.pop(name)
+                    # Stages run on pool threads within the caller's trace
+                    running[self.executor.submit(tracing.wrap(self._run_stage), name, func, dict(self.results))] = name
+
+            if not running:
+                if error is None:
+                    raise RuntimeError(f"Unresolvable stage dependencies: {sorted(pending)}")
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    self.results[name] = future.result()
+                except Exception as e:
+                    ai_service_logger.error(f"Pipeline stage '{name}' failed: {e}")
+                    error = error or e
+
+        if error is not None:
+            raise error
+        return self.results
+
+    def _run_stage(self, name, func, results):
+        """Run one stage, reporting progress and recording its duration"""
+        self._report(name, 'started')
+        start_time = time.time()
+        try:
+            check_deadline(f"stage.{name}")
+            with tracing.start_span(f"stage.{name}"):
+                result = func(results)
+        except Exception:
+            self.timings[name] = time.time() - start_time
+            PIPELINE_STAGE_SECONDS.observe(self.timings[name], stage=name, status='failed')
+            self._report(name, 'failed')
+            raise
+        self.timings[name] = time.time() - start_time
+        PIPELINE_STAGE_SECONDS.observe(self.timings[name], stage=name, status='completed')
+        self._report(name, 'completed')
+        ai_service_logger.debug(f"Pipeline stage '{name}' completed in {self.timings[name]:.2f}s")
+        return result
+
+    def _report(self, name, status):
+        if not self.progress_callback:
+            return
+        try:
+            self.progress_callback(name, status)
+        except Exception as e:
+            ai_service_logger.error(f"Error reporting progress for stage {name}: {e}")
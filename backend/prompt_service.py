@@ -1,4 +1,8 @@
 import os
+import time
+import hashlib
+import threading
+from datetime import datetime
 from logger import ai_service_logger
 
 class PromptService:
@@ -13,46 +17,106 @@ class PromptService:
 请根据内容类型自动选择最适合的格式，并在返回时明确指明格式类型。
 你的回答应该清晰、准确、有帮助。"""
 
+        # Prompt contents are cached in memory and the directory is rescanned at
+        # most once per reload interval, picking up new, edited and removed files
+        self.reload_interval = float(os.getenv('PROMPT_RELOAD_INTERVAL', '2'))
+        self._prompts = {}
+        self._last_scan = 0.0
+        self._lock = threading.Lock()
+
         self.available_prompts = self._load_available_prompts()
-        ai_service_logger.info(f"PromptService initialized with {len(self.available_prompts)} prompts")
+        ai_service_logger.info(f"PromptService initialized with {len(self.available_prompts)} prompts, reload_interval: {self.reload_interval}s")
 
     def _load_available_prompts(self):
         """Load all available prompt files from the prompts directory"""
+        with self._lock:
+            self._scan_prompts_dir()
+        ai_service_logger.info(f"Total prompts loaded: {len(self._prompts)}")
+        return self.available_prompts
+
+    def _refresh_if_due(self):
+        """Rescan the prompts directory if the reload interval has elapsed"""
+        if time.time() - self._last_scan < self.reload_interval:
+            return
+        with self._lock:
+            if time.time() - self._last_scan >= self.reload_interval:
+                self._scan_prompts_dir()
+
+    def _scan_prompts_dir(self):
+        """Sync the in-memory prompt cache with the prompts directory (caller holds the lock)"""
+        self._last_scan = time.time()
         prompts = {}
-        ai_service_logger.debug(f"Loading prompts from directory: {self.prompts_dir}")
-
-        if os.path.exists(self.prompts_dir):
-            for filename in os.listdir(self.prompts_dir):
-                if filename.endswith('.md'):
-                    prompt_name = filename[:-3]  # Remove .md extension
-                    prompts[prompt_name] = filename
-                    ai_service_logger.debug(f"Found prompt: {prompt_name} -> {filename}")
-        else:
+
+        if not os.path.exists(self.prompts_dir):
             ai_service_logger.warning(f"Prompts directory does not exist: {self.prompts_dir}")
+        else:
+            for entry in os.scandir(self.prompts_dir):
+                if not entry.name.endswith('.md') or not entry.is_file():
+                    continue
+
+                prompt_name = entry.name[:-3]  # Remove .md extension
+                stat = entry.stat()
+                cached = self._prompts.get(prompt_name)
+                if cached and cached['mtime'] == stat.st_mtime_ns and cached['size'] == stat.st_size:
+                    prompts[prompt_name] = cached
+                    continue
 
-        ai_service_logger.info(f"Total prompts loaded: {len(prompts)}")
-        return prompts
+                try:
+                    with open(entry.path, 'r', encoding='utf-8') as f:
+                        content = f.read()
+                except Exception as e:
+                    ai_service_logger.error(f"Error loading prompt {prompt_name}: {e}")
+                    # Keep serving the last good version; its stale mtime makes the next scan retry
+                    if cached:
+                        prompts[prompt_name] = cached
+                    continue
+
+                prompts[prompt_name] = {
+                    'filename': entry.name,
+                    'content': content,
+                    'mtime': stat.st_mtime_ns,
+                    'size': stat.st_size,
+                    'etag': hashlib.sha1(content.encode('utf-8')).hexdigest()[:16],
+                    'modified_at': datetime.fromtimestamp(stat.st_mtime).isoformat()
+                }
+                action = "Reloaded" if cached else "Found"
+                ai_service_logger.debug(f"{action} prompt: {prompt_name} -> {entry.name}, length: {len(content)}")
+
+        for prompt_name in self._prompts.keys() - prompts.keys():
+            ai_service_logger.info(f"Prompt removed: {prompt_name}")
+
+        self._prompts = prompts
+        self.available_prompts = {name: info['filename'] for name, info in prompts.items()}
 
     def get_prompt_content(self, prompt_name):
-        """Load the content of a specific prompt file"""
+        """Get the content of a specific prompt file"""
         ai_service_logger.debug(f"Loading prompt content for: {prompt_name}")
+        self._refresh_if_due()
 
-        if prompt_name not in self.available_prompts:
+        prompt = self._prompts.get(prompt_name)
+        if not prompt:
             ai_service_logger.warning(f"Prompt not found: {prompt_name}, using default")
             return self.default_prompt
 
-        prompt_file = os.path.join(self.prompts_dir, self.available_prompts[prompt_name])
-        try:
-            with open(prompt_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-            ai_service_logger.debug(f"Successfully loaded prompt: {prompt_name}, length: {len(content)}")
-            return content
-        except Exception as e:
-            ai_service_logger.error(f"Error loading prompt {prompt_name}: {e}")
-            return self.default_prompt
+        return prompt['content']
+
+    def get_prompt_version(self, prompt_name):
+        """Get the ETag of a prompt, or None for unknown prompts"""
+        self._refresh_if_due()
+        prompt = self._prompts.get(prompt_name)
+        return prompt['etag'] if prompt else None
+
+    def get_prompt_versions(self):
+        """Get version info (etag and modification time) for every prompt"""
+        self._refresh_if_due()
+        return {
+            name: {'etag': info['etag'], 'modified_at': info['modified_at']}
+            for name, info in self._prompts.items()
+        }
 
     def get_available_prompts(self):
         """Get list of available prompt types"""
+        self._refresh_if_due()
         return list(self.available_prompts.keys())
 
     def get_default_prompt(self):
@@ -1,95 +1,70 @@
 import time
 import os
+from concurrent.futures import ThreadPoolExecutor
 from logger import ai_service_logger
 from knowledge_base_service import KnowledgeBaseService
 from model_service import ModelService
+from pipeline import StageGraph
+from admission import OverloadedError
+from deadlines import DeadlineExceededError
+from metrics import ERRORS_TOTAL
+from tracing import start_span
 
 class QuantTradeService:
-    def __init__(self, client, knowledge_base_service):
-        self.client = client
+    def __init__(self, llm_gateway, knowledge_base_service):
+        self.llm_gateway = llm_gateway
         self.knowledge_base_service = knowledge_base_service
         self.model_service = ModelService()
+        self.stage_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv('QUANT_STAGE_WORKERS', '8')),
+            thread_name_prefix="quant-stage"
+        )
         ai_service_logger.info("QuantTradeService initialized with configurable model support")
 
-    def generate_strategy(self, user_prompt, knowledge_base_name="quant_trade_api_doc", model_type='auto'):
-        """Generate quantitative trading strategy using knowledge base"""
+    def generate_strategy(self, user_prompt, knowledge_base_name="quant_trade_api_doc", model_type='auto', progress_callback=None):
+        """Generate quantitative trading strategy using knowledge base
+
+        progress_callback, if given, is called as progress_callback(stage, status)
+        for the analysis, kb_lookup, generation and file_save stages.
+        """
         start_time = time.time()
         ai_service_logger.info(f"Starting quantitative trading strategy generation - knowledge_base: {knowledge_base_name}, model_type: {model_type}")
 
         # Select model for quant trade analysis
-        analysis_model = self.model_service.select_model(user_prompt, "量化交易分析", model_type)
-        strategy_model = self.model_service.select_model(user_prompt, "量化交易策略生成", model_type)
+        analysis_model = self.model_service.select_model(user_prompt, "量化交易分析", model_type, 'quant_analysis')
+        strategy_model = self.model_service.select_model(user_prompt, "量化交易策略生成", model_type, 'quant_strategy')
 
         ai_service_logger.info(f"Selected models - Analysis: {analysis_model}, Strategy: {strategy_model}")
 
-        implementation_steps = None
-        try:
-            # Step 1: Analyze user input with GLM-4.5 to extract implementation steps
-            analysis_prompt = """你是一个专业的量化交易分析师。请分析用户的需求，并输出实现该量化策略所需的基本步骤。
-
-用户需求：{user_prompt}
-
-请按照以下格式输出步骤：
-1. 步骤一：具体描述
-2. 步骤二：具体描述
-3. 步骤三：具体描述
-...
-
-每个步骤应该简洁明了，专注于量化交易策略实现的关键环节。只输出步骤列表，不要添加其他解释。""".format(user_prompt=user_prompt)
-
-            ai_service_logger.info("Step 1: Analyzing user input to extract implementation steps")
-            analysis_messages = [
-                {"role": "system", "content": analysis_prompt},
-                {"role": "user", "content": user_prompt}
-            ]
-
-            analysis_response = self.client.chat.completions.create(
-                model=analysis_model,
-                messages=analysis_messages,
-                temperature=0.5,
-                max_tokens=1000,
-                stream=False
-            )
-
-            implementation_steps = analysis_response.choices[0].message.content
-            ai_service_logger.info(f"Extracted implementation steps: {implementation_steps[:200]}...")
-
-            # Step 2: Get knowledge base by name
-            knowledge_base = self.knowledge_base_service.get_knowledge_base_by_name(knowledge_base_name)
-            if not knowledge_base:
-                ai_service_logger.warning(f"Knowledge base '{knowledge_base_name}' not found, using default approach")
-                return self._generate_default_strategy_with_steps(user_prompt, implementation_steps)
+        # Analysis and knowledge base lookup are independent and run concurrently;
+        # generation starts once both have finished
+        graph = StageGraph(self.stage_executor, progress_callback)
+        graph.add('analysis', lambda results: self._analyze_requirements(user_prompt, analysis_model))
+        graph.add('kb_lookup', lambda results: self._lookup_knowledge_base(knowledge_base_name))
+        graph.add('generation', lambda results: self._generate_from_stage_results(
+            user_prompt, knowledge_base_name, strategy_model, results, progress_callback
+        ), deps=('analysis', 'kb_lookup'))
 
-            knowledge_id = knowledge_base.get('id')
-
-            # Step 3: Use new knowledge retrieval method to generate strategy directly
-            ai_service_logger.info("Step 3: Generating strategy using knowledge retrieval with implementation steps")
-            strategy_result = self.knowledge_base_service.generate_strategy_with_knowledge_retrieval(
-                user_prompt, knowledge_id, implementation_steps
-            )
+        try:
+            with start_span('quant.pipeline', knowledge_base=knowledge_base_name,
+                            analysis_model=analysis_model, strategy_model=strategy_model):
+                result = graph.run()['generation']
 
-            if strategy_result:
-                content = strategy_result['content']
-                processing_time = time.time() - start_time
-                ai_service_logger.info(f"Successfully generated strategy using knowledge retrieval, length: {len(content)}, processing_time:{processing_time:.2f}s")
-
-                return {
-                    "format": "markdown",
-                    "content": content,
-                    "knowledge_base_used": knowledge_base_name,
-                    "implementation_steps": implementation_steps,
-                    "source": "knowledge_retrieval",
-                    "knowledge_id": knowledge_id
-                }
-            else:
-                ai_service_logger.warning("Knowledge retrieval failed, falling back to traditional approach")
-                return self._generate_default_strategy_with_steps(user_prompt, implementation_steps)
+            processing_time = time.time() - start_time
+            result.setdefault('stage_timings', {}).update(graph.timings)
+            result['processing_time'] = processing_time
+            ai_service_logger.info(f"Quantitative trading strategy generation completed - processing_time: {processing_time:.2f}s, stage_timings: {self._format_timings(result['stage_timings'])}")
+            return result
 
+        except (OverloadedError, DeadlineExceededError):
+            raise
         except Exception as e:
             processing_time = time.time() - start_time
             ai_service_logger.error(f"Error generating quantitative trading strategy: {e} - processing_time: {processing_time:.2f}s")
+            ERRORS_TOTAL.inc(component='quant_strategy')
 
             # Fallback implementation steps if analysis failed
+            implementation_steps = graph.results.get('analysis')
             if not implementation_steps:
                 implementation_steps = """1. 步骤一：需求分析和数据收集
    - 分析用户的具体量化交易需求
@@ -116,11 +91,91 @@ class QuantTradeService:
                 "content": "```python\n# Error generating trading strategy\n# Please try again later\n# Implementation steps were extracted successfully\n```",
                 "error": str(e),
                 "implementation_steps": implementation_steps,
-                "knowledge_base_used": "error_fallback"
+                "knowledge_base_used": "error_fallback",
+                "stage_timings": dict(graph.timings),
+                "processing_time": processing_time
             }
 
-    def _generate_default_strategy_with_steps(self, user_prompt, implementation_steps):
+    def _analyze_requirements(self, user_prompt, analysis_model):
+        """Step 1: Analyze user input to extract implementation steps"""
+        analysis_prompt = """你是一个专业的量化交易分析师。请分析用户的需求，并输出实现该量化策略所需的基本步骤。
+
+用户需求：{user_prompt}
+
+请按照以下格式输出步骤：
+1. 步骤一：具体描述
+2. 步骤二：具体描述
+3. 步骤三：具体描述
+...
+
+每个步骤应该简洁明了，专注于量化交易策略实现的关键环节。只输出步骤列表，不要添加其他解释。""".format(user_prompt=user_prompt)
+
+        ai_service_logger.info("Step 1: Analyzing user input to extract implementation steps")
+        analysis_messages = [
+            {"role": "system", "content": analysis_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
+        analysis_response = self.llm_gateway.chat(
+            analysis_model,
+            analysis_messages,
+            prompt_type='quant_analysis',
+            temperature=0.5,
+            max_tokens=1000
+        )
+
+        implementation_steps = analysis_response.choices[0].message.content
+        ai_service_logger.info(f"Extracted implementation steps: {implementation_steps[:200]}...")
+        return implementation_steps
+
+    def _lookup_knowledge_base(self, knowledge_base_name):
+        """Step 2: Get knowledge base by name"""
+        ai_service_logger.info(f"Step 2: Looking up knowledge base '{knowledge_base_name}'")
+        return self.knowledge_base_service.get_knowledge_base_by_name(knowledge_base_name)
+
+    def _generate_from_stage_results(self, user_prompt, knowledge_base_name, strategy_model, results, progress_callback=None):
+        """Step 3: Generate the strategy from the analysis and knowledge base lookup results"""
+        implementation_steps = results['analysis']
+        knowledge_base = results['kb_lookup']
+
+        if not knowledge_base:
+            ai_service_logger.warning(f"Knowledge base '{knowledge_base_name}' not found, using default approach")
+            return self._generate_default_strategy_with_steps(user_prompt, implementation_steps, strategy_model, progress_callback)
+
+        knowledge_id = knowledge_base.get('id')
+
+        # Use knowledge retrieval method to generate strategy directly
+        ai_service_logger.info("Step 3: Generating strategy using knowledge retrieval with implementation steps")
+        strategy_result = self.knowledge_base_service.generate_strategy_with_knowledge_retrieval(
+            user_prompt, knowledge_id, implementation_steps, progress_callback
+        )
+
+        if not strategy_result:
+            ai_service_logger.warning("Knowledge retrieval failed, falling back to traditional approach")
+            return self._generate_default_strategy_with_steps(user_prompt, implementation_steps, strategy_model, progress_callback)
+
+        content = strategy_result['content']
+        ai_service_logger.info(f"Successfully generated strategy using knowledge retrieval, length: {len(content)}")
+
+        return {
+            "format": "markdown",
+            "content": content,
+            "knowledge_base_used": knowledge_base_name,
+            "implementation_steps": implementation_steps,
+            "source": "knowledge_retrieval",
+            "knowledge_id": knowledge_id,
+            "model": strategy_result['model'],
+            "stage_timings": {"file_save": strategy_result['file_save_time']}
+        }
+
+    def _format_timings(self, stage_timings):
+        return ', '.join(f"{stage}={duration:.2f}s" for stage, duration in stage_timings.items())
+
+    def _generate_default_strategy_with_steps(self, user_prompt, implementation_steps, strategy_model, progress_callback=None):
         """Generate default quantitative trading strategy with implementation steps when knowledge base is not available"""
+        # The default strategy is returned inline and never saved to a file
+        if progress_callback:
+            progress_callback('file_save', 'skipped')
         default_system_prompt = """你是一个专业的量化交易策略开发专家。请为用户生成完整的量化交易策略Python代码。
 
 用户需求：{user_prompt}
@@ -143,16 +198,19 @@ class QuantTradeService:
                 {"role": "user", "content": user_prompt}
             ]
 
-            response = self.client.chat.completions.create(
-                model=strategy_model,
-                messages=messages,
+            served = {'model': strategy_model}
+            response = self.llm_gateway.chat(
+                strategy_model,
+                messages,
+                prompt_type='quant_default_strategy',
+                on_model=lambda model: served.update(model=model),
                 temperature=0.7,
-                max_tokens=8192,
-                stream=False
+                max_tokens=8192
             )
 
             content = response.choices[0].message.content
-            ai_service_logger.info(f"Generated result: {content}")
+            ai_service_logger.info(f"Generated default strategy - length: {len(content or '')}")
+            ai_service_logger.debug("Generated default strategy content: %s", content)
 
             # Ensure content is in markdown format with code blocks
             if not content.strip().startswith('```python'):
@@ -164,9 +222,12 @@ class QuantTradeService:
                 "format": "markdown",
                 "content": content,
                 "knowledge_base_used": "default",
-                "implementation_steps": implementation_steps
+                "implementation_steps": implementation_steps,
+                "model": served['model']
             }
 
+        except (OverloadedError, DeadlineExceededError):
+            raise
         except Exception as e:
             ai_service_logger.error(f"Error generating default quant strategy with steps: {e}")
             return {
@@ -177,7 +238,7 @@ class QuantTradeService:
                 "knowledge_base_used": "default_error"
             }
 
-    def _generate_default_strategy(self, user_prompt):
+    def _generate_default_strategy(self, user_prompt, strategy_model):
         """Generate default quantitative trading strategy when knowledge base is not available"""
         default_system_prompt = """你是一个专业的量化交易策略开发专家。请为用户生成完整的量化交易策略Python代码。
 
@@ -197,12 +258,14 @@ class QuantTradeService:
                 {"role": "user", "content": user_prompt}
             ]
 
-            response = self.client.chat.completions.create(
-                model=strategy_model,
-                messages=messages,
+            served = {'model': strategy_model}
+            response = self.llm_gateway.chat(
+                strategy_model,
+                messages,
+                prompt_type='quant_default_strategy',
+                on_model=lambda model: served.update(model=model),
                 temperature=0.7,
-                max_tokens=8192,
-                stream=False
+                max_tokens=8192
             )
 
             content = response.choices[0].message.content
@@ -216,9 +279,12 @@ class QuantTradeService:
             return {
                 "format": "markdown",
                 "content": content,
-                "knowledge_base_used": "default"
+                "knowledge_base_used": "default",
+                "model": served['model']
             }
 
+        except (OverloadedError, DeadlineExceededError):
+            raise
         except Exception as e:
             ai_service_logger.error(f"Error generating default quant strategy: {e}")
             return {
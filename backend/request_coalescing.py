@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from logger import api_logger
+from metrics import COALESCED_REQUESTS_TOTAL
+from deadlines import remaining_time, deadline_exceeded
+
+COALESCING_ENABLED = os.getenv('COALESCING_ENABLED', 'true').lower() == 'true'
+# Completed results kept for Idempotency-Key replays
+IDEMPOTENCY_TTL = float(os.getenv('IDEMPOTENCY_TTL', '86400'))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv('IDEMPOTENCY_MAX_ENTRIES', '1000'))
+
+
+class IdempotencyKeyConflictError(ValueError):
+    """Raised when an Idempotency-Key is reused with a different request body"""
+
+
+def request_fingerprint(scope, payload):
+    """Hash of an endpoint and its canonical JSON body"""
+    raw = json.dumps([scope, payload], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Runs a function once per key while identical calls wait for its result
+
+    Callers arriving while a call for the same key is in flight block until
+    it finishes, or their own deadline passes, and get the same result, or
+    the same exception.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def do(self, key, func):
+        """Return (result, shared), shared being True for callers that joined"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                flight.waiters += 1
+
+        if not leader:
+            if not flight.done.wait(remaining_time()):
+                raise deadline_exceeded('coalesced')
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = func()
+            return flight.result, False
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._flights)
+
+
+class IdempotencyStore:
+    """Results of completed requests by Idempotency-Key, with TTL and LRU bound"""
+
+    def __init__(self, ttl=IDEMPOTENCY_TTL, max_entries=IDEMPOTENCY_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry['expires_at'] <= time.time():
+                del self._entries[key]
+                return None
+            return entry
+
+    def put(self, key, fingerprint, result, status_code):
+        with self._lock:
+            self._entries[key] = {
+                'fingerprint': fingerprint,
+                'result': result,
+                'status_code': status_code,
+                'expires_at': time.time() + self.ttl
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class RequestCoalescer:
+    """Deduplicates generation requests
+
+    Concurrent requests with the same endpoint and body share one execution.
+    Requests carrying an Idempotency-Key also have their successful result
+    stored, so a client that reconnects with the same key gets it back (or
+    joins the execution if it is still running) instead of generating again.
+    Results with an 'error' field are not stored, so such a retry runs anew.
+    """
+
+    def __init__(self):
+        self.single_flight = SingleFlight()
+        self.idempotency_store = IdempotencyStore()
+        self.stats = {'executed': 0, 'coalesced': 0, 'replayed': 0, 'conflicts': 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, scope, source):
+        with self._stats_lock:
+            self.stats[source] += 1
+        COALESCED_REQUESTS_TOTAL.inc(endpoint=scope, source=source)
+
+    def execute(self, scope, payload, func, idempotency_key=None, status_code=200):
+        """Run func() for a request, or share / replay an identical one
+
+        Returns (result, status_code, source) where source is 'executed',
+        'coalesced' or 'replayed'.
+        """
+        fingerprint = request_fingerprint(scope, payload)
+        store_key = f"{scope}:{idempotency_key}" if idempotency_key else None
+
+        if store_key:
+            entry = self.idempotency_store.get(store_key)
+            if entry is not None:
+                if entry['fingerprint'] != fingerprint:
+                    self._count(scope, 'conflicts')
+                    raise IdempotencyKeyConflictError(f"Idempotency-Key {idempotency_key} was already used with a different request")
+                self._count(scope, 'replayed')
+                api_logger.info(f"Replaying stored result - endpoint: {scope}, idempotency_key: {idempotency_key}")
+                return entry['result'], entry['status_code'], 'replayed'
+
+        if not COALESCING_ENABLED:
+            result, shared = func(), False
+        else:
+            result, shared = self.single_flight.do(fingerprint, func)
+        self._count(scope, 'coalesced' if shared else 'executed')
+        if shared:
+            api_logger.info(f"Coalesced request with an identical in-flight request - endpoint: {scope}")
+
+        if store_key and not (isinstance(result, dict) and result.get('error')):
+            self.idempotency_store.put(store_key, fingerprint, result, status_code)
+        return result, status_code, 'coalesced' if shared else 'executed'
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats.update({
+            'enabled': COALESCING_ENABLED,
+            'in_flight': self.single_flight.in_flight(),
+            'idempotency_entries': len(self.idempotency_store)
+        })
+        return stats
@@ -0,0 +1,186 @@
+import os
+import re
+import json
+import copy
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from logger import ai_service_logger
+
+
+class ResponseCache:
+    """LRU cache for processed generation results with TTL and an optional on-disk tier"""
+
+    def __init__(self, data_dir="../Data"):
+        self.enabled = os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+        self.max_entries = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '256'))
+        self.ttl = float(os.getenv('RESPONSE_CACHE_TTL', '86400'))
+        self.disk_enabled = os.getenv('RESPONSE_CACHE_DISK', 'false').lower() == 'true'
+        self.disk_dir = os.path.join(data_dir, "response_cache")
+        self.excluded_prompts = {
+            name.strip() for name in os.getenv('RESPONSE_CACHE_EXCLUDE_PROMPTS', '').split(',') if name.strip()
+        }
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'stale': 0
+        }
+
+        if self.disk_enabled:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+        ai_service_logger.info(f"ResponseCache initialized - enabled: {self.enabled}, max_entries: {self.max_entries}, ttl: {self.ttl}s, disk: {self.disk_enabled}, excluded_prompts: {sorted(self.excluded_prompts)}")
+
+    def is_cacheable(self, prompt_type):
+        """Check whether results for a prompt type may be cached"""
+        return self.enabled and (prompt_type or 'default') not in self.excluded_prompts
+
+    def make_key(self, prompt_type, model, user_input, prompt_version=None):
+        """Build a cache key from prompt type, prompt version, model and normalized user input"""
+        normalized_input = re.sub(r'\s+', ' ', user_input).strip()
+        raw_key = json.dumps([prompt_type or 'default', prompt_version, model, normalized_input], ensure_ascii=False)
+        return hashlib.sha256(raw_key.encode('utf-8')).hexdigest()
+
+    def get(self, key, is_valid=None):
+        """Return a copy of the cached result for key, or None on a miss
+
+        is_valid, when given, is called with the cached result; an entry it
+        rejects (e.g. one pointing at a deleted file) is dropped and counted
+        as a miss.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry['expires_at'] <= now:
+                del self._entries[key]
+                self.stats['expirations'] += 1
+                entry = None
+        tier = 'memory'
+        if entry is None:
+            entry = self._load_from_disk(key, now)
+            tier = 'disk'
+
+        if entry is not None and is_valid is not None and not is_valid(entry['result']):
+            self.delete(key)
+            with self._lock:
+                self.stats['stale'] += 1
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['hits'] += 1
+            self.stats[f"{tier}_hits"] += 1
+            if tier == 'disk':
+                self._store_in_memory(key, entry)
+            else:
+                self._entries.move_to_end(key)
+        return copy.deepcopy(entry['result'])
+
+    def delete(self, key):
+        """Drop one entry from memory and disk"""
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.disk_enabled:
+            try:
+                os.remove(self._disk_path(key))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                ai_service_logger.error(f"Error removing cache file for key {key}: {e}")
+
+    def put(self, key, result):
+        """Store a processed result under key"""
+        entry = {
+            'expires_at': time.time() + self.ttl,
+            'result': copy.deepcopy(result)
+        }
+        with self._lock:
+            self._store_in_memory(key, entry)
+            self.stats['stores'] += 1
+        self._save_to_disk(key, entry)
+
+    def clear(self):
+        """Drop all cached entries from memory and disk"""
+        with self._lock:
+            self._entries.clear()
+        if self.disk_enabled:
+            for filename in os.listdir(self.disk_dir):
+                if filename.endswith('.json'):
+                    try:
+                        os.remove(os.path.join(self.disk_dir, filename))
+                    except OSError as e:
+                        ai_service_logger.error(f"Error removing cache file {filename}: {e}")
+        ai_service_logger.info("Response cache cleared")
+
+    def get_stats(self):
+        """Get hit/miss counters and current cache size"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        stats['enabled'] = self.enabled
+        stats['disk_enabled'] = self.disk_enabled
+        return stats
+
+    def _store_in_memory(self, key, entry):
+        """Insert entry and evict least recently used entries (caller holds the lock)"""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _load_from_disk(self, key, now):
+        """Load an unexpired entry from the disk tier"""
+        if not self.disk_enabled:
+            return None
+
+        filepath = self._disk_path(key)
+        if not os.path.exists(filepath):
+            return None
+
+        try:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            if entry['expires_at'] > now:
+                return entry
+            os.remove(filepath)
+            with self._lock:
+                self.stats['expirations'] += 1
+        except Exception as e:
+            ai_service_logger.error(f"Error reading cache file for key {key}: {e}")
+        return None
+
+    def _save_to_disk(self, key, entry):
+        """Write entry to the disk tier atomically"""
+        if not self.disk_enabled:
+            return
+
+        filepath = self._disk_path(key)
+        # Concurrent writers of the same key, in this or another process, each use their own temp file
+        tmp_filepath = f"{filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_filepath, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_filepath, filepath)
+        except Exception as e:
+            ai_service_logger.error(f"Error writing cache file for key {key}: {e}")
+            try:
+                os.remove(tmp_filepath)
+            except OSError:
+                pass
@@ -0,0 +1,228 @@
+import os
+import json
+import time
+import uuid
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from logger import ai_service_logger
+import tracing
+
+
+class JobQueueFullError(Exception):
+    """Raised when too many strategy jobs are already pending"""
+
+
+class StrategyJobManager:
+    """Runs quant strategy generation as background jobs
+
+    Jobs are executed by a bounded worker pool and persisted as JSON under
+    ../Data/strategies/jobs, so finished results survive a restart and jobs that
+    were queued or running when the process stopped are queued again on startup.
+    Finished jobs are kept for QUANT_JOB_RETENTION_DAYS after they finish and
+    pruned on startup and on every submit.
+    """
+
+    STAGES = ['analysis', 'kb_lookup', 'generation', 'file_save']
+    TERMINAL_STATUSES = ('completed', 'failed')
+
+    def __init__(self, quant_trade_service, data_dir="../Data"):
+        self.quant_trade_service = quant_trade_service
+        self.jobs_dir = os.path.join(data_dir, "strategies", "jobs")
+        self.max_workers = int(os.getenv('QUANT_JOB_WORKERS', '2'))
+        self.max_pending = int(os.getenv('QUANT_JOB_MAX_PENDING', '50'))
+        self.retention_days = float(os.getenv('QUANT_JOB_RETENTION_DAYS', '7'))
+        os.makedirs(self.jobs_dir, exist_ok=True)
+
+        self._jobs = {}
+        self._pending = 0
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="quant-job")
+
+        with self._condition:
+            self._load_jobs()
+        ai_service_logger.info(f"StrategyJobManager initialized - workers: {self.max_workers}, max_pending: {self.max_pending}, jobs_dir: {self.jobs_dir}, loaded_jobs: {len(self._jobs)}")
+
+    def _retention_cutoff(self):
+        return (datetime.now() - timedelta(days=self.retention_days)).isoformat()
+
+    def _is_expired(self, job, cutoff):
+        return job['status'] in self.TERMINAL_STATUSES and (job.get('finished_at') or job['created_at']) < cutoff
+
+    def _load_jobs(self):
+        """Load persisted jobs, pruning expired ones and resuming unfinished ones"""
+        cutoff = self._retention_cutoff()
+        resumed = 0
+
+        for filename in os.listdir(self.jobs_dir):
+            if not filename.endswith('.json'):
+                continue
+            filepath = os.path.join(self.jobs_dir, filename)
+            try:
+                with open(filepath, 'r', encoding='utf-8') as f:
+                    job = json.load(f)
+            except Exception as e:
+                ai_service_logger.error(f"Error loading strategy job {filename}: {e}")
+                continue
+
+            if self._is_expired(job, cutoff):
+                os.remove(filepath)
+                continue
+
+            self._jobs[job['job_id']] = job
+            if job['status'] not in self.TERMINAL_STATUSES:
+                job['status'] = 'queued'
+                job['current_stage'] = None
+                self._persist(job)
+                self._enqueue(job['job_id'])
+                resumed += 1
+
+        if resumed:
+            ai_service_logger.info(f"Resumed {resumed} unfinished strategy jobs")
+
+    def submit(self, user_prompt, knowledge_base_name="quant_trade_api_doc", model_type='auto'):
+        """Create a job and queue it, returning the job snapshot"""
+        with self._condition:
+            self._prune_expired()
+            if self._pending >= self.max_pending:
+                raise JobQueueFullError(f"Too many pending strategy jobs ({self._pending})")
+
+            job_id = uuid.uuid4().hex
+            # The job's spans continue the trace of the submitting request
+            span = tracing.current_span()
+            job = {
+                'job_id': job_id,
+                'status': 'queued',
+                'params': {
+                    'prompt': user_prompt,
+                    'knowledge_base_name': knowledge_base_name,
+                    'model_type': model_type
+                },
+                'created_at': datetime.now().isoformat(),
+                'started_at': None,
+                'finished_at': None,
+                'current_stage': None,
+                'stages': {stage: {'status': 'pending'} for stage in self.STAGES},
+                'version': 0,
+                'result': None,
+                'error': None,
+                'traceparent': span.traceparent() if span else None
+            }
+            self._jobs[job_id] = job
+            self._persist(job)
+            self._enqueue(job_id)
+
+        ai_service_logger.info(f"Strategy job submitted: {job_id}, knowledge_base: {knowledge_base_name}, model_type: {model_type}")
+        return self.get_job(job_id)
+
+    def get_job(self, job_id):
+        """Get a snapshot of a job, or None if unknown"""
+        with self._condition:
+            job = self._jobs.get(job_id)
+            return json.loads(json.dumps(job)) if job else None
+
+    def wait_for_update(self, job_id, last_version, timeout=15):
+        """Block until the job changes past last_version or timeout expires
+
+        Returns the job snapshot (unchanged on timeout), or None if unknown.
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: job_id not in self._jobs or self._jobs[job_id]['version'] > last_version,
+                timeout=timeout
+            )
+        return self.get_job(job_id)
+
+    def get_stats(self):
+        """Get job counts by status"""
+        with self._condition:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job['status']] = counts.get(job['status'], 0) + 1
+            return {'jobs': counts, 'pending': self._pending, 'workers': self.max_workers}
+
+    def _prune_expired(self):
+        """Drop finished jobs past the retention period from memory and disk (caller holds the lock)"""
+        cutoff = self._retention_cutoff()
+        expired = [job_id for job_id, job in self._jobs.items() if self._is_expired(job, cutoff)]
+        for job_id in expired:
+            del self._jobs[job_id]
+            try:
+                os.remove(os.path.join(self.jobs_dir, f"{job_id}.json"))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                ai_service_logger.error(f"Error removing strategy job {job_id}: {e}")
+        if expired:
+            # Subscribers of a pruned job see it as unknown
+            self._condition.notify_all()
+            ai_service_logger.info(f"Pruned {len(expired)} expired strategy jobs")
+
+    def _enqueue(self, job_id):
+        """Hand a job to the worker pool (caller holds the lock)"""
+        self._pending += 1
+        self._executor.submit(self._run, job_id)
+
+    def _run(self, job_id):
+        """Execute the strategy pipeline for a job"""
+        start_time = time.time()
+        with self._condition:
+            self._pending -= 1
+            params = self._jobs[job_id]['params']
+            traceparent = self._jobs[job_id].get('traceparent')
+        self._update(job_id, status='running', started_at=datetime.now().isoformat())
+        span = tracing.begin_span('job.quant_strategy', traceparent=traceparent, job_id=job_id)
+
+        def on_progress(stage, status):
+            self._update_stage(job_id, stage, status)
+
+        try:
+            result = self.quant_trade_service.generate_strategy(
+                params['prompt'], params['knowledge_base_name'], params['model_type'], on_progress
+            )
+            status = 'failed' if result.get('error') else 'completed'
+            self._update(job_id, status=status, result=result, error=result.get('error'),
+                         current_stage=None, finished_at=datetime.now().isoformat())
+            span.end(error=result.get('error'))
+        except Exception as e:
+            ai_service_logger.error(f"Strategy job {job_id} failed: {e}")
+            self._update(job_id, status='failed', error=str(e),
+                         current_stage=None, finished_at=datetime.now().isoformat())
+            span.end(error=e)
+
+        processing_time = time.time() - start_time
+        ai_service_logger.info(f"Strategy job {job_id} finished - status: {self._jobs[job_id]['status']}, processing_time: {processing_time:.2f}s")
+
+    def _update_stage(self, job_id, stage, status):
+        """Record a stage transition"""
+        with self._condition:
+            job = self._jobs[job_id]
+            stage_info = job['stages'].setdefault(stage, {})
+            stage_info['status'] = status
+            stage_info[f"{status}_at"] = datetime.now().isoformat()
+            job['current_stage'] = stage if status == 'started' else job['current_stage']
+            self._touch(job)
+
+    def _update(self, job_id, **changes):
+        """Apply changes to a job, persist it and wake subscribers"""
+        with self._condition:
+            job = self._jobs[job_id]
+            job.update(changes)
+            self._touch(job)
+
+    def _touch(self, job):
+        """Bump the job version, persist it and notify waiters (caller holds the lock)"""
+        job['version'] += 1
+        self._persist(job)
+        self._condition.notify_all()
+
+    def _persist(self, job):
+        """Write a job to disk atomically"""
+        filepath = os.path.join(self.jobs_dir, f"{job['job_id']}.json")
+        tmp_filepath = f"{filepath}.tmp"
+        try:
+            with open(tmp_filepath, 'w', encoding='utf-8') as f:
+                json.dump(job, f, ensure_ascii=False)
+            os.replace(tmp_filepath, filepath)
+        except Exception as e:
+            ai_service_logger.error(f"Error saving strategy job {job['job_id']}: {e}")
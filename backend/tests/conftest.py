@@ -0,0 +1,19 @@
+import os
+import sys
+import time
+
+import pytest
+
+# Backend modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def wait_for():
+    """Poll a condition until it holds, failing the test after timeout seconds"""
+    def wait(condition, timeout=2.0):
+        deadline = time.time() + timeout
+        while not condition():
+            assert time.time() < deadline, "condition not reached"
+            time.sleep(0.005)
+    return wait
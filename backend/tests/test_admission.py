@@ -0,0 +1,69 @@
+import threading
+import time
+
+import pytest
+
+from admission import ConcurrencyLimiter, OverloadedError
+
+
+def test_full_queue_is_shed_at_once_with_429(wait_for):
+    limiter = ConcurrencyLimiter('test', limit=1, queue_size=1, queue_timeout=5)
+    acquired_at = limiter.acquire()
+    waiter = threading.Thread(target=lambda: limiter.release(limiter.acquire()))
+    waiter.start()
+    wait_for(lambda: limiter.waiting == 1)
+
+    start = time.perf_counter()
+    with pytest.raises(OverloadedError) as excinfo:
+        limiter.acquire()
+    assert time.perf_counter() - start < 0.5
+    assert excinfo.value.status_code == 429
+    assert excinfo.value.retry_after >= 1
+    assert limiter.stats['rejected_queue_full'] == 1
+
+    limiter.release(acquired_at)
+    waiter.join(2)
+    assert limiter.active == 0
+
+
+def test_queue_timeout_is_shed_with_503():
+    limiter = ConcurrencyLimiter('test', limit=1, queue_size=4, queue_timeout=0.1)
+    acquired_at = limiter.acquire()
+
+    with pytest.raises(OverloadedError) as excinfo:
+        limiter.acquire()
+    assert excinfo.value.status_code == 503
+    assert limiter.stats['rejected_timeout'] == 1
+    assert limiter.waiting == 0
+
+    limiter.release(acquired_at)
+
+
+def test_no_queue_fails_fast_without_counting_a_rejection():
+    limiter = ConcurrencyLimiter('test', limit=1, queue_size=4, queue_timeout=5)
+    with limiter.slot():
+        with pytest.raises(OverloadedError) as excinfo:
+            limiter.acquire(queue=False)
+    assert excinfo.value.status_code == 429
+    assert limiter.stats['rejected_queue_full'] == 0
+    assert limiter.stats['rejected_timeout'] == 0
+
+
+def test_queued_request_gets_the_released_slot(wait_for):
+    limiter = ConcurrencyLimiter('test', limit=1, queue_size=1, queue_timeout=2)
+    acquired_at = limiter.acquire()
+    admitted = threading.Event()
+
+    def wait_for_slot():
+        with limiter.slot():
+            admitted.set()
+
+    waiter = threading.Thread(target=wait_for_slot)
+    waiter.start()
+    wait_for(lambda: limiter.waiting == 1)
+    assert not admitted.is_set()
+
+    limiter.release(acquired_at)
+    assert admitted.wait(2)
+    waiter.join(2)
+    assert limiter.stats['queued'] == 1
@@ -0,0 +1,28 @@
+import os
+
+import httpx
+
+from cassette import CassetteTransport
+
+
+class SequenceTransport(httpx.BaseTransport):
+    """Answers each request with the next status code in the list"""
+
+    def __init__(self, status_codes):
+        self.status_codes = iter(status_codes)
+
+    def handle_request(self, request):
+        return httpx.Response(next(self.status_codes), json={'status': 'ok'}, request=request)
+
+
+def test_only_successful_responses_are_recorded(tmp_path):
+    transport = CassetteTransport(SequenceTransport([500, 429, 200]), mode='auto', cassette_dir=str(tmp_path))
+    client = httpx.Client(transport=transport)
+
+    statuses = [client.post('http://llm.test/chat/completions', json={'model': 'm'}).status_code for _ in range(4)]
+
+    # The errors pass through, the success is recorded and then replayed
+    assert statuses == [500, 429, 200, 200]
+    assert len(os.listdir(tmp_path)) == 1
+    stats = transport.get_stats()
+    assert (stats['skipped'], stats['recorded'], stats['replayed']) == (2, 1, 1)
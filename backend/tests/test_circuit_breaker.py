@@ -0,0 +1,88 @@
+import time
+
+import httpx
+import pytest
+from zai.core._errors import APIConnectionError, APIRequestFailedError, APIInternalError, APIReachLimitError, APITimeoutError
+
+import circuit_breaker
+from circuit_breaker import CircuitBreaker, CircuitBreakers, CircuitOpenError, CLOSED, OPEN, HALF_OPEN, is_model_failure
+
+
+@pytest.fixture(autouse=True)
+def fast_breaker(monkeypatch):
+    monkeypatch.setattr(circuit_breaker, 'CIRCUIT_BREAKER_ENABLED', True)
+    monkeypatch.setattr(circuit_breaker, 'CIRCUIT_MIN_CALLS', 4)
+    monkeypatch.setattr(circuit_breaker, 'CIRCUIT_ERROR_RATE', 0.5)
+    monkeypatch.setattr(circuit_breaker, 'CIRCUIT_SLOW_CALL_SECONDS', 0)
+    monkeypatch.setattr(circuit_breaker, 'CIRCUIT_OPEN_SECONDS', 0.05)
+    monkeypatch.setattr(circuit_breaker, 'CIRCUIT_HALF_OPEN_PROBES', 1)
+
+
+def _trip(breaker):
+    for ok in (True, False, False, False):
+        assert breaker.allow() == 'call'
+        breaker.record(0.1, ok)
+
+
+def test_open_half_open_closed():
+    breaker = CircuitBreaker('test-model')
+    _trip(breaker)
+    assert breaker.state == OPEN
+    assert breaker.allow() is None
+
+    time.sleep(0.06)
+    assert breaker.allow() == 'probe'
+    assert breaker.state == HALF_OPEN
+    # Only one probe at a time while half-open
+    assert breaker.allow() is None
+
+    breaker.record(0.1, True, probe=True)
+    assert breaker.state == CLOSED
+    assert breaker.allow() == 'call'
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker('test-model')
+    _trip(breaker)
+    time.sleep(0.06)
+    assert breaker.allow() == 'probe'
+
+    breaker.record(0.1, False, probe=True)
+    assert breaker.state == OPEN
+    assert breaker.allow() is None
+
+
+def test_stays_closed_below_min_calls():
+    breaker = CircuitBreaker('test-model')
+    for _ in range(3):
+        breaker.record(0.1, False)
+    assert breaker.state == CLOSED
+
+
+def test_route_falls_back_then_rejects(monkeypatch):
+    monkeypatch.setattr(circuit_breaker, 'LIGHTWEIGHT_MODEL', 'light-model')
+    breakers = CircuitBreakers()
+    _trip(breakers.breaker('main-model'))
+
+    assert breakers.route('main-model') == ('light-model', False)
+
+    _trip(breakers.breaker('light-model'))
+    with pytest.raises(CircuitOpenError) as excinfo:
+        breakers.route('main-model')
+    assert excinfo.value.status_code == 503
+    assert excinfo.value.retry_after >= 1
+
+
+def test_only_server_and_transport_errors_are_model_failures():
+    request = httpx.Request('POST', 'http://llm.test/chat/completions')
+
+    def response(status_code):
+        return httpx.Response(status_code, request=request)
+
+    assert is_model_failure(APIInternalError('boom', response=response(500)))
+    assert is_model_failure(APITimeoutError(request=request))
+    assert is_model_failure(APIConnectionError(request=request))
+    assert is_model_failure(httpx.ConnectError('refused', request=request))
+    assert not is_model_failure(APIRequestFailedError('bad request', response=response(400)))
+    assert not is_model_failure(APIReachLimitError('rate limited', response=response(429)))
+    assert not is_model_failure(ValueError('not an API error'))
@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+import compression
+from compression import precompress_file, read_text, stored_file_exists, remove_stored_file
+
+
+@pytest.fixture(autouse=True)
+def precompress_settings(monkeypatch):
+    monkeypatch.setattr(compression, 'PRECOMPRESS_ENABLED', True)
+    monkeypatch.setattr(compression, 'PRECOMPRESS_MIN_SIZE', 100)
+    monkeypatch.setattr(compression, 'PRECOMPRESS_KEEP_ORIGINAL', True)
+
+
+def _write(path, text):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return str(path)
+
+
+def test_variants_are_written_next_to_the_original(tmp_path):
+    filepath = _write(tmp_path / 'page.html', '<p>量化交易</p>\n' * 200)
+    written = precompress_file(filepath)
+
+    assert written == compression.supported_encodings()
+    for encoding in written:
+        assert os.path.exists(filepath + compression.VARIANT_SUFFIXES[encoding])
+    assert os.path.exists(filepath)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+
+def test_small_files_are_not_compressed(tmp_path):
+    filepath = _write(tmp_path / 'small.html', '<p>hi</p>')
+    assert precompress_file(filepath) == []
+    assert os.listdir(tmp_path) == ['small.html']
+
+
+def test_read_text_decompresses_when_only_variants_are_kept(tmp_path, monkeypatch):
+    monkeypatch.setattr(compression, 'PRECOMPRESS_KEEP_ORIGINAL', False)
+    text = '<p>量化交易</p>\n' * 200
+    filepath = _write(tmp_path / 'page.html', text)
+    assert precompress_file(filepath)
+
+    assert not os.path.exists(filepath)
+    assert stored_file_exists(filepath)
+    assert read_text(filepath) == text
+
+    remove_stored_file(filepath)
+    assert not stored_file_exists(filepath)
+    with pytest.raises(FileNotFoundError):
+        read_text(filepath)
@@ -0,0 +1,61 @@
+import time
+
+import httpx
+import pytest
+
+import deadlines
+from deadlines import (
+    DeadlineExceededError, deadline_scope, remaining_time, deadline_passed,
+    check_deadline, stage_timeout, cap_http_timeout, request_timeout
+)
+
+
+def test_no_deadline_outside_a_scope():
+    assert remaining_time() is None
+    assert not deadline_passed()
+    check_deadline('test')
+    assert stage_timeout(30, 'test') == 30
+    timeout = httpx.Timeout(30)
+    assert cap_http_timeout(timeout) is timeout
+
+
+def test_nested_scope_keeps_the_earlier_deadline():
+    with deadline_scope(1):
+        with deadline_scope(100):
+            assert remaining_time() <= 1
+        with deadline_scope(0.5):
+            assert remaining_time() <= 0.5
+        with deadline_scope(None):
+            assert 0.5 < remaining_time() <= 1
+    assert remaining_time() is None
+
+
+def test_passed_deadline_raises_with_the_stage():
+    with deadline_scope(0.01):
+        time.sleep(0.02)
+        assert deadline_passed()
+        with pytest.raises(DeadlineExceededError) as excinfo:
+            check_deadline('test.stage')
+        assert excinfo.value.stage == 'test.stage'
+        with pytest.raises(DeadlineExceededError):
+            stage_timeout(30, 'test.stage')
+
+
+def test_timeouts_are_capped_at_the_time_left():
+    with deadline_scope(2):
+        assert stage_timeout(30, 'test') <= 2
+        assert stage_timeout(1, 'test') == 1
+        assert stage_timeout(None, 'test') <= 2
+        capped = cap_http_timeout(httpx.Timeout(30, connect=1))
+        assert capped.read <= 2
+        assert capped.connect == 1
+
+
+def test_request_timeout_caps_and_falls_back(monkeypatch):
+    monkeypatch.setattr(deadlines, 'DEADLINE_MAX_SECONDS', 100)
+    monkeypatch.setattr(deadlines, '_defaults', {'generate': 60})
+    assert request_timeout('generate', '5') == 5
+    assert request_timeout('generate', 1000) == 100
+    assert request_timeout('generate', 'soon') == 60
+    assert request_timeout('generate', -1) == 60
+    assert request_timeout('other') is None
@@ -0,0 +1,86 @@
+import pytest
+
+from html_manager import HtmlFileIndex, HTMLManager
+
+
+def _entry(file_id, created_at, prompt_type=None, content_length=100):
+    return {
+        'file_id': file_id,
+        'filename': f"html_{file_id}.html",
+        'prompt_type': prompt_type,
+        'created_at': created_at,
+        'content_length': content_length,
+        'original_input': 'x' * 150
+    }
+
+
+@pytest.fixture
+def index():
+    index = HtmlFileIndex()
+    index.load([_entry(f"f{day:02d}", f"2025-01-{day:02d}T12:00:00", 'coding' if day % 2 else None, day * 10)
+                for day in range(1, 11)])
+    return index
+
+
+def test_pages_walk_every_file_newest_first(index):
+    seen = []
+    cursor = None
+    while True:
+        files, cursor = index.query(3, cursor)
+        assert len(files) <= 3
+        seen.extend(f['file_id'] for f in files)
+        if cursor is None:
+            break
+    assert seen == [f"f{day:02d}" for day in range(10, 0, -1)]
+
+
+def test_cursor_survives_deletes_and_new_files(index):
+    files, cursor = index.query(4)
+    assert [f['file_id'] for f in files] == ['f10', 'f09', 'f08', 'f07']
+    index.add(_entry('new', '2025-02-01T00:00:00'))
+    index.remove('f06')
+    files, _ = index.query(2, cursor)
+    assert [f['file_id'] for f in files] == ['f05', 'f04']
+
+
+def test_filters_and_preview(index):
+    files, cursor = index.query(10, prompt_type='coding', created_after='2025-01-03', created_before='2025-01-09')
+    assert [f['file_id'] for f in files] == ['f07', 'f05', 'f03']
+    assert cursor is None
+    assert files[0]['original_input'].endswith('...')
+
+    files, _ = index.query(10, min_size=40, max_size=60)
+    assert [f['file_id'] for f in files] == ['f06', 'f05', 'f04']
+
+
+@pytest.mark.parametrize('kwargs', [
+    {'limit': 0},
+    {'limit': -5},
+    {'limit': 10, 'created_after': 'notadate'},
+    {'limit': 10, 'cursor': 'not-a-cursor'},
+])
+def test_invalid_arguments_raise_value_error(index, kwargs):
+    with pytest.raises(ValueError):
+        index.query(**kwargs)
+
+
+def test_empty_manager_lists_nothing(tmp_path):
+    manager = HTMLManager(str(tmp_path / 'html_files'))
+    assert manager.get_all_html_files() == []
+    assert manager.list_html_files(limit=5) == ([], None)
+
+
+def test_manager_pages_saved_files(tmp_path):
+    manager = HTMLManager(str(tmp_path / 'html_files'))
+    saved = [manager.save_html_content(f"<html><body>page {i}</body></html>", 'coding', f"q{i}") for i in range(5)]
+    assert all(saved)
+
+    assert len(manager.get_all_html_files()) == 5
+    seen = []
+    cursor = None
+    while True:
+        files, cursor = manager.list_html_files(limit=2, cursor=cursor, fields=['file_id'])
+        seen.extend(f['file_id'] for f in files)
+        if cursor is None:
+            break
+    assert sorted(seen) == sorted(entry['file_id'] for entry in saved)
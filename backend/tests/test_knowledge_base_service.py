@@ -0,0 +1,31 @@
+import threading
+import time
+
+from knowledge_base_service import KnowledgeBaseService
+
+
+def test_concurrent_first_loads_share_one_fetch(tmp_path, monkeypatch):
+    run_dir = tmp_path / 'run'
+    run_dir.mkdir()
+    # Strategy files go to ../Data relative to the working directory
+    monkeypatch.chdir(run_dir)
+    monkeypatch.setenv('KB_REFRESH_INTERVAL', '0')
+    service = KnowledgeBaseService('test-key', 'http://llm.test/api/paas/v4')
+
+    fetches = []
+
+    def fetch():
+        fetches.append(threading.current_thread().name)
+        time.sleep(0.1)
+        return [{'id': 'kb-1', 'name': 'docs'}]
+    monkeypatch.setattr(service, '_fetch_knowledge_base_list', fetch)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(service.get_knowledge_base_by_name('docs'))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(fetches) == 1
+    assert results == [{'id': 'kb-1', 'name': 'docs'}] * 5
@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+
+from llm_gateway import LLMGateway
+from token_budget import output_budgets, TOKEN_BUDGET_MIN_SAMPLES
+
+
+class FakeCompletions:
+    """Stops with finish_reason 'length' whenever max_tokens is below limit"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.max_tokens = []
+
+    def create(self, model, messages, stream, max_tokens, **kwargs):
+        self.max_tokens.append(max_tokens)
+        finish_reason = 'length' if max_tokens < self.limit else 'stop'
+        usage = SimpleNamespace(prompt_tokens=10, completion_tokens=min(max_tokens, self.limit))
+        if stream:
+            return iter([
+                SimpleNamespace(usage=None, choices=[SimpleNamespace(finish_reason=None, delta=SimpleNamespace(content='text'))]),
+                SimpleNamespace(usage=usage, choices=[SimpleNamespace(finish_reason=finish_reason, delta=SimpleNamespace(content=''))])
+            ])
+        message = SimpleNamespace(content='text')
+        return SimpleNamespace(model=model, usage=usage, choices=[SimpleNamespace(finish_reason=finish_reason, message=message)])
+
+
+def _gateway(prompt_type, limit):
+    for _ in range(TOKEN_BUDGET_MIN_SAMPLES):
+        output_budgets.record(prompt_type, 100)
+    completions = FakeCompletions(limit)
+    client = SimpleNamespace(timeout=30, chat=SimpleNamespace(completions=completions))
+    return LLMGateway(client), completions
+
+
+def test_chat_truncated_by_learned_budget_retries_with_ceiling():
+    gateway, completions = _gateway('test_budget_retry', 4000)
+    response = gateway.chat('m', [{'role': 'user', 'content': 'hi'}], prompt_type='test_budget_retry', max_tokens=8192)
+    assert completions.max_tokens[0] < 8192
+    assert completions.max_tokens[1:] == [8192]
+    assert response.choices[0].finish_reason == 'stop'
+
+
+def test_chat_truncated_at_ceiling_is_not_retried():
+    gateway, completions = _gateway('test_budget_ceiling', 4000)
+    response = gateway.chat('m', [{'role': 'user', 'content': 'hi'}], prompt_type='test_budget_ceiling', max_tokens=300)
+    assert completions.max_tokens == [300]
+    assert response.choices[0].finish_reason == 'length'
+
+
+def test_stream_truncated_by_learned_budget_reports_it():
+    gateway, completions = _gateway('test_budget_stream', 4000)
+    truncated = []
+    deltas = list(gateway.chat_stream('m', [{'role': 'user', 'content': 'hi'}], prompt_type='test_budget_stream',
+                                      on_truncated=lambda: truncated.append(True), max_tokens=8192))
+    assert deltas == ['text']
+    assert len(completions.max_tokens) == 1
+    assert truncated == [True]
@@ -0,0 +1,23 @@
+import queue
+import logging
+import threading
+
+from logger import NonBlockingQueueHandler
+
+
+def test_records_dropped_on_a_full_queue_are_all_counted():
+    handler = NonBlockingQueueHandler(queue.Queue(1))
+    record = logging.LogRecord('test', logging.INFO, __file__, 1, 'message', None, None)
+
+    def log():
+        for _ in range(1000):
+            handler.enqueue(record)
+
+    threads = [threading.Thread(target=log) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert handler.queue.qsize() == 1
+    assert handler.dropped == 8 * 1000 - 1
@@ -0,0 +1,54 @@
+import pytest
+
+import model_router
+from model_router import ModelRouter, ModelStats
+
+
+@pytest.fixture
+def router(monkeypatch):
+    monkeypatch.setattr(model_router, 'ROUTER_MIN_SAMPLES', 3)
+    monkeypatch.setattr(model_router, 'ROUTING_QUALITY_FLOOR', 0)
+    stats = ModelStats()
+    for _ in range(3):
+        stats.record('known', 1.0)
+    return ModelRouter({'known': {'quality': 0.9, 'cost': 1.0}, 'new': {'quality': 0.9, 'cost': 1.0}},
+                       policy='min_latency', stats=stats)
+
+
+def _route(router, reserve_probe):
+    return router.route('hi', '', reserve_probe=reserve_probe)['model']
+
+
+def test_dry_run_does_not_reserve_the_probe(router):
+    assert _route(router, False) == 'new'
+    assert _route(router, False) == 'new'
+    assert _route(router, True) == 'new'
+
+
+def test_one_probe_at_a_time(router):
+    assert _route(router, True) == 'new'
+    assert _route(router, True) == 'known'
+    # A dry run sees the slot as taken as well
+    assert _route(router, False) == 'known'
+
+
+def test_unsent_probe_is_released(router):
+    assert _route(router, True) == 'new'
+    router.stats.release_probe('new')
+    assert _route(router, True) == 'new'
+
+
+def test_sent_probe_holds_the_slot_until_recorded(router):
+    assert _route(router, True) == 'new'
+    router.stats.probe_sent('new')
+    router.stats.release_probe('new')
+    assert _route(router, True) == 'known'
+
+    router.stats.record('new', 0.5)
+    assert _route(router, True) == 'new'
+
+
+def test_reservation_expires(router, monkeypatch):
+    monkeypatch.setattr(model_router, 'ROUTER_PROBE_RESERVE_SECONDS', 0)
+    assert _route(router, True) == 'new'
+    assert _route(router, True) == 'new'
@@ -0,0 +1,20 @@
+import os
+
+from prompt_service import PromptService
+
+
+def test_unreadable_prompt_keeps_the_cached_version(tmp_path, monkeypatch):
+    monkeypatch.setenv('PROMPT_RELOAD_INTERVAL', '0')
+    path = tmp_path / 'report.md'
+    path.write_text('first version', encoding='utf-8')
+    service = PromptService(str(tmp_path))
+    assert service.get_prompt_content('report') == 'first version'
+
+    # A half-written edit that is not valid UTF-8 fails to read
+    path.write_bytes(b'\xff\xfe broken')
+    os.utime(path, ns=(1, 1))
+    assert service.get_prompt_content('report') == 'first version'
+    assert 'report' in service.get_available_prompts()
+
+    path.write_text('second version', encoding='utf-8')
+    assert service.get_prompt_content('report') == 'second version'
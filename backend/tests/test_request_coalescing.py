@@ -0,0 +1,107 @@
+import os
+import threading
+
+import pytest
+
+from request_coalescing import RequestCoalescer, SingleFlight, IdempotencyKeyConflictError
+
+
+def test_followers_share_the_leader_result(wait_for):
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def leader():
+        calls.append(1)
+        release.wait(2)
+        return 'result'
+
+    threads = [threading.Thread(target=lambda: results.append(flight.do('key', leader))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    wait_for(lambda: flight._flights.get('key') is not None and flight._flights['key'].waiters == 2)
+    release.set()
+    for thread in threads:
+        thread.join(2)
+
+    assert len(calls) == 1
+    assert sorted(results) == [('result', False), ('result', True), ('result', True)]
+    assert flight.in_flight() == 0
+
+
+def test_followers_get_the_leader_exception(wait_for):
+    flight = SingleFlight()
+    release = threading.Event()
+    error = RuntimeError('upstream failed')
+    outcomes = []
+
+    def leader():
+        release.wait(2)
+        raise error
+
+    def call():
+        try:
+            flight.do('key', leader)
+        except RuntimeError as e:
+            outcomes.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    wait_for(lambda: flight._flights.get('key') is not None and flight._flights['key'].waiters == 2)
+    release.set()
+    for thread in threads:
+        thread.join(2)
+
+    assert outcomes == [error, error, error]
+    assert flight.in_flight() == 0
+
+
+def test_idempotency_key_replays_and_conflicts():
+    coalescer = RequestCoalescer()
+    calls = []
+
+    def generate():
+        calls.append(1)
+        return {'content': 'ok'}
+
+    assert coalescer.execute('generate', {'input': 'a'}, generate, 'key-1') == ({'content': 'ok'}, 200, 'executed')
+    assert coalescer.execute('generate', {'input': 'a'}, generate, 'key-1') == ({'content': 'ok'}, 200, 'replayed')
+    assert len(calls) == 1
+
+    with pytest.raises(IdempotencyKeyConflictError):
+        coalescer.execute('generate', {'input': 'b'}, generate, 'key-1')
+    assert coalescer.stats['conflicts'] == 1
+
+
+@pytest.fixture(scope='module')
+def client(tmp_path_factory):
+    # The app creates its data and log directories relative to the working directory
+    workdir = tmp_path_factory.mktemp('app') / 'run'
+    workdir.mkdir()
+    previous = os.getcwd()
+    os.chdir(workdir)
+    os.environ.setdefault('GLM_API_KEY', 'test.key')
+    try:
+        import app as app_module
+    finally:
+        os.chdir(previous)
+    return app_module, app_module.app.test_client()
+
+
+def test_reused_idempotency_key_with_a_different_body_returns_422(client, monkeypatch):
+    app_module, test_client = client
+    monkeypatch.setattr(app_module.ai_service, 'generate_content',
+                        lambda user_input, *args: {'format': 'text', 'content': f"echo {user_input}"})
+    headers = {'Idempotency-Key': 'conflict-key'}
+
+    first = test_client.post('/api/generate', json={'input': 'first'}, headers=headers)
+    assert first.status_code == 200
+    replay = test_client.post('/api/generate', json={'input': 'first'}, headers=headers)
+    assert replay.status_code == 200
+    assert replay.headers.get('Idempotent-Replayed') == 'true'
+
+    conflict = test_client.post('/api/generate', json={'input': 'second'}, headers=headers)
+    assert conflict.status_code == 422
+    assert 'Idempotency-Key' in conflict.get_json()['error']
@@ -0,0 +1,104 @@
+import os
+import time
+import threading
+
+import pytest
+
+import response_cache
+from response_cache import ResponseCache
+
+
+@pytest.fixture
+def make_cache(monkeypatch, tmp_path):
+    def make(max_entries=256, ttl=3600, disk=False):
+        monkeypatch.setenv('RESPONSE_CACHE_ENABLED', 'true')
+        monkeypatch.setenv('RESPONSE_CACHE_MAX_ENTRIES', str(max_entries))
+        monkeypatch.setenv('RESPONSE_CACHE_TTL', str(ttl))
+        monkeypatch.setenv('RESPONSE_CACHE_DISK', 'true' if disk else 'false')
+        return ResponseCache(data_dir=str(tmp_path))
+    return make
+
+
+def test_expired_entries_are_misses(make_cache):
+    cache = make_cache(ttl=0.05)
+    cache.put('key', {'content': 'a'})
+    assert cache.get('key') == {'content': 'a'}
+
+    time.sleep(0.06)
+    assert cache.get('key') is None
+    stats = cache.get_stats()
+    assert stats['expirations'] == 1
+    assert stats['entries'] == 0
+
+
+def test_least_recently_used_entry_is_evicted(make_cache):
+    cache = make_cache(max_entries=2)
+    cache.put('a', {'content': 'a'})
+    cache.put('b', {'content': 'b'})
+    # Reading a makes b the least recently used entry
+    assert cache.get('a') is not None
+    cache.put('c', {'content': 'c'})
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.get('c') is not None
+    assert cache.get_stats()['evictions'] == 1
+
+
+def test_returned_results_are_copies(make_cache):
+    cache = make_cache()
+    result = {'content': 'a', 'files': ['x.html']}
+    cache.put('key', result)
+    result['files'].append('y.html')
+    cache.get('key')['files'].append('z.html')
+    assert cache.get('key') == {'content': 'a', 'files': ['x.html']}
+
+
+def test_disk_tier_survives_a_new_instance(make_cache):
+    make_cache(disk=True).put('key', {'content': 'a'})
+
+    cache = make_cache(disk=True)
+    assert cache.get('key') == {'content': 'a'}
+    assert cache.get('key') == {'content': 'a'}
+    stats = cache.get_stats()
+    assert stats['disk_hits'] == 1
+    assert stats['memory_hits'] == 1
+
+
+def test_expired_disk_entry_is_removed(make_cache, tmp_path):
+    make_cache(ttl=0.05, disk=True).put('key', {'content': 'a'})
+    time.sleep(0.06)
+
+    cache = make_cache(ttl=0.05, disk=True)
+    assert cache.get('key') is None
+    assert not os.path.exists(os.path.join(str(tmp_path), 'response_cache', 'key.json'))
+
+
+def test_entry_rejected_by_validator_is_dropped(make_cache, tmp_path):
+    cache = make_cache(disk=True)
+    cache.put('key', {'content': 'a'})
+
+    assert cache.get('key', lambda result: False) is None
+    assert cache.get('key') is None
+    assert cache.get_stats()['stale'] == 1
+    assert os.listdir(os.path.join(str(tmp_path), 'response_cache')) == []
+
+
+def test_concurrent_writers_of_one_key_do_not_clash(make_cache, tmp_path, monkeypatch):
+    cache = make_cache(disk=True)
+    errors = []
+    monkeypatch.setattr(response_cache.ai_service_logger, 'error', errors.append)
+
+    def put(value):
+        for _ in range(50):
+            cache.put('key', {'content': value})
+
+    threads = [threading.Thread(target=put, args=(str(i),)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert os.listdir(os.path.join(str(tmp_path), 'response_cache')) == ['key.json']
+    assert make_cache(disk=True).get('key')['content'] in {'0', '1', '2', '3'}
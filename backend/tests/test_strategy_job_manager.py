@@ -0,0 +1,26 @@
+import os
+
+from strategy_job_manager import StrategyJobManager
+
+
+class FakeQuantTradeService:
+    def generate_strategy(self, user_prompt, knowledge_base_name, model_type, progress_callback):
+        progress_callback('file_save', 'skipped')
+        return {'content': user_prompt}
+
+
+def test_finished_jobs_past_retention_are_pruned_on_submit(tmp_path, monkeypatch, wait_for):
+    monkeypatch.setenv('QUANT_JOB_RETENTION_DAYS', '1')
+    manager = StrategyJobManager(FakeQuantTradeService(), data_dir=str(tmp_path))
+    jobs_dir = os.path.join(str(tmp_path), 'strategies', 'jobs')
+
+    old = manager.submit('old')['job_id']
+    wait_for(lambda: manager.get_job(old)['status'] == 'completed')
+    assert manager.get_job(old)['stages']['file_save']['status'] == 'skipped'
+    with manager._condition:
+        manager._jobs[old]['finished_at'] = '2000-01-01T00:00:00'
+
+    new = manager.submit('new')['job_id']
+    assert manager.get_job(old) is None
+    assert not os.path.exists(os.path.join(jobs_dir, f"{old}.json"))
+    assert manager.get_job(new) is not None
@@ -0,0 +1,64 @@
+import pytest
+
+import token_budget
+from token_budget import OutputBudgets, InputTooLargeError, estimator, fit_input
+
+
+@pytest.fixture(autouse=True)
+def budget_settings(monkeypatch):
+    monkeypatch.setattr(token_budget, 'TOKEN_BUDGET_ENABLED', True)
+    monkeypatch.setattr(token_budget, 'TOKEN_BUDGET_MIN_SAMPLES', 5)
+    monkeypatch.setattr(token_budget, 'TOKEN_BUDGET_PERCENTILE', 99)
+    monkeypatch.setattr(token_budget, 'TOKEN_BUDGET_HEADROOM', 1.5)
+    monkeypatch.setattr(token_budget, 'TOKEN_BUDGET_FLOOR', 100)
+
+
+def test_call_site_ceiling_until_enough_samples():
+    budgets = OutputBudgets()
+    for _ in range(4):
+        budgets.record('p', 200)
+    assert budgets.max_tokens('p', 8192) == 8192
+
+    budgets.record('p', 200)
+    assert budgets.max_tokens('p', 8192) == 300
+    # The learned budget never exceeds the call site's ceiling
+    assert budgets.max_tokens('p', 250) == 250
+
+
+def test_learned_budget_respects_floor():
+    budgets = OutputBudgets()
+    for _ in range(5):
+        budgets.record('p', 10)
+    assert budgets.max_tokens('p', 8192) == 100
+
+
+def test_truncated_completion_grows_the_budget():
+    budgets = OutputBudgets()
+    for _ in range(5):
+        budgets.record('p', 200)
+    budgets.record('p', 300, max_tokens=300, truncated=True)
+    assert budgets.max_tokens('p', 8192) == 900
+
+
+def test_fit_input_passes_short_input(monkeypatch):
+    monkeypatch.setattr(token_budget, 'INPUT_MAX_TOKENS', 50)
+    assert fit_input('short input') == 'short input'
+
+
+def test_fit_input_rejects_long_input(monkeypatch):
+    monkeypatch.setattr(token_budget, 'INPUT_MAX_TOKENS', 50)
+    monkeypatch.setattr(token_budget, 'INPUT_OVERFLOW_POLICY', 'reject')
+    with pytest.raises(InputTooLargeError) as excinfo:
+        fit_input('word ' * 200)
+    assert excinfo.value.max_tokens == 50
+    assert excinfo.value.estimated_tokens > 50
+
+
+def test_fit_input_truncates_to_the_limit(monkeypatch):
+    monkeypatch.setattr(token_budget, 'INPUT_MAX_TOKENS', 50)
+    monkeypatch.setattr(token_budget, 'INPUT_OVERFLOW_POLICY', 'truncate')
+    text = '量化交易策略' * 100
+    fitted = fit_input(text)
+    assert text.startswith(fitted)
+    assert 0 < len(fitted) < len(text)
+    assert estimator.estimate(fitted) <= 50
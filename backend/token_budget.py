@@ -0,0 +1,176 @@
+import os
+import re
+import math
+import threading
+from collections import deque
+from logger import ai_service_logger
+from metrics import percentile, LLM_OUTPUT_BUDGET_TOKENS, TOKEN_BUDGET_EVENTS_TOTAL
+
+TOKEN_BUDGET_ENABLED = os.getenv('TOKEN_BUDGET_ENABLED', 'true').lower() == 'true'
+# Learned max_tokens = observed percentile of completion tokens x headroom, within [floor, call-site ceiling]
+TOKEN_BUDGET_MIN_SAMPLES = int(os.getenv('TOKEN_BUDGET_MIN_SAMPLES', '20'))
+TOKEN_BUDGET_PERCENTILE = float(os.getenv('TOKEN_BUDGET_PERCENTILE', '99'))
+TOKEN_BUDGET_HEADROOM = float(os.getenv('TOKEN_BUDGET_HEADROOM', '1.5'))
+TOKEN_BUDGET_FLOOR = int(os.getenv('TOKEN_BUDGET_FLOOR', '512'))
+TOKEN_BUDGET_WINDOW = int(os.getenv('TOKEN_BUDGET_WINDOW', '500'))
+# Estimated token limit for user input, 0 disables; over the limit input is rejected or truncated
+INPUT_MAX_TOKENS = int(os.getenv('INPUT_MAX_TOKENS', '8000'))
+INPUT_OVERFLOW_POLICY = os.getenv('INPUT_OVERFLOW_POLICY', 'reject').lower()
+
+_CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]')
+
+# Per-message overhead of the chat template
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class InputTooLargeError(ValueError):
+    """Raised when user input exceeds INPUT_MAX_TOKENS and the policy is reject"""
+
+    def __init__(self, estimated_tokens, max_tokens):
+        super().__init__(f"Input too large: about {estimated_tokens} tokens, limit is {max_tokens}")
+        self.estimated_tokens = estimated_tokens
+        self.max_tokens = max_tokens
+
+
+class TokenEstimator:
+    """Character-based token estimate for GLM, calibrated against reported usage
+
+    CJK characters and other text tokenize very differently, so they are
+    counted separately. The correction factor is a moving average of the
+    reported prompt_tokens over the raw estimate of the same messages.
+    """
+
+    CJK_TOKENS_PER_CHAR = 0.7
+    OTHER_CHARS_PER_TOKEN = 3.5
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.correction = 1.0
+        self.calibrations = 0
+
+    def _raw(self, text):
+        cjk = len(_CJK_PATTERN.findall(text))
+        return cjk * self.CJK_TOKENS_PER_CHAR + (len(text) - cjk) / self.OTHER_CHARS_PER_TOKEN
+
+    def _raw_messages(self, messages):
+        return sum(self._raw(m.get('content') or '') + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+    def estimate(self, text):
+        return int(math.ceil(self._raw(text or '') * self.correction))
+
+    def estimate_messages(self, messages):
+        return int(math.ceil(self._raw_messages(messages) * self.correction))
+
+    def calibrate(self, messages, prompt_tokens):
+        """Fold one reported prompt_tokens value into the correction factor"""
+        raw = self._raw_messages(messages)
+        if not prompt_tokens or raw <= 0:
+            return
+        ratio = min(2.0, max(0.5, prompt_tokens / raw))
+        with self._lock:
+            self.calibrations += 1
+            # Plain average while few samples, then an exponential moving average
+            weight = max(1.0 / self.calibrations, 0.05)
+            self.correction += (ratio - self.correction) * weight
+
+
+class OutputBudgets:
+    """max_tokens per prompt_type, learned from observed completion lengths
+
+    Until TOKEN_BUDGET_MIN_SAMPLES completions have been seen for a
+    prompt_type, the call site's max_tokens is used unchanged. Completions cut
+    off by the budget (finish_reason 'length') are recorded at twice the
+    budget, so the learned limit grows back when it was too tight.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def _learned(self, key):
+        """Learned budget for a prompt_type, or None with too few samples"""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < TOKEN_BUDGET_MIN_SAMPLES:
+            return None
+        return max(TOKEN_BUDGET_FLOOR, int(percentile(samples, TOKEN_BUDGET_PERCENTILE) * TOKEN_BUDGET_HEADROOM))
+
+    def max_tokens(self, prompt_type, ceiling):
+        """max_tokens to request: the learned budget, never above the call site's ceiling"""
+        if not TOKEN_BUDGET_ENABLED:
+            return ceiling
+        learned = self._learned(prompt_type or 'default')
+        if learned is None:
+            return ceiling
+        budget = min(ceiling, learned)
+        LLM_OUTPUT_BUDGET_TOKENS.set(budget, prompt_type=prompt_type or 'default')
+        return budget
+
+    def record(self, prompt_type, completion_tokens, max_tokens=None, truncated=False):
+        if not completion_tokens:
+            return
+        key = prompt_type or 'default'
+        if truncated:
+            TOKEN_BUDGET_EVENTS_TOTAL.inc(event='output_truncated', prompt_type=key)
+            ai_service_logger.warning(f"Completion hit max_tokens - prompt_type: {key}, max_tokens: {max_tokens}, completion_tokens: {completion_tokens}")
+            completion_tokens = max(completion_tokens, max_tokens or 0) * 2
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=TOKEN_BUDGET_WINDOW)
+            samples.append(completion_tokens)
+
+    def get_stats(self):
+        with self._lock:
+            samples = {key: sorted(values) for key, values in self._samples.items()}
+        return {
+            key: {
+                'samples': len(values),
+                'p50': percentile(values, 50),
+                'p99': percentile(values, 99),
+                'learned_max_tokens': self._learned(key)
+            }
+            for key, values in samples.items()
+        }
+
+
+estimator = TokenEstimator()
+output_budgets = OutputBudgets()
+
+
+def fit_input(text, prompt_type=None):
+    """Check user input against INPUT_MAX_TOKENS before any upstream call
+
+    Returns the input unchanged when it fits, the longest prefix that fits
+    when INPUT_OVERFLOW_POLICY is truncate, and raises InputTooLargeError
+    otherwise.
+    """
+    if not INPUT_MAX_TOKENS:
+        return text
+    estimated = estimator.estimate(text)
+    if estimated <= INPUT_MAX_TOKENS:
+        return text
+
+    key = prompt_type or 'default'
+    if INPUT_OVERFLOW_POLICY != 'truncate':
+        TOKEN_BUDGET_EVENTS_TOTAL.inc(event='input_rejected', prompt_type=key)
+        ai_service_logger.warning(f"Rejecting input - prompt_type: {key}, estimated_tokens: {estimated}, limit: {INPUT_MAX_TOKENS}")
+        raise InputTooLargeError(estimated, INPUT_MAX_TOKENS)
+
+    length = int(len(text) * INPUT_MAX_TOKENS / estimated)
+    while length > 0 and estimator.estimate(text[:length]) > INPUT_MAX_TOKENS:
+        length = int(length * 0.95)
+    TOKEN_BUDGET_EVENTS_TOTAL.inc(event='input_truncated', prompt_type=key)
+    ai_service_logger.warning(f"Truncating input - prompt_type: {key}, estimated_tokens: {estimated}, limit: {INPUT_MAX_TOKENS}, kept_chars: {length} of {len(text)}")
+    return text[:length]
+
+
+def get_stats():
+    return {
+        'enabled': TOKEN_BUDGET_ENABLED,
+        'input_max_tokens': INPUT_MAX_TOKENS,
+        'input_overflow_policy': INPUT_OVERFLOW_POLICY,
+        'estimator_correction': estimator.correction,
+        'estimator_calibrations': estimator.calibrations,
+        'output_budgets': output_budgets.get_stats()
+    }
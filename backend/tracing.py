@@ -0,0 +1,309 @@
+import os
+import re
+import json
+import time
+import logging
+import queue
+import atexit
+import threading
+import contextvars
+from contextlib import contextmanager
+from logger import backend_logger, pipeline as logging_pipeline
+
+TRACING_ENABLED = os.getenv('TRACING_ENABLED', 'true').lower() == 'true'
+# none, file (OTLP JSON lines) or otlp (OTLP/HTTP JSON collector)
+TRACE_EXPORTER = os.getenv('TRACE_EXPORTER', 'none').lower()
+TRACE_EXPORT_FILE = os.getenv('TRACE_EXPORT_FILE', 'logs/traces.jsonl')
+TRACE_OTLP_ENDPOINT = os.getenv('TRACE_OTLP_ENDPOINT', 'http://127.0.0.1:4318/v1/traces')
+TRACE_EXPORT_BATCH_SIZE = int(os.getenv('TRACE_EXPORT_BATCH_SIZE', '200'))
+TRACE_EXPORT_INTERVAL = float(os.getenv('TRACE_EXPORT_INTERVAL', '2'))
+TRACE_SERVICE_NAME = os.getenv('TRACE_SERVICE_NAME', 'copychat-backend')
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+_TRACEPARENT_PATTERN = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$')
+
+
+class Span:
+    """A timed operation within a trace
+
+    Spans started while another span is current become its children. Every
+    finished span is handed to the exporter and recorded on the local trace,
+    which the request's root span uses to build the Server-Timing header.
+    """
+
+    def __init__(self, name, trace_id=None, parent_id=None, local_spans=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id or os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start_time = time.time()
+        self.end_time = None
+        self.error = None
+        # Finished spans of this trace in this process, shared by all descendants
+        self.local_spans = local_spans if local_spans is not None else []
+        self._token = None
+
+    @property
+    def duration(self):
+        return (self.end_time or time.time()) - self.start_time
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def detach(self):
+        """Stop being the current span without ending it"""
+        if self._token is not None:
+            try:
+                _current_span.reset(self._token)
+            except ValueError:
+                # Ended from a different context (e.g. when a streamed response closes)
+                pass
+            self._token = None
+
+    def end(self, error=None):
+        if self.end_time is not None:
+            return
+        self.end_time = time.time()
+        if error is not None:
+            self.error = str(error)
+        self.detach()
+        self.local_spans.append(self)
+        exporter.export(self)
+
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def server_timing(self, limit=20):
+        """Server-Timing header value: total plus time per span name within this trace"""
+        durations = {}
+        for span in list(self.local_spans):
+            if span is self:
+                continue
+            name = re.sub(r'[^A-Za-z0-9_.\-]', '_', span.name)
+            total, count = durations.get(name, (0.0, 0))
+            durations[name] = (total + span.duration, count + 1)
+
+        entries = [f"total;dur={self.duration * 1000:.1f}"]
+        for name, (total, count) in sorted(durations.items(), key=lambda item: -item[1][0])[:limit]:
+            entry = f"{name};dur={total * 1000:.1f}"
+            if count > 1:
+                entry += f';desc="x{count}"'
+            entries.append(entry)
+        return ', '.join(entries)
+
+
+class _NoopSpan:
+    """Returned when tracing is disabled"""
+
+    trace_id = None
+    span_id = None
+
+    def set_attribute(self, key, value):
+        pass
+
+    def detach(self):
+        pass
+
+    def end(self, error=None):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def current_span():
+    return _current_span.get()
+
+
+def current_trace_id():
+    span = _current_span.get()
+    return span.trace_id if span else None
+
+
+def begin_span(name, /, traceparent=None, **attributes):
+    """Start a span and make it current until span.end() is called
+
+    A W3C traceparent header value continues the caller's trace; otherwise
+    the span joins the current trace or starts a new one.
+    """
+    if not TRACING_ENABLED:
+        return NOOP_SPAN
+
+    parent = _current_span.get()
+    match = _TRACEPARENT_PATTERN.match(traceparent or '')
+    if match:
+        span = Span(name, trace_id=match.group(1), parent_id=match.group(2), attributes=attributes)
+    elif parent is not None:
+        span = Span(name, parent.trace_id, parent.span_id, parent.local_spans, attributes)
+    else:
+        span = Span(name, attributes=attributes)
+    span._token = _current_span.set(span)
+    return span
+
+
+@contextmanager
+def start_span(name, /, **attributes):
+    """Run the with-block in a child span of the current span"""
+    span = begin_span(name, **attributes)
+    try:
+        yield span
+    except BaseException as e:
+        span.end(error=e)
+        raise
+    else:
+        span.end()
+
+
+def wrap(func):
+    """Bind func to the current tracing context, for running it on a thread pool"""
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.run(func, *args, **kwargs)
+    return run
+
+
+def stream_in_context(generator):
+    """Iterate a generator in the current context, so spans it opens while a
+    response streams stay part of the request's trace"""
+    context = contextvars.copy_context()
+
+    def run():
+        while True:
+            try:
+                yield context.run(next, generator)
+            except StopIteration:
+                return
+    return run()
+
+
+class TraceContextFilter(logging.Filter):
+    """Stamp log records with the current trace id
+
+    Runs on the logging thread of the caller, before the record is queued
+    for the writer thread where the context is no longer available.
+    """
+
+    def filter(self, record):
+        span = _current_span.get()
+        record.trace_id = span.trace_id if span else '-'
+        return True
+
+
+logging_pipeline.queue_handler.addFilter(TraceContextFilter())
+
+
+def _to_otlp(spans):
+    """Build an OTLP/HTTP JSON payload for finished spans"""
+    def attribute(key, value):
+        if isinstance(value, bool):
+            return {'key': key, 'value': {'boolValue': value}}
+        if isinstance(value, int):
+            return {'key': key, 'value': {'intValue': str(value)}}
+        if isinstance(value, float):
+            return {'key': key, 'value': {'doubleValue': value}}
+        return {'key': key, 'value': {'stringValue': str(value)}}
+
+    otlp_spans = []
+    for span in spans:
+        otlp_span = {
+            'traceId': span.trace_id,
+            'spanId': span.span_id,
+            'name': span.name,
+            'kind': 1,
+            'startTimeUnixNano': str(int(span.start_time * 1e9)),
+            'endTimeUnixNano': str(int(span.end_time * 1e9)),
+            'attributes': [attribute(key, value) for key, value in span.attributes.items()],
+            'status': {'code': 2, 'message': span.error} if span.error else {'code': 1}
+        }
+        if span.parent_id:
+            otlp_span['parentSpanId'] = span.parent_id
+        otlp_spans.append(otlp_span)
+
+    return {
+        'resourceSpans': [{
+            'resource': {'attributes': [attribute('service.name', TRACE_SERVICE_NAME)]},
+            'scopeSpans': [{'scope': {'name': 'tracing'}, 'spans': otlp_spans}]
+        }]
+    }
+
+
+class SpanExporter:
+    """Batches finished spans on a background thread and ships them as OTLP JSON
+
+    'file' appends one OTLP payload per line to TRACE_EXPORT_FILE; 'otlp'
+    posts payloads to an OTLP/HTTP collector. Exporting never blocks the
+    traced request: when the queue is full spans are dropped and counted.
+    """
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.enabled = TRACING_ENABLED and mode in ('file', 'otlp')
+        self.queue = queue.Queue(maxsize=10000)
+        self.stats = {'exported': 0, 'dropped': 0, 'failed_batches': 0}
+        if self.enabled:
+            if mode == 'file':
+                os.makedirs(os.path.dirname(TRACE_EXPORT_FILE) or '.', exist_ok=True)
+            threading.Thread(target=self._export_loop, name="trace-exporter", daemon=True).start()
+            atexit.register(self.flush)
+            backend_logger.info(f"Span exporter started - mode: {mode}, target: {TRACE_EXPORT_FILE if mode == 'file' else TRACE_OTLP_ENDPOINT}")
+        elif mode not in ('none', 'file', 'otlp'):
+            backend_logger.warning(f"Unknown TRACE_EXPORTER '{mode}', spans will not be exported")
+
+    def export(self, span):
+        if not self.enabled:
+            return
+        try:
+            self.queue.put_nowait(span)
+        except queue.Full:
+            self.stats['dropped'] += 1
+
+    def flush(self):
+        """Export everything queued so far, on the calling thread"""
+        batch = []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._write(batch)
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats.update({'mode': self.mode, 'enabled': self.enabled, 'queued': self.queue.qsize()})
+        return stats
+
+    def _export_loop(self):
+        while True:
+            try:
+                batch = [self.queue.get(timeout=TRACE_EXPORT_INTERVAL)]
+            except queue.Empty:
+                continue
+            while len(batch) < TRACE_EXPORT_BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, batch):
+        try:
+            payload = _to_otlp(batch)
+            if self.mode == 'file':
+                with open(TRACE_EXPORT_FILE, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(payload, ensure_ascii=False) + '\n')
+            else:
+                # Imported here so low-level modules can import tracing without pulling in httpx
+                from http_transport import get_http_transport
+                response = get_http_transport().client.post(TRACE_OTLP_ENDPOINT, json=payload)
+                response.raise_for_status()
+            self.stats['exported'] += len(batch)
+        except Exception as e:
+            self.stats['failed_batches'] += 1
+            backend_logger.warning(f"Failed to export {len(batch)} spans: {e}")
+
+
+exporter = SpanExporter(TRACE_EXPORTER)